@@ -0,0 +1,88 @@
+-- =============================================================
+-- 008_product_ranking.sql
+-- Columnas mantenidas para ordenar /collection por "Más vendidos"
+-- y "Mejor valoración" sin agregar orders/reviews en cada request
+-- Ejecutar en Supabase SQL Editor
+-- =============================================================
+
+ALTER TABLE products
+  ADD COLUMN IF NOT EXISTS ventas      INTEGER NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS valoracion  NUMERIC(3,2),
+  ADD COLUMN IF NOT EXISTS num_resenas INTEGER NOT NULL DEFAULT 0;
+
+-- === VALORACIÓN: promedio de reseñas verificadas ===
+CREATE OR REPLACE FUNCTION refresh_product_rating(p_product_id INTEGER)
+RETURNS VOID AS $$
+  UPDATE products p
+     SET valoracion  = s.promedio,
+         num_resenas = s.total
+    FROM (
+      SELECT ROUND(AVG(estrellas)::numeric, 2) AS promedio,
+             COUNT(*)                          AS total
+        FROM reviews
+       WHERE product_id = p_product_id AND verificado = TRUE
+    ) s
+   WHERE p.id = p_product_id;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION reviews_refresh_rating()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.product_id IS NOT NULL THEN
+    PERFORM refresh_product_rating(OLD.product_id);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.product_id IS NOT NULL
+     AND (TG_OP = 'INSERT' OR NEW.product_id IS DISTINCT FROM OLD.product_id
+          OR NEW.verificado IS DISTINCT FROM OLD.verificado
+          OR NEW.estrellas IS DISTINCT FROM OLD.estrellas) THEN
+    PERFORM refresh_product_rating(NEW.product_id);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_reviews_refresh_rating ON reviews;
+CREATE TRIGGER trg_reviews_refresh_rating
+  AFTER INSERT OR UPDATE OF verificado, estrellas, product_id OR DELETE ON reviews
+  FOR EACH ROW EXECUTE FUNCTION reviews_refresh_rating();
+
+-- Backfill
+UPDATE products p
+   SET valoracion  = s.promedio,
+       num_resenas = s.total
+  FROM (
+    SELECT product_id,
+           ROUND(AVG(estrellas)::numeric, 2) AS promedio,
+           COUNT(*)                          AS total
+      FROM reviews
+     WHERE verificado = TRUE AND product_id IS NOT NULL
+     GROUP BY product_id
+  ) s
+ WHERE p.id = s.product_id;
+
+-- === VENTAS: unidades vendidas ===
+-- Los renglones de cada orden no se guardan en la DB: viajan en
+-- metadata.ventas de la preferencia de MP y el worker de webhooks
+-- (services/payment_webhooks.py) los suma cuando el pago se aprueba.
+-- p_items: [{"id": 12, "cantidad": 2}, ...]
+CREATE OR REPLACE FUNCTION incrementar_ventas(p_items JSONB)
+RETURNS VOID AS $$
+  UPDATE products p
+     SET ventas = p.ventas + i.cantidad
+    FROM (
+      SELECT (x->>'id')::INTEGER            AS id,
+             SUM((x->>'cantidad')::INTEGER) AS cantidad
+        FROM jsonb_array_elements(p_items) x
+       GROUP BY 1
+    ) i
+   WHERE p.id = i.id;
+$$ LANGUAGE sql;
+
+-- Sólo el backend (service role) cuenta ventas; con la anon key
+-- cualquiera podría inflar el orden "Más vendidos"
+REVOKE EXECUTE ON FUNCTION incrementar_ventas(JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION incrementar_ventas(JSONB) TO service_role;
+
+-- Verificar:
+-- SELECT id, nombre, ventas, valoracion, num_resenas FROM products ORDER BY ventas DESC LIMIT 10;
+-- SELECT incrementar_ventas('[{"id": 1, "cantidad": 1}]'::jsonb);
@@ -0,0 +1,200 @@
+-- =============================================================
+-- 009_analytics_rollups.sql
+-- Conteos diarios pre-agregados para /admin/analytics: el dashboard
+-- lee estas tablas en lugar de bajar cada fila de product_views y
+-- user_navigation del rango
+-- Ejecutar en Supabase SQL Editor
+-- =============================================================
+
+-- Días en UTC (igual que _parse_date_range en routes/analytics.py).
+-- Las vistas sin product_id se guardan con product_id = 0 para que
+-- el total cuadre con COUNT(*) de product_views.
+CREATE TABLE IF NOT EXISTS analytics_daily_product_views (
+  day        DATE    NOT NULL,
+  product_id INTEGER NOT NULL,
+  views      BIGINT  NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, product_id)
+);
+
+CREATE TABLE IF NOT EXISTS analytics_daily_paths (
+  day   DATE   NOT NULL,
+  path  TEXT   NOT NULL,
+  hits  BIGINT NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, path)
+);
+
+-- Ubicación de las vistas de producto ('' = desconocido)
+CREATE TABLE IF NOT EXISTS analytics_daily_locations (
+  day      DATE   NOT NULL,
+  city     TEXT   NOT NULL DEFAULT '',
+  region   TEXT   NOT NULL DEFAULT '',
+  country  TEXT   NOT NULL DEFAULT '',
+  views    BIGINT NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, city, region, country)
+);
+
+-- === Ubicación: JSON {city, region, country} o texto legado "Ciudad, Estado, País" ===
+CREATE OR REPLACE FUNCTION analytics_location_part(p_location JSONB, p_part INTEGER)
+RETURNS TEXT AS $$
+  SELECT COALESCE(NULLIF(btrim(
+    CASE jsonb_typeof(p_location)
+      WHEN 'object' THEN
+        CASE p_part
+          WHEN 1 THEN p_location->>'city'
+          WHEN 2 THEN p_location->>'region'
+          ELSE COALESCE(p_location->>'country', p_location->>'country_name')
+        END
+      WHEN 'string' THEN split_part(p_location #>> '{}', ',', p_part)
+    END
+  ), ''), '');
+$$ LANGUAGE sql IMMUTABLE;
+
+-- === Triggers por sentencia: un upsert por lote insertado ===
+-- El worker de analytics inserta en lotes (services/analytics_ingest.py),
+-- así que cada insert suma sus filas agrupadas en una sola pasada.
+CREATE OR REPLACE FUNCTION analytics_rollup_product_views()
+RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO analytics_daily_product_views (day, product_id, views)
+  SELECT ("timestamp" AT TIME ZONE 'UTC')::date, COALESCE(product_id, 0), COUNT(*)
+    FROM new_rows
+   GROUP BY 1, 2
+  ON CONFLICT (day, product_id)
+  DO UPDATE SET views = analytics_daily_product_views.views + EXCLUDED.views;
+
+  INSERT INTO analytics_daily_locations (day, city, region, country, views)
+  SELECT ("timestamp" AT TIME ZONE 'UTC')::date,
+         analytics_location_part(location, 1),
+         analytics_location_part(location, 2),
+         analytics_location_part(location, 3),
+         COUNT(*)
+    FROM new_rows
+   GROUP BY 1, 2, 3, 4
+  ON CONFLICT (day, city, region, country)
+  DO UPDATE SET views = analytics_daily_locations.views + EXCLUDED.views;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION analytics_rollup_navigation()
+RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO analytics_daily_paths (day, path, hits)
+  SELECT ("timestamp" AT TIME ZONE 'UTC')::date, path, COUNT(*)
+    FROM new_rows
+   WHERE path IS NOT NULL AND path <> ''
+   GROUP BY 1, 2
+  ON CONFLICT (day, path)
+  DO UPDATE SET hits = analytics_daily_paths.hits + EXCLUDED.hits;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_product_views_rollup ON product_views;
+CREATE TRIGGER trg_product_views_rollup
+  AFTER INSERT ON product_views
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION analytics_rollup_product_views();
+
+DROP TRIGGER IF EXISTS trg_user_navigation_rollup ON user_navigation;
+CREATE TRIGGER trg_user_navigation_rollup
+  AFTER INSERT ON user_navigation
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION analytics_rollup_navigation();
+
+-- === Backfill / reconstrucción de un rango de días [p_from, p_to] ===
+-- Borra y recalcula desde las tablas crudas. scripts/backfill_analytics_rollups.py
+-- lo llama por tramos para no chocar con el statement timeout.
+-- Los rollups se bloquean contra escritura hasta el COMMIT: un INSERT en
+-- product_views/user_navigation que ya pasó por su trigger se espera (y
+-- luego el SELECT lo cuenta una vez), y uno que llega después espera a que
+-- termine la reconstrucción y suma encima. Sin el lock, los eventos que
+-- entran entre el DELETE y el INSERT se pierden o se cuentan doble.
+-- Las lecturas del dashboard no se bloquean.
+CREATE OR REPLACE FUNCTION rebuild_analytics_rollups(p_from DATE, p_to DATE)
+RETURNS JSONB AS $$
+DECLARE
+  v_from TIMESTAMPTZ := p_from::timestamp AT TIME ZONE 'UTC';
+  v_to   TIMESTAMPTZ := (p_to + 1)::timestamp AT TIME ZONE 'UTC';
+  v_views BIGINT;
+  v_hits  BIGINT;
+BEGIN
+  LOCK TABLE analytics_daily_product_views, analytics_daily_locations, analytics_daily_paths
+    IN SHARE ROW EXCLUSIVE MODE;
+
+  DELETE FROM analytics_daily_product_views WHERE day BETWEEN p_from AND p_to;
+  DELETE FROM analytics_daily_locations     WHERE day BETWEEN p_from AND p_to;
+  DELETE FROM analytics_daily_paths         WHERE day BETWEEN p_from AND p_to;
+
+  INSERT INTO analytics_daily_product_views (day, product_id, views)
+  SELECT ("timestamp" AT TIME ZONE 'UTC')::date, COALESCE(product_id, 0), COUNT(*)
+    FROM product_views
+   WHERE "timestamp" >= v_from AND "timestamp" < v_to
+   GROUP BY 1, 2;
+  GET DIAGNOSTICS v_views = ROW_COUNT;
+
+  INSERT INTO analytics_daily_locations (day, city, region, country, views)
+  SELECT ("timestamp" AT TIME ZONE 'UTC')::date,
+         analytics_location_part(location, 1),
+         analytics_location_part(location, 2),
+         analytics_location_part(location, 3),
+         COUNT(*)
+    FROM product_views
+   WHERE "timestamp" >= v_from AND "timestamp" < v_to
+   GROUP BY 1, 2, 3, 4;
+
+  INSERT INTO analytics_daily_paths (day, path, hits)
+  SELECT ("timestamp" AT TIME ZONE 'UTC')::date, path, COUNT(*)
+    FROM user_navigation
+   WHERE "timestamp" >= v_from AND "timestamp" < v_to
+     AND path IS NOT NULL AND path <> ''
+   GROUP BY 1, 2;
+  GET DIAGNOSTICS v_hits = ROW_COUNT;
+
+  RETURN jsonb_build_object('product_rows', v_views, 'path_rows', v_hits);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Toma locks que frenan los beacons y recorre las tablas crudas: sólo el
+-- service role (scripts/backfill_analytics_rollups.py)
+REVOKE EXECUTE ON FUNCTION rebuild_analytics_rollups(DATE, DATE) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION rebuild_analytics_rollups(DATE, DATE) TO service_role;
+
+-- === Lectura: un solo JSON con los conteos del rango (NULL = sin límite) ===
+-- Se devuelve JSONB y no filas para no toparse con el max-rows de PostgREST.
+CREATE OR REPLACE FUNCTION analytics_rollup_summary(p_from DATE, p_to DATE)
+RETURNS JSONB AS $$
+  SELECT jsonb_build_object(
+    'product_views', COALESCE((
+      SELECT jsonb_object_agg(product_id, views)
+        FROM (SELECT product_id, SUM(views) AS views
+                FROM analytics_daily_product_views
+               WHERE (p_from IS NULL OR day >= p_from) AND (p_to IS NULL OR day <= p_to)
+               GROUP BY product_id) s), '{}'::jsonb),
+    'paths', COALESCE((
+      SELECT jsonb_object_agg(path, hits)
+        FROM (SELECT path, SUM(hits) AS hits
+                FROM analytics_daily_paths
+               WHERE (p_from IS NULL OR day >= p_from) AND (p_to IS NULL OR day <= p_to)
+               GROUP BY path) s), '{}'::jsonb),
+    'locations', COALESCE((
+      SELECT jsonb_agg(jsonb_build_array(city, region, country, views))
+        FROM (SELECT city, region, country, SUM(views) AS views
+                FROM analytics_daily_locations
+               WHERE (p_from IS NULL OR day >= p_from) AND (p_to IS NULL OR day <= p_to)
+               GROUP BY city, region, country) s), '[]'::jsonb)
+  );
+$$ LANGUAGE sql STABLE;
+
+-- Backfill inicial (historia completa); en tablas grandes usar el script por tramos
+SELECT rebuild_analytics_rollups(
+  COALESCE(LEAST(
+    (SELECT MIN("timestamp" AT TIME ZONE 'UTC')::date FROM product_views),
+    (SELECT MIN("timestamp" AT TIME ZONE 'UTC')::date FROM user_navigation)
+  ), CURRENT_DATE),
+  CURRENT_DATE
+);
+
+-- Verificar:
+-- SELECT day, SUM(views) FROM analytics_daily_product_views GROUP BY day ORDER BY day DESC LIMIT 7;
+-- SELECT analytics_rollup_summary(CURRENT_DATE - 30, CURRENT_DATE);
@@ -0,0 +1,118 @@
+-- =============================================================
+-- 010_analytics_sessions.sql
+-- Funnel por sesión: rollups diarios que escribe
+-- scripts/sessionize_analytics.py (services/sessionizer.py) y que
+-- lee el dashboard de /admin/analytics
+-- Ejecutar en Supabase SQL Editor
+-- =============================================================
+
+-- Lectura en orden de tiempo (keyset sobre timestamp)
+CREATE INDEX IF NOT EXISTS idx_user_navigation_timestamp ON user_navigation ("timestamp");
+CREATE INDEX IF NOT EXISTS idx_product_views_timestamp ON product_views ("timestamp");
+
+-- Día = día UTC en que empezó la sesión
+CREATE TABLE IF NOT EXISTS analytics_daily_sessions (
+  day        DATE PRIMARY KEY,
+  sessions   INTEGER NOT NULL DEFAULT 0,
+  converted  INTEGER NOT NULL DEFAULT 0,            -- con click en comprar o WhatsApp
+  ttp_sum_s  DOUBLE PRECISION NOT NULL DEFAULT 0,   -- suma de segundos inicio → primera compra
+  ttp_hist   INTEGER[] NOT NULL DEFAULT '{}'        -- buckets de sessionizer.TTP_BUCKETS
+);
+
+CREATE TABLE IF NOT EXISTS analytics_daily_funnel_steps (
+  day        DATE     NOT NULL,
+  step       SMALLINT NOT NULL,                     -- índice en FUNNEL_STAGES
+  stage      TEXT     NOT NULL,
+  sessions   INTEGER  NOT NULL DEFAULT 0,           -- sesiones que llegaron a la etapa
+  from_prev  INTEGER  NOT NULL DEFAULT 0,           -- ... después de pasar por la anterior
+  PRIMARY KEY (day, step)
+);
+
+CREATE TABLE IF NOT EXISTS analytics_daily_product_funnel (
+  day        DATE    NOT NULL,
+  product_id INTEGER NOT NULL,
+  viewed     INTEGER NOT NULL DEFAULT 0,            -- sesiones que vieron el detalle
+  converted  INTEGER NOT NULL DEFAULT 0,            -- ... y dieron click de compra en él
+  PRIMARY KEY (day, product_id)
+);
+
+-- === Escritura: reemplaza los días [p_from, p_to] en una transacción ===
+-- p_data: [{"day", "sessions", "converted", "ttp_sum_s", "ttp_hist": [..],
+--           "steps": [{"step", "stage", "sessions", "from_prev"}],
+--           "products": [[product_id, viewed, converted], ...]}, ...]
+CREATE OR REPLACE FUNCTION store_session_rollups(p_from DATE, p_to DATE, p_data JSONB)
+RETURNS VOID AS $$
+BEGIN
+  DELETE FROM analytics_daily_sessions       WHERE day BETWEEN p_from AND p_to;
+  DELETE FROM analytics_daily_funnel_steps   WHERE day BETWEEN p_from AND p_to;
+  DELETE FROM analytics_daily_product_funnel WHERE day BETWEEN p_from AND p_to;
+
+  INSERT INTO analytics_daily_sessions (day, sessions, converted, ttp_sum_s, ttp_hist)
+  SELECT (d->>'day')::date,
+         (d->>'sessions')::integer,
+         (d->>'converted')::integer,
+         (d->>'ttp_sum_s')::double precision,
+         ARRAY(SELECT jsonb_array_elements_text(d->'ttp_hist')::integer)
+    FROM jsonb_array_elements(p_data) d;
+
+  INSERT INTO analytics_daily_funnel_steps (day, step, stage, sessions, from_prev)
+  SELECT (d->>'day')::date,
+         (s->>'step')::smallint,
+         s->>'stage',
+         (s->>'sessions')::integer,
+         (s->>'from_prev')::integer
+    FROM jsonb_array_elements(p_data) d,
+         jsonb_array_elements(d->'steps') s;
+
+  INSERT INTO analytics_daily_product_funnel (day, product_id, viewed, converted)
+  SELECT (d->>'day')::date,
+         (p->>0)::integer,
+         (p->>1)::integer,
+         (p->>2)::integer
+    FROM jsonb_array_elements(p_data) d,
+         jsonb_array_elements(d->'products') p;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Borra y reemplaza días completos del funnel: sólo el service role
+-- (scripts/sessionize_analytics.py vía clients.service)
+REVOKE EXECUTE ON FUNCTION store_session_rollups(DATE, DATE, JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION store_session_rollups(DATE, DATE, JSONB) TO service_role;
+
+-- === Lectura: resumen del rango en un solo JSON (NULL = sin límite) ===
+CREATE OR REPLACE FUNCTION analytics_session_summary(p_from DATE, p_to DATE, p_products INTEGER DEFAULT 20)
+RETURNS JSONB AS $$
+  SELECT jsonb_build_object(
+    'sessions',  COALESCE(SUM(sessions), 0),
+    'converted', COALESCE(SUM(converted), 0),
+    'ttp_sum_s', COALESCE(SUM(ttp_sum_s), 0),
+    'ttp_hist', COALESCE((
+      SELECT jsonb_agg(total ORDER BY i)
+        FROM (SELECT h.i, SUM(h.v) AS total
+                FROM analytics_daily_sessions x,
+                     unnest(x.ttp_hist) WITH ORDINALITY AS h(v, i)
+               WHERE (p_from IS NULL OR x.day >= p_from) AND (p_to IS NULL OR x.day <= p_to)
+               GROUP BY h.i) b), '[]'::jsonb),
+    'steps', COALESCE((
+      SELECT jsonb_agg(jsonb_build_object('step', step, 'stage', stage,
+                                          'sessions', sessions, 'from_prev', from_prev) ORDER BY step)
+        FROM (SELECT step, MAX(stage) AS stage, SUM(sessions) AS sessions, SUM(from_prev) AS from_prev
+                FROM analytics_daily_funnel_steps
+               WHERE (p_from IS NULL OR day >= p_from) AND (p_to IS NULL OR day <= p_to)
+               GROUP BY step) f), '[]'::jsonb),
+    'products', COALESCE((
+      SELECT jsonb_agg(jsonb_build_array(product_id, viewed, converted) ORDER BY viewed - converted DESC)
+        FROM (SELECT product_id, SUM(viewed) AS viewed, SUM(converted) AS converted
+                FROM analytics_daily_product_funnel
+               WHERE (p_from IS NULL OR day >= p_from) AND (p_to IS NULL OR day <= p_to)
+               GROUP BY product_id
+               ORDER BY SUM(viewed) - SUM(converted) DESC
+               LIMIT p_products) p), '[]'::jsonb)
+  )
+  FROM analytics_daily_sessions
+  WHERE (p_from IS NULL OR day >= p_from) AND (p_to IS NULL OR day <= p_to);
+$$ LANGUAGE sql STABLE;
+
+-- Verificar:
+-- SELECT * FROM analytics_daily_sessions ORDER BY day DESC LIMIT 7;
+-- SELECT analytics_session_summary(CURRENT_DATE - 30, CURRENT_DATE);
@@ -0,0 +1,83 @@
+-- =============================================================
+-- 011_review_stats.sql
+-- Estadísticas de reseñas verificadas materializadas (total, suma
+-- de estrellas e histograma 1–5) por producto y globales, para que
+-- /api/reviews/stats lea una sola fila
+-- Ejecutar en Supabase SQL Editor
+-- =============================================================
+
+-- product_id = 0 → todas las reseñas verificadas (incluye las sin producto)
+CREATE TABLE IF NOT EXISTS review_stats (
+  product_id INTEGER PRIMARY KEY,
+  total      INTEGER NOT NULL DEFAULT 0,
+  suma       INTEGER NOT NULL DEFAULT 0,
+  s1         INTEGER NOT NULL DEFAULT 0,
+  s2         INTEGER NOT NULL DEFAULT 0,
+  s3         INTEGER NOT NULL DEFAULT 0,
+  s4         INTEGER NOT NULL DEFAULT 0,
+  s5         INTEGER NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Suma (p_sign = 1) o resta (p_sign = -1) una reseña verificada
+CREATE OR REPLACE FUNCTION review_stats_apply(p_product_id INTEGER, p_estrellas INTEGER, p_sign INTEGER)
+RETURNS VOID AS $$
+  INSERT INTO review_stats AS rs (product_id, total, suma, s1, s2, s3, s4, s5)
+  SELECT k, p_sign, p_sign * p_estrellas,
+         CASE WHEN p_estrellas = 1 THEN p_sign ELSE 0 END,
+         CASE WHEN p_estrellas = 2 THEN p_sign ELSE 0 END,
+         CASE WHEN p_estrellas = 3 THEN p_sign ELSE 0 END,
+         CASE WHEN p_estrellas = 4 THEN p_sign ELSE 0 END,
+         CASE WHEN p_estrellas = 5 THEN p_sign ELSE 0 END
+    FROM unnest(ARRAY[0] || CASE WHEN p_product_id IS NULL THEN '{}'::integer[] ELSE ARRAY[p_product_id] END) k
+  ON CONFLICT (product_id) DO UPDATE
+     SET total = rs.total + EXCLUDED.total,
+         suma  = rs.suma  + EXCLUDED.suma,
+         s1    = rs.s1    + EXCLUDED.s1,
+         s2    = rs.s2    + EXCLUDED.s2,
+         s3    = rs.s3    + EXCLUDED.s3,
+         s4    = rs.s4    + EXCLUDED.s4,
+         s5    = rs.s5    + EXCLUDED.s5,
+         updated_at = NOW();
+$$ LANGUAGE sql;
+
+-- Aprobar / rechazar / eliminar (y el insert con auto-aprobación) mueven
+-- la reseña dentro o fuera de las estadísticas
+CREATE OR REPLACE FUNCTION reviews_maintain_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.verificado THEN
+    PERFORM review_stats_apply(OLD.product_id, OLD.estrellas, -1);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.verificado THEN
+    PERFORM review_stats_apply(NEW.product_id, NEW.estrellas, 1);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_reviews_maintain_stats ON reviews;
+CREATE TRIGGER trg_reviews_maintain_stats
+  AFTER INSERT OR UPDATE OF verificado, estrellas, product_id OR DELETE ON reviews
+  FOR EACH ROW EXECUTE FUNCTION reviews_maintain_stats();
+
+-- Backfill (también sirve para reconciliar a mano)
+BEGIN;
+LOCK TABLE reviews IN SHARE MODE;
+DELETE FROM review_stats;
+INSERT INTO review_stats (product_id, total, suma, s1, s2, s3, s4, s5)
+SELECT COALESCE(product_id, 0), COUNT(*), COALESCE(SUM(estrellas), 0),
+       COUNT(*) FILTER (WHERE estrellas = 1),
+       COUNT(*) FILTER (WHERE estrellas = 2),
+       COUNT(*) FILTER (WHERE estrellas = 3),
+       COUNT(*) FILTER (WHERE estrellas = 4),
+       COUNT(*) FILTER (WHERE estrellas = 5)
+  FROM reviews
+ WHERE verificado = TRUE
+ GROUP BY GROUPING SETS ((product_id), ())
+HAVING product_id IS NOT NULL OR GROUPING(product_id) = 1;
+COMMIT;
+
+-- Verificar:
+-- SELECT * FROM review_stats WHERE product_id = 0;
+-- SELECT COUNT(*), SUM(estrellas) FROM reviews WHERE verificado = TRUE;
@@ -0,0 +1,28 @@
+-- =============================================================
+-- 012_review_util_votes.sql
+-- Votos "útil" de reseñas aplicados en lote como incrementos atómicos
+-- (services/review_votes.py junta los votos y llama esta RPC)
+-- Ejecutar en Supabase SQL Editor
+-- =============================================================
+
+-- p_deltas: {"<review_id>": <votos>, ...}; cada delta entre 1 y 1000
+-- (VoteBuffer manda a lo más MAX_DELTA por reseña y flush), el resto se ignora.
+-- Devuelve el util_count resultante de cada reseña actualizada.
+CREATE OR REPLACE FUNCTION increment_review_util(p_deltas JSONB)
+RETURNS TABLE (id BIGINT, util_count INTEGER) AS $$
+  UPDATE reviews r
+     SET util_count = COALESCE(r.util_count, 0) + d.value::integer
+    FROM jsonb_each_text(p_deltas) d
+   WHERE r.id = d.key::bigint
+     AND r.verificado = TRUE
+     AND d.value::integer BETWEEN 1 AND 1000
+  RETURNING r.id, r.util_count;
+$$ LANGUAGE sql;
+
+-- Sólo el backend: con la anon key cualquiera sumaría votos sin pasar por
+-- el dedup por sesión/IP de VoteBuffer
+REVOKE EXECUTE ON FUNCTION increment_review_util(JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION increment_review_util(JSONB) TO service_role;
+
+-- Verificar:
+-- SELECT * FROM increment_review_util('{"1": 1}'::jsonb);
@@ -0,0 +1,30 @@
+-- =============================================================
+-- 013_review_media.sql
+-- Variantes optimizadas de la media de reseñas: miniaturas/pósters
+-- junto a media_urls y estado del procesamiento en segundo plano
+-- (services/review_media.py)
+-- Ejecutar en Supabase SQL Editor
+-- =============================================================
+
+-- media_thumbs[i] es la miniatura (foto) o el póster (video) de
+-- media_urls[i]; '' si no hay (video sin ffmpeg, reseñas anteriores)
+ALTER TABLE reviews ADD COLUMN IF NOT EXISTS media_thumbs TEXT[] NOT NULL DEFAULT '{}';
+
+-- 'pending' mientras el worker procesa los archivos subidos,
+-- 'failed' si se agotaron los reintentos (los archivos quedan en el spool)
+ALTER TABLE reviews ADD COLUMN IF NOT EXISTS media_status TEXT NOT NULL DEFAULT 'ready';
+
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'reviews_media_status_check') THEN
+    ALTER TABLE reviews ADD CONSTRAINT reviews_media_status_check
+      CHECK (media_status IN ('pending', 'ready', 'failed'));
+  END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_reviews_media_pending
+  ON reviews(id) WHERE media_status <> 'ready';
+
+-- Verificar:
+-- SELECT media_status, COUNT(*) FROM reviews GROUP BY media_status;
+-- SELECT id, media_urls, media_thumbs FROM reviews WHERE media_urls <> '{}' ORDER BY id DESC LIMIT 5;
@@ -0,0 +1,91 @@
+-- =============================================================
+-- 014_rate_limits.sql
+-- Contadores de rate limit compartidos entre workers/reinicios
+-- (services/rate_limit.py con RATE_LIMIT_BACKEND=supabase)
+-- Ejecutar en Supabase SQL Editor. La app llama rate_limit_hit con
+-- SUPABASE_SERVICE_KEY; la anon key no tiene acceso
+-- =============================================================
+
+-- Una fila por clave ("reviews.post:<ip>", "coupons.validate:<ip>"):
+-- eventos de la ventana fija actual y de la anterior
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_counters (
+  key          TEXT PRIMARY KEY,
+  window_start TIMESTAMP WITH TIME ZONE NOT NULL,
+  prev_count   INTEGER NOT NULL DEFAULT 0,
+  curr_count   INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_rate_limit_counters_window
+  ON rate_limit_counters(window_start);
+
+REVOKE ALL ON rate_limit_counters FROM anon, authenticated;
+
+-- Ventana deslizante aproximada: curr + prev * (parte de la ventana
+-- anterior que todavía cae dentro de los últimos p_window segundos).
+-- Sólo cuenta los eventos permitidos; con p_consume = FALSE sólo
+-- consulta si cabría uno más (_Limiter.check).
+-- Devuelve {"allowed": bool, "retry_after": segundos}
+DROP FUNCTION IF EXISTS rate_limit_hit(TEXT, INTEGER, INTEGER);
+CREATE OR REPLACE FUNCTION rate_limit_hit(p_key TEXT, p_limit INTEGER, p_window INTEGER,
+                                          p_consume BOOLEAN DEFAULT TRUE)
+RETURNS JSONB AS $$
+DECLARE
+  v_now     TIMESTAMPTZ := clock_timestamp();
+  v_len     INTERVAL := make_interval(secs => p_window);
+  v_start   TIMESTAMPTZ := to_timestamp(floor(extract(epoch FROM v_now) / p_window) * p_window);
+  v_elapsed DOUBLE PRECISION := extract(epoch FROM v_now - v_start) / p_window;
+  r         rate_limit_counters%ROWTYPE;
+  v_est     DOUBLE PRECISION;
+  v_retry   DOUBLE PRECISION;
+BEGIN
+  INSERT INTO rate_limit_counters (key, window_start)
+  VALUES (p_key, v_start)
+  ON CONFLICT (key) DO NOTHING;
+
+  SELECT * INTO r FROM rate_limit_counters WHERE key = p_key FOR UPDATE;
+
+  IF r.window_start < v_start THEN
+    r.prev_count := CASE WHEN r.window_start = v_start - v_len THEN r.curr_count ELSE 0 END;
+    r.curr_count := 0;
+    r.window_start := v_start;
+  END IF;
+
+  v_est := r.curr_count + r.prev_count * (1 - v_elapsed);
+
+  IF v_est + 1 > p_limit THEN
+    IF r.curr_count + 1 > p_limit OR r.prev_count = 0 THEN
+      v_retry := (1 - v_elapsed) * p_window;                  -- hasta la siguiente ventana
+    ELSE
+      -- hasta que el peso de la ventana anterior baje lo suficiente
+      v_retry := ((1 - (p_limit - r.curr_count - 1)::double precision / r.prev_count) - v_elapsed) * p_window;
+    END IF;
+    UPDATE rate_limit_counters
+       SET window_start = r.window_start, prev_count = r.prev_count, curr_count = r.curr_count
+     WHERE key = p_key;
+    RETURN jsonb_build_object('allowed', FALSE, 'retry_after', GREATEST(1, ceil(v_retry))::int);
+  END IF;
+
+  UPDATE rate_limit_counters
+     SET window_start = r.window_start, prev_count = r.prev_count,
+         curr_count = r.curr_count + CASE WHEN p_consume THEN 1 ELSE 0 END
+   WHERE key = p_key;
+
+  -- Limpieza ocasional de claves inactivas
+  IF random() < 0.01 THEN
+    DELETE FROM rate_limit_counters WHERE window_start < v_now - interval '2 days';
+  END IF;
+
+  RETURN jsonb_build_object('allowed', TRUE, 'retry_after', 0);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Con la anon key cualquiera podría gastar el cupo de otra IP
+REVOKE EXECUTE ON FUNCTION rate_limit_hit(TEXT, INTEGER, INTEGER, BOOLEAN)
+  FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION rate_limit_hit(TEXT, INTEGER, INTEGER, BOOLEAN) TO service_role;
+
+-- Verificar:
+-- SELECT rate_limit_hit('test:1', 2, 60); -- allowed true, true, luego false
+-- SELECT rate_limit_hit('test:1', 2, 60, FALSE); -- consulta sin contar
+-- SELECT * FROM rate_limit_counters WHERE key LIKE 'test:%';
+-- DELETE FROM rate_limit_counters WHERE key LIKE 'test:%';
@@ -0,0 +1,37 @@
+-- =============================================================
+-- 015_order_listing.sql
+-- Listado admin de órdenes paginado en el servidor: índices para
+-- orden/keyset y filtros, y conteos por estado en una consulta
+-- agrupada (services/order_listing.py)
+-- Ejecutar en Supabase SQL Editor
+-- =============================================================
+
+CREATE INDEX IF NOT EXISTS idx_orders_fecha_pedido_id
+  ON orders(fecha_pedido DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_orders_estado_pago
+  ON orders(estado_pago);
+CREATE INDEX IF NOT EXISTS idx_orders_estado_envio
+  ON orders(estado_envio);
+
+-- Conteo por (estado_pago, estado_envio) con los mismos filtros del
+-- listado; NULL en un parámetro = sin filtro. Las tarjetas de KPIs se
+-- arman en Python a partir de estas filas.
+CREATE OR REPLACE FUNCTION order_status_counts(
+  p_start        TIMESTAMPTZ DEFAULT NULL,
+  p_end          TIMESTAMPTZ DEFAULT NULL,
+  p_estado_pago  TEXT DEFAULT NULL,
+  p_estado_envio TEXT DEFAULT NULL
+)
+RETURNS TABLE (estado_pago TEXT, estado_envio TEXT, n BIGINT) AS $$
+  SELECT o.estado_pago::text, o.estado_envio::text, COUNT(*)
+    FROM orders o
+   WHERE (p_start IS NULL OR o.fecha_pedido >= p_start)
+     AND (p_end IS NULL OR o.fecha_pedido <= p_end)
+     AND (p_estado_pago IS NULL OR o.estado_pago = p_estado_pago)
+     AND (p_estado_envio IS NULL OR o.estado_envio = p_estado_envio)
+   GROUP BY 1, 2;
+$$ LANGUAGE sql STABLE;
+
+-- Verificar:
+-- SELECT * FROM order_status_counts();
+-- SELECT * FROM order_status_counts('2025-01-01', NULL, 'pending', NULL);
@@ -0,0 +1,123 @@
+-- =============================================================
+-- 016_order_status_counters.sql
+-- Contadores de órdenes por (estado_pago, estado_envio) mantenidos
+-- por trigger, para que las tarjetas del admin lean unas cuantas filas
+-- en vez de contar orders (services/order_listing.py)
+-- Ejecutar en Supabase SQL Editor. Sólo service_role escribe los
+-- contadores o reconcilia; la anon key sólo los lee
+-- =============================================================
+
+-- '' representa NULL (p. ej. órdenes sin estado_envio todavía)
+CREATE TABLE IF NOT EXISTS order_status_counters (
+  estado_pago  TEXT NOT NULL,
+  estado_envio TEXT NOT NULL,
+  n            BIGINT NOT NULL DEFAULT 0,
+  updated_at   TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  PRIMARY KEY (estado_pago, estado_envio)
+);
+
+CREATE OR REPLACE FUNCTION order_status_counters_apply(p_pago TEXT, p_envio TEXT, p_delta INTEGER)
+RETURNS VOID AS $$
+  INSERT INTO order_status_counters AS c (estado_pago, estado_envio, n)
+  VALUES (COALESCE(p_pago, ''), COALESCE(p_envio, ''), p_delta)
+  ON CONFLICT (estado_pago, estado_envio) DO UPDATE
+     SET n = c.n + EXCLUDED.n,
+         updated_at = NOW();
+$$ LANGUAGE sql;
+
+-- Cualquier escritor de orders (admin, webhooks de MercadoPago, checkout)
+-- mueve la orden de celda en la misma transacción que su UPDATE
+CREATE OR REPLACE FUNCTION orders_maintain_status_counters()
+RETURNS TRIGGER AS $$
+DECLARE
+  v_old TEXT[];
+  v_new TEXT[];
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    v_old := ARRAY[COALESCE(OLD.estado_pago::text, ''), COALESCE(OLD.estado_envio::text, '')];
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    v_new := ARRAY[COALESCE(NEW.estado_pago::text, ''), COALESCE(NEW.estado_envio::text, '')];
+  END IF;
+  IF v_old = v_new THEN
+    RETURN NULL;
+  END IF;
+
+  -- Siempre en el mismo orden de llave para no cruzar locks entre
+  -- transacciones que mueven órdenes en sentidos opuestos
+  IF v_new IS NULL OR (v_old IS NOT NULL AND v_old < v_new) THEN
+    PERFORM order_status_counters_apply(v_old[1], v_old[2], -1);
+    IF v_new IS NOT NULL THEN
+      PERFORM order_status_counters_apply(v_new[1], v_new[2], 1);
+    END IF;
+  ELSE
+    PERFORM order_status_counters_apply(v_new[1], v_new[2], 1);
+    IF v_old IS NOT NULL THEN
+      PERFORM order_status_counters_apply(v_old[1], v_old[2], -1);
+    END IF;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- El trigger corre como dueño de la función (SECURITY DEFINER), así que
+-- quien escribe orders con la anon key no necesita permisos sobre los
+-- contadores ni sobre order_status_counters_apply
+REVOKE INSERT, UPDATE, DELETE, TRUNCATE ON order_status_counters FROM anon, authenticated;
+REVOKE EXECUTE ON FUNCTION order_status_counters_apply(TEXT, TEXT, INTEGER)
+  FROM PUBLIC, anon, authenticated;
+
+DROP TRIGGER IF EXISTS trg_orders_maintain_status_counters ON orders;
+CREATE TRIGGER trg_orders_maintain_status_counters
+  AFTER INSERT OR UPDATE OF estado_pago, estado_envio OR DELETE ON orders
+  FOR EACH ROW EXECUTE FUNCTION orders_maintain_status_counters();
+
+-- Reconciliación (scripts/reconcile_order_counters.py): compara los
+-- contadores con un GROUP BY de orders y, con p_apply, los reemplaza.
+-- Bloquea escrituras a orders mientras corre (son milisegundos), por eso
+-- sólo la ejecuta service_role.
+-- Devuelve {"drift": [[pago, envio, contador, real], ...], "applied": bool}
+CREATE OR REPLACE FUNCTION reconcile_order_status_counters(p_apply BOOLEAN DEFAULT FALSE)
+RETURNS JSONB AS $$
+DECLARE
+  v_drift JSONB;
+BEGIN
+  LOCK TABLE orders IN SHARE MODE;
+
+  WITH actual AS (
+    SELECT COALESCE(estado_pago::text, '') AS estado_pago,
+           COALESCE(estado_envio::text, '') AS estado_envio,
+           COUNT(*) AS n
+      FROM orders
+     GROUP BY 1, 2
+  )
+  SELECT COALESCE(jsonb_agg(jsonb_build_array(
+           COALESCE(a.estado_pago, c.estado_pago), COALESCE(a.estado_envio, c.estado_envio),
+           COALESCE(c.n, 0), COALESCE(a.n, 0))), '[]'::jsonb)
+    INTO v_drift
+    FROM actual a
+    FULL JOIN order_status_counters c
+      ON c.estado_pago = a.estado_pago AND c.estado_envio = a.estado_envio
+   WHERE COALESCE(c.n, 0) <> COALESCE(a.n, 0);
+
+  IF p_apply AND v_drift <> '[]'::jsonb THEN
+    DELETE FROM order_status_counters;
+    INSERT INTO order_status_counters (estado_pago, estado_envio, n)
+    SELECT COALESCE(estado_pago::text, ''), COALESCE(estado_envio::text, ''), COUNT(*)
+      FROM orders
+     GROUP BY 1, 2;
+  END IF;
+
+  RETURN jsonb_build_object('drift', v_drift, 'applied', p_apply AND v_drift <> '[]'::jsonb);
+END;
+$$ LANGUAGE plpgsql;
+
+REVOKE EXECUTE ON FUNCTION reconcile_order_status_counters(BOOLEAN) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION reconcile_order_status_counters(BOOLEAN) TO service_role;
+
+-- Backfill inicial
+SELECT reconcile_order_status_counters(TRUE);
+
+-- Verificar:
+-- SELECT * FROM order_status_counters ORDER BY n DESC;
+-- SELECT reconcile_order_status_counters();  -- drift debe ser []
@@ -0,0 +1,109 @@
+-- =============================================================
+-- 017_bulk_order_transition.sql
+-- Transición de estado de muchas órdenes en un solo UPDATE, con su
+-- entrada en status_history (OrderAdminView.bulk_transition)
+-- Ejecutar en Supabase SQL Editor. La app llama estas funciones con
+-- SUPABASE_SERVICE_KEY (clients.service)
+-- =============================================================
+
+-- status_history se ha guardado como arreglo JSONB o como texto JSON
+-- dentro de un string JSONB (json.dumps desde Python); se normaliza
+-- a arreglo antes de agregar la entrada.
+CREATE OR REPLACE FUNCTION order_history_append(p_history JSONB, p_entry JSONB)
+RETURNS JSONB AS $$
+  SELECT CASE
+           WHEN jsonb_typeof(h) = 'array' THEN h
+           ELSE '[]'::jsonb
+         END || jsonb_build_array(p_entry)
+    FROM (
+      SELECT CASE
+               WHEN jsonb_typeof(p_history) = 'string' THEN (p_history #>> '{}')::jsonb
+               ELSE p_history
+             END AS h
+    ) s;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Mueve a p_to las órdenes de p_ids cuyo estado actual esté en p_from
+-- (la app ya validó la máquina de estados; el filtro evita pisar un
+-- cambio concurrente). p_field: 'estado' | 'estado_envio' | 'estado_pago'.
+-- Para estado_envio, NULL cuenta como 'unshipped'.
+-- Devuelve los ids actualizados.
+CREATE OR REPLACE FUNCTION bulk_order_transition(
+  p_ids   BIGINT[],
+  p_field TEXT,
+  p_from  TEXT[],
+  p_to    TEXT,
+  p_entry JSONB
+)
+RETURNS SETOF BIGINT AS $$
+BEGIN
+  IF p_field = 'estado' THEN
+    RETURN QUERY
+      UPDATE orders o
+         SET estado = p_to,
+             status_history = order_history_append(o.status_history, p_entry)
+       WHERE o.id = ANY(p_ids) AND o.estado = ANY(p_from)
+      RETURNING o.id;
+  ELSIF p_field = 'estado_envio' THEN
+    RETURN QUERY
+      UPDATE orders o
+         SET estado_envio = p_to,
+             status_history = order_history_append(o.status_history, p_entry)
+       WHERE o.id = ANY(p_ids) AND COALESCE(o.estado_envio, 'unshipped') = ANY(p_from)
+      RETURNING o.id;
+  ELSIF p_field = 'estado_pago' THEN
+    RETURN QUERY
+      UPDATE orders o
+         SET estado_pago = p_to,
+             status_history = order_history_append(o.status_history, p_entry)
+       WHERE o.id = ANY(p_ids) AND o.estado_pago = ANY(p_from)
+      RETURNING o.id;
+  ELSE
+    RAISE EXCEPTION 'campo no permitido: %', p_field;
+  END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Sólo el backend (service role) aplica transiciones: con la anon key
+-- cualquiera podría marcar órdenes como pagadas saltándose el admin
+REVOKE EXECUTE ON FUNCTION bulk_order_transition(BIGINT[], TEXT, TEXT[], TEXT, JSONB)
+  FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION bulk_order_transition(BIGINT[], TEXT, TEXT[], TEXT, JSONB)
+  TO service_role;
+
+-- direccion_completa de todas las órdenes en un solo UPDATE
+-- (OrderAdminView.update_all_direccion_completa); sólo toca las que
+-- cambian. plpgsql para que la columna se resuelva al llamarla.
+-- Devuelve cuántas órdenes se actualizaron.
+CREATE OR REPLACE FUNCTION refresh_direccion_completa()
+RETURNS INTEGER AS $$
+DECLARE
+  v_count INTEGER;
+BEGIN
+  WITH calc AS (
+    SELECT id,
+           concat_ws(', ',
+             NULLIF("dirección_envío"::text, ''),
+             NULLIF(colonia::text, ''),
+             NULLIF(ciudad::text, ''),
+             NULLIF(codigo_postal::text, ''),
+             NULLIF(estado_geografico::text, '')) AS completa
+      FROM orders
+  )
+  UPDATE orders o
+     SET direccion_completa = calc.completa
+    FROM calc
+   WHERE o.id = calc.id
+     AND o.direccion_completa IS DISTINCT FROM calc.completa;
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+  RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+REVOKE EXECUTE ON FUNCTION refresh_direccion_completa() FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION refresh_direccion_completa() TO service_role;
+
+-- Verificar:
+-- SELECT order_history_append('"[{\"a\": 1}]"'::jsonb, '{"b": 2}');  -- [{"a": 1}, {"b": 2}]
+-- SELECT * FROM bulk_order_transition(ARRAY[1]::bigint[], 'estado_envio', ARRAY['unshipped'], 'processing', '{}');
+-- SELECT refresh_direccion_completa();  -- 0 la segunda vez
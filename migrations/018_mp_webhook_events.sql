@@ -0,0 +1,38 @@
+-- =============================================================
+-- 018_mp_webhook_events.sql
+-- Registro de notificaciones de MercadoPago para descartar reintentos
+-- duplicados y retomar las pendientes tras un reinicio
+-- (services/payment_webhooks.py)
+-- Ejecutar en Supabase SQL Editor
+-- =============================================================
+
+-- event_id: id de la notificación de MP (se repite en cada reintento);
+-- status pasa de 'pending' a 'done' / 'ignored' / 'failed' al procesarse
+CREATE TABLE IF NOT EXISTS mp_webhook_events (
+  event_id     TEXT PRIMARY KEY,
+  payment_id   TEXT NOT NULL,
+  action       TEXT,
+  status       TEXT NOT NULL DEFAULT 'pending',
+  attempts     INTEGER NOT NULL DEFAULT 0,
+  last_error   TEXT,
+  received_at  TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+  processed_at TIMESTAMP WITH TIME ZONE,
+  CONSTRAINT mp_webhook_events_status_check
+    CHECK (status IN ('pending', 'done', 'ignored', 'failed'))
+);
+
+-- Los workers retoman al arrancar sólo las pendientes
+CREATE INDEX IF NOT EXISTS idx_mp_webhook_events_pending
+  ON mp_webhook_events(received_at)
+  WHERE status = 'pending';
+
+CREATE INDEX IF NOT EXISTS idx_mp_webhook_events_payment
+  ON mp_webhook_events(payment_id);
+
+-- Limpieza (ocasional, a mano o con pg_cron):
+-- DELETE FROM mp_webhook_events
+--  WHERE status <> 'pending' AND received_at < NOW() - interval '90 days';
+
+-- Verificar:
+-- SELECT status, COUNT(*) FROM mp_webhook_events GROUP BY status;
+-- SELECT * FROM mp_webhook_events WHERE status = 'failed' ORDER BY received_at DESC LIMIT 20;
@@ -0,0 +1,85 @@
+"""
+Reconstruye los rollups diarios de analytics (migración 009) a partir de
+product_views y user_navigation.
+
+Llama a la RPC rebuild_analytics_rollups por tramos de --chunk días para no
+pasarse del statement timeout de Supabase. Cada tramo borra y recalcula sus
+días, así que se puede volver a correr sin duplicar conteos. Mientras un
+tramo se reconstruye, los rollups quedan bloqueados contra escritura: los
+eventos nuevos esperan (sin perderse ni contarse doble), así que los tramos
+cortos (--chunk) mantienen esa espera en lo mínimo.
+
+Usage:
+    python scripts/backfill_analytics_rollups.py                       # toda la historia
+    python scripts/backfill_analytics_rollups.py --from 2025-01-01 --to 2025-03-31
+    python scripts/backfill_analytics_rollups.py --days 7 --chunk 1
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+from supabase import create_client
+
+
+def _parse_day(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def first_day(sb):
+    """Día UTC del evento más antiguo entre ambas tablas (hoy si no hay)."""
+    days = []
+    for table in ("product_views", "user_navigation"):
+        r = sb.table(table).select("timestamp").order("timestamp").limit(1).execute()
+        if r.data:
+            ts = datetime.fromisoformat(r.data[0]["timestamp"].replace("Z", "+00:00"))
+            days.append(ts.astimezone(timezone.utc).date())
+    return min(days) if days else datetime.now(timezone.utc).date()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconstruye los rollups diarios de analytics")
+    parser.add_argument("--from", dest="day_from", type=_parse_day, help="primer día (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="day_to", type=_parse_day, help="último día, inclusive (default: hoy)")
+    parser.add_argument("--days", type=int, help="sólo los últimos N días")
+    parser.add_argument("--chunk", type=int, default=31, help="días por llamada (default: 31)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    url = os.environ.get("SUPABASE_URL")
+    # rebuild_analytics_rollups sólo la ejecuta service_role (migración 009)
+    key = os.environ.get("SUPABASE_SERVICE_KEY")
+    if not url or not key:
+        print("ERROR: SUPABASE_URL o SUPABASE_SERVICE_KEY no configurados")
+        sys.exit(1)
+    sb = create_client(url, key)
+
+    today = datetime.now(timezone.utc).date()
+    day_to = args.day_to or today
+    if args.days:
+        day_from = day_to - timedelta(days=args.days - 1)
+    else:
+        day_from = args.day_from or first_day(sb)
+    if day_from > day_to:
+        print(f"ERROR: rango vacío ({day_from} > {day_to})")
+        sys.exit(1)
+
+    print(f"Reconstruyendo rollups {day_from} → {day_to} en tramos de {args.chunk} días")
+    start = day_from
+    while start <= day_to:
+        end = min(start + timedelta(days=args.chunk - 1), day_to)
+        r = sb.rpc("rebuild_analytics_rollups", {
+            "p_from": start.isoformat(),
+            "p_to": end.isoformat(),
+        }).execute()
+        stats = r.data or {}
+        print(f"  {start} → {end}: {stats.get('product_rows', 0)} filas producto/día, "
+              f"{stats.get('path_rows', 0)} filas path/día")
+        start = end + timedelta(days=1)
+    print("Listo.")
+
+
+if __name__ == "__main__":
+    main()
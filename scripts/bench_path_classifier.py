@@ -0,0 +1,144 @@
+"""
+Micro-benchmark del clasificador de paths del funnel de analytics
+(valac_jewelry/services/path_classifier.py) contra los escaneos con
+startswith por etapa que hacía AnalyticsAdmin.index.
+
+Genera N paths sintéticos con una mezcla parecida al tráfico real (home,
+colección con querystrings, detalle de producto, clicks de compra y de
+WhatsApp, ruido) y mide:
+
+  scans        una pasada startswith por etapa + loops de buy/WhatsApp
+  trie         PathClassifier sin caché (un recorrido del trie por evento)
+  trie+lru     PathClassifier con su LRU, evento por evento
+  agg+trie     Counter de paths y luego un tally por path distinto
+               (lo que hace el dashboard sobre rollups o el escaneo)
+
+y verifica que todos den los mismos conteos.
+
+Usage:
+    python scripts/bench_path_classifier.py
+    python scripts/bench_path_classifier.py --paths 1000000 --products 2000 --seed 7
+"""
+
+import argparse
+import importlib.util
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _load_classifier_module():
+    # Se carga por ruta para no importar la app Flask (valac_jewelry/__init__.py)
+    path = os.path.join(ROOT, "valac_jewelry", "services", "path_classifier.py")
+    spec = importlib.util.spec_from_file_location("path_classifier", path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module  # dataclasses resuelve anotaciones vía sys.modules
+    spec.loader.exec_module(module)
+    return module
+
+
+def synthetic_paths(n, products, rng):
+    categories = ["anillos", "aretes", "pulsos", "cadenas", "dijes"]
+    makers = [
+        (30, lambda: "/"),
+        (20, lambda: "/collection"),
+        (10, lambda: f"/collection?category={rng.choice(categories)}&page={rng.randint(1, 9)}"),
+        (25, lambda: f"/producto/{rng.randint(1, products)}"),
+        (5, lambda: f"/buy-click/{rng.randint(1, products)}"),
+        (4, lambda: f"/wa-click/product_{rng.randint(1, products)}"),
+        (1, lambda: rng.choice(["/wa-click/header", "/wa-click/footer", "/wa-click/product_x"])),
+        (5, lambda: rng.choice(["/cart", "/contact", "/anillos-compromiso", "/checkout", "/favicon.ico"])),
+    ]
+    weights = [w for w, _ in makers]
+    fns = [f for _, f in makers]
+    return [rng.choices(fns, weights)[0]() for _ in range(n)]
+
+
+def by_scans(mod, paths):
+    """Lo que hacía AnalyticsAdmin.index: una pasada por etapa y por KPI."""
+    path_counts = Counter(paths)
+    funnel = {}
+    for stage in mod.FUNNEL_STAGES:
+        if "path" in stage:
+            funnel[stage["name"]] = path_counts.get(stage["path"], 0)
+        else:
+            pref = stage["path_prefix"]
+            funnel[stage["name"]] = sum(1 for p in paths if p and p.startswith(pref))
+    buy = sum(1 for p in paths if p and p.startswith("/buy-click/"))
+    wa_clicks = [p for p in paths if p and p.startswith("/wa-click/")]
+    wa_per_product = Counter()
+    for p in wa_clicks:
+        tag = p.replace("/wa-click/", "")
+        if tag.startswith("product_"):
+            try:
+                wa_per_product[int(tag.replace("product_", ""))] += 1
+            except ValueError:
+                pass
+    return funnel, buy, len(wa_clicks), wa_per_product
+
+
+def _classifier(mod, cache_size):
+    classifier = mod.PathClassifier(mod.analytics_rules(), cache_size=cache_size)
+    if cache_size == 0:
+        classifier.classify = classifier._classify
+    return classifier
+
+
+def _result(mod, tally):
+    funnel = {stage["name"]: tally.counts[stage["name"]] for stage in mod.FUNNEL_STAGES}
+    return funnel, tally.counts["buy_click"], tally.counts["wa_click"], tally.captures.get("wa_product", Counter())
+
+
+def by_classifier(mod, paths, cache_size):
+    tally = mod.PathTally(_classifier(mod, cache_size))
+    add = tally.add
+    for p in paths:
+        add(p)
+    return _result(mod, tally)
+
+
+def by_aggregate(mod, paths):
+    return _result(mod, mod.PathTally(_classifier(mod, 0)).update(Counter(paths)))
+
+
+def timed(label, fn, n):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<10} {elapsed * 1000:9.1f} ms   {elapsed / n * 1e9:7.0f} ns/path")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del clasificador de paths del funnel")
+    parser.add_argument("--paths", type=int, default=1_000_000)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    mod = _load_classifier_module()
+    rng = random.Random(args.seed)
+    print(f"Generando {args.paths:,} paths sintéticos ({args.products} productos)...")
+    paths = synthetic_paths(args.paths, args.products, rng)
+    print(f"  {len(set(paths)):,} paths distintos\n")
+
+    expected = timed("scans", lambda: by_scans(mod, paths), len(paths))
+    trie = timed("trie", lambda: by_classifier(mod, paths, 0), len(paths))
+    cached = timed("trie+lru", lambda: by_classifier(mod, paths, 65536), len(paths))
+    agg = timed("agg+trie", lambda: by_aggregate(mod, paths), len(paths))
+
+    ok = expected == trie == cached == agg
+    print(f"\nConteos idénticos: {'sí' if ok else 'NO'}")
+    if not ok:
+        for label, got in (("trie", trie), ("trie+lru", cached), ("agg+trie", agg)):
+            if got != expected:
+                print(f"  {label}: {got[:3]} vs {expected[:3]}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
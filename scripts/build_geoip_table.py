@@ -0,0 +1,127 @@
+"""
+Genera la tabla binaria de geolocalización local (GEOIP_DB_PATH) a partir
+de un CSV de rangos IPv4. Formato de salida: ver valac_jewelry/services/geoip.py.
+
+Formatos soportados:
+  dbip         DB-IP "IP to City Lite" (https://db-ip.com/db/lite.php)
+               ip_start, ip_end, continent, country, stateprov, city, latitude, longitude
+  ip2location  IP2Location LITE DB5 (https://lite.ip2location.com)
+               ip_from, ip_to, country_code, country_name, region_name, city_name, latitude, longitude
+
+Usage:
+    python scripts/build_geoip_table.py dbip-city-lite-2025-01.csv instance/geoip.bin
+    python scripts/build_geoip_table.py IP2LOCATION-LITE-DB5.CSV instance/geoip.bin --format ip2location
+"""
+
+import argparse
+import csv
+import ipaddress
+import json
+import os
+import struct
+import sys
+
+MAGIC = b"VGEOIP01"  # debe coincidir con services/geoip.py
+
+
+def _ipv4_int(value):
+    """Acepta '1.2.3.4' o el entero decimal de IP2Location; None si es IPv6."""
+    value = value.strip()
+    if value.isdigit():
+        n = int(value)
+        return n if n <= 0xFFFFFFFF else None
+    try:
+        addr = ipaddress.ip_address(value)
+    except ValueError:
+        return None
+    return int(addr) if addr.version == 4 else None
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def read_rows(path, fmt):
+    """Genera (start, end, location_dict) para los rangos IPv4 del CSV."""
+    with open(path, newline="", encoding="utf-8") as fh:
+        for row in csv.reader(fh):
+            if len(row) < 8:
+                continue
+            start, end = _ipv4_int(row[0]), _ipv4_int(row[1])
+            if start is None or end is None:
+                continue
+            if fmt == "dbip":
+                _, _, _, code, region, city, lat, lon = row[:8]
+                country = code
+            else:
+                _, _, code, country, region, city, lat, lon = row[:8]
+            if code in ("-", "ZZ", ""):
+                continue
+            yield start, end, {
+                "city": city or None,
+                "region": region or None,
+                "region_code": None,
+                "country": country or None,
+                "country_code": code or None,
+                "postal": None,
+                "latitude": _float(lat),
+                "longitude": _float(lon),
+                "timezone": None,
+            }
+
+
+def build(rows, out_path):
+    starts, ends, loc_idx = [], [], []
+    locations, index = [], {}
+    last_end = -1
+    for start, end, loc in sorted(rows, key=lambda r: r[0]):
+        if start <= last_end:  # rangos solapados: se queda el primero
+            continue
+        key = json.dumps(loc, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        if key not in index:
+            index[key] = len(locations)
+            locations.append(key.encode("utf-8"))
+        starts.append(start)
+        ends.append(end)
+        loc_idx.append(index[key])
+        last_end = end
+
+    offsets, pos = [], 0
+    for blob in locations:
+        offsets.append(pos)
+        pos += len(blob)
+    offsets.append(pos)
+
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    tmp = out_path + ".tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(struct.pack("<8sII", MAGIC, len(starts), len(locations)))
+        for arr in (starts, ends, loc_idx, offsets):
+            fh.write(struct.pack(f"<{len(arr)}I", *arr))
+        for blob in locations:
+            fh.write(blob)
+    os.replace(tmp, out_path)
+    return len(starts), len(locations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera la tabla GeoIP local")
+    parser.add_argument("csv_path")
+    parser.add_argument("out_path")
+    parser.add_argument("--format", choices=("dbip", "ip2location"), default="dbip")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.csv_path):
+        print(f"ERROR: no existe {args.csv_path}")
+        sys.exit(1)
+
+    ranges, locs = build(read_rows(args.csv_path, args.format), args.out_path)
+    size = os.path.getsize(args.out_path)
+    print(f"{ranges} rangos IPv4, {locs} ubicaciones distintas → {args.out_path} ({size / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Reconciliación de order_status_counters (migración 016) contra orders.
+
+El trigger de orders mantiene los contadores por (estado_pago,
+estado_envio); esto los compara con un GROUP BY de orders y muestra las
+celdas que no coinciden. Con --apply los reemplaza por el conteo real.
+Pensado para un cron diario o para correr tras cambios manuales de
+esquema/datos (p. ej. deshabilitar el trigger en una carga masiva).
+
+Usage:
+    python scripts/reconcile_order_counters.py            # sólo reporta
+    python scripts/reconcile_order_counters.py --apply
+"""
+
+import argparse
+import os
+import sys
+
+from dotenv import load_dotenv
+from supabase import create_client
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconciliar contadores de estado de órdenes")
+    parser.add_argument("--apply", action="store_true", help="reemplazar los contadores si hay diferencias")
+    args = parser.parse_args()
+
+    load_dotenv()
+    url = os.environ.get("SUPABASE_URL")
+    # reconcile_order_status_counters sólo la ejecuta service_role (migración 016)
+    key = os.environ.get("SUPABASE_SERVICE_KEY")
+    if not url or not key:
+        print("ERROR: SUPABASE_URL o SUPABASE_SERVICE_KEY no configurados")
+        sys.exit(1)
+    sb = create_client(url, key)
+
+    result = sb.rpc("reconcile_order_status_counters", {"p_apply": args.apply}).execute().data or {}
+    drift = result.get("drift") or []
+    if not drift:
+        print("Contadores al día.")
+        return
+
+    print(f"{len(drift)} celda(s) con diferencia:")
+    for pago, envio, counter, actual in drift:
+        print(f"  {pago or '(vacío)':<14} {envio or '(vacío)':<12} contador={counter:<6} real={actual}")
+    if result.get("applied"):
+        print("Contadores reemplazados.")
+    else:
+        print("Sin cambios (usa --apply para corregir).")
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
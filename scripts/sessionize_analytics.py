@@ -0,0 +1,76 @@
+"""
+Calcula los rollups del funnel por sesión (migración 010) a partir de
+user_navigation: sesiones, conversión paso a paso, tiempo a compra y
+abandono por producto. Ver valac_jewelry/services/sessionizer.py.
+
+Cada corrida reemplaza los días pedidos (UTC, por día de inicio de la
+sesión), así que se puede repetir. Pensado para un cron diario después de
+medianoche UTC (default: ayer); para rehacer historia usar --from/--to.
+
+Usage:
+    python scripts/sessionize_analytics.py                      # ayer
+    python scripts/sessionize_analytics.py --days 30
+    python scripts/sessionize_analytics.py --from 2025-01-01 --to 2025-01-31 --chunk 7
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+from valac_jewelry.services.analytics_sessions import run_sessionization
+from valac_jewelry.services.supabase_clients import clients
+
+
+def _parse_day(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rollups del funnel por sesión")
+    parser.add_argument("--from", dest="day_from", type=_parse_day, help="primer día (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="day_to", type=_parse_day, help="último día, inclusive (default: ayer)")
+    parser.add_argument("--days", type=int, help="los últimos N días hasta --to")
+    parser.add_argument("--chunk", type=int, default=7, help="días por lectura/escritura (default: 7)")
+    parser.add_argument("--page-size", type=int, default=1000, help="filas por página (≤ max-rows de PostgREST)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    url = os.environ.get("SUPABASE_URL")
+    # store_session_rollups sólo la ejecuta service_role (migración 010)
+    key = os.environ.get("SUPABASE_SERVICE_KEY")
+    if not url or not key:
+        print("ERROR: SUPABASE_URL o SUPABASE_SERVICE_KEY no configurados")
+        sys.exit(1)
+    clients.configure(url, os.environ.get("SUPABASE_KEY"), key)
+    sb = clients.service
+
+    day_to = args.day_to or datetime.now(timezone.utc).date() - timedelta(days=1)
+    if args.days:
+        day_from = day_to - timedelta(days=args.days - 1)
+    else:
+        day_from = args.day_from or day_to
+    if day_from > day_to:
+        print(f"ERROR: rango vacío ({day_from} > {day_to})")
+        sys.exit(1)
+
+    start = day_from
+    while start <= day_to:
+        end = min(start + timedelta(days=args.chunk - 1), day_to)
+        t0 = time.perf_counter()
+        days = run_sessionization(sb, start, end, page_size=args.page_size)
+        sessions = sum(s.sessions for s in days.values())
+        converted = sum(s.converted for s in days.values())
+        print(f"  {start} → {end}: {sessions} sesiones, {converted} con compra "
+              f"({time.perf_counter() - t0:.1f}s)")
+        start = end + timedelta(days=1)
+    print("Listo.")
+
+
+if __name__ == "__main__":
+    main()
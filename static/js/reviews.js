@@ -13,6 +13,7 @@
   let currentStars = null;
   let currentMedia = false;
   let hasMore = false;
+  let nextCursor = null;    // "cargar más" sigue desde la última reseña (sin count)
   let mode = "home";        // home | page | product
   let productId = null;
   let productName = "";
@@ -122,10 +123,13 @@
   function loadReviews(reset) {
     if (reset) {
       currentPage = 1;
+      nextCursor = null;
       $("#reviews-grid").empty();
     }
 
-    let params = { page: currentPage, per_page: 9 };
+    let params = { per_page: 9 };
+    if (currentPage > 1 && nextCursor) params.cursor = nextCursor;
+    else params.page = currentPage;
     if (productId) params.product_id = productId;
     if (currentStars) params.estrellas = currentStars;
     if (currentMedia) params.con_media = "1";
@@ -135,6 +139,7 @@
       const grid = document.getElementById("reviews-grid");
       const reviews = data.reviews || [];
       hasMore = data.has_more;
+      nextCursor = data.next_cursor || null;
 
       if (reviews.length === 0 && currentPage === 1) {
         $("#reviews-empty").removeClass("hidden");
@@ -220,13 +225,17 @@
     let mediaHtml = "";
     if (r.media_urls && r.media_urls.length > 0) {
       mediaHtml = '<div class="review-media-grid">';
+      const thumbs = r.media_thumbs || [];
       r.media_urls.forEach(function (url, idx) {
         const isVideo = /\.(mp4|mov)$/i.test(url);
+        const thumb = thumbs[idx] || "";
         const clickAttr = 'onclick="window.ValacReviews.openLightbox(' + JSON.stringify(r.media_urls) + ',' + idx + ')"';
         if (isVideo) {
-          mediaHtml += '<div class="review-video-thumb" ' + clickAttr + '><i class="fas fa-play"></i></div>';
+          // Póster generado al procesar el video (si hubo ffmpeg)
+          const posterStyle = thumb ? ' style="background:url(\'' + escHtml(thumb) + '\') center/cover"' : '';
+          mediaHtml += '<div class="review-video-thumb"' + posterStyle + ' ' + clickAttr + '><i class="fas fa-play"></i></div>';
         } else {
-          mediaHtml += '<img src="' + escHtml(url) + '" class="review-media-thumb" ' + clickAttr + ' alt="Foto de reseña" loading="lazy">';
+          mediaHtml += '<img src="' + escHtml(thumb || url) + '" class="review-media-thumb" ' + clickAttr + ' alt="Foto de reseña" loading="lazy">';
         }
       });
       mediaHtml += '</div>';
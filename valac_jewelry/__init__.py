@@ -3,7 +3,6 @@ import logging
 import mimetypes
 from flask import Flask, request, redirect
 from flask_admin import Admin
-from supabase import create_client
 from dotenv import load_dotenv
 from flask_login import LoginManager
 
@@ -41,9 +40,34 @@ def create_app():
     app.logger.debug("FLASK_ENV: %s", os.getenv("FLASK_ENV"))
     app.logger.debug("SIMULAR_PAGO: %s", app.config.get("SIMULAR_PAGO"))
     
-    supabase_url = app.config.get("SUPABASE_URL")
-    supabase_key = app.config.get("SUPABASE_KEY")
-    app.supabase = create_client(supabase_url, supabase_key)
+    # Clientes Supabase compartidos (anon = app.supabase, service para Storage)
+    from .services.supabase_clients import clients
+    clients.init_app(app)
+
+    # Beacons de analytics: cola + worker con inserts en lote
+    from .services.analytics_ingest import ingest
+    from .services import geolocation
+    geolocation.init_app(app)
+    ingest.init_app(app, locate=geolocation.lookup_location)
+
+    # Rate limits (reseñas, cupones, beacons)
+    from .services import rate_limit
+    rate_limit.init_app(app)
+
+    # Votos "útil" de reseñas: buffer en memoria + incrementos en lote
+    from .services.review_votes import votes
+    votes.init_app(app)
+
+    # Media de reseñas: spool local + worker (EXIF, WebP, transcodificación)
+    from .services.review_media import media
+    media.init_app(app)
+
+    # Webhooks de MercadoPago: dedup + workers con reintentos
+    from .services.payment_webhooks import payment_webhooks
+    payment_webhooks.init_app(app)
+
+    from .services.catalog_cache import catalog
+    catalog.ttl = app.config.get("CATALOG_CACHE_TTL", 300)
     
     @app.context_processor
     def inject_supabase_storage_url():
@@ -53,23 +77,13 @@ def create_app():
             META_PIXEL_ID=app.config.get("META_PIXEL_ID"),  # META PIXEL
         )
 
+    from .services.promo_settings import get_promo_context, promo_cache
+    promo_cache.ttl = app.config.get("PROMO_CACHE_TTL", 60)
+
     @app.context_processor
     def inject_promo_settings():
-        """Load promo banner/section settings for all templates."""
-        import json as _json
-        try:
-            resp = app.supabase.table("site_settings").select("key, value").like("key", "promo_%").execute()
-            promo = {r["key"]: r["value"] for r in (resp.data or [])}
-        except Exception:
-            promo = {}
-        # Banner messages
-        promo_msgs = None
-        if promo.get("promo_banner_active") == "true":
-            try:
-                promo_msgs = _json.loads(promo.get("promo_banner_messages", "[]"))
-            except (_json.JSONDecodeError, TypeError):
-                promo_msgs = None
-        return dict(promo=promo, promo_msgs=promo_msgs)
+        """Load promo banner/section settings for all templates (cached)."""
+        return get_promo_context(app.supabase)
     
     login_manager = LoginManager()
     login_manager.init_app(app)
@@ -136,6 +150,7 @@ def create_app():
     from .routes.admin_reviews import ReviewsAdminView
     from .routes.admin_promo import PromoAdminView
     from .routes.analytics import AnalyticsAdmin
+    from .routes.admin_metrics import MetricsAdminView
     admin.add_view(SupabaseProductAdmin(name='Productos Supabase', endpoint='supabase_products'))
     admin.add_view(BulkUploadAdminView(name='Carga Masiva', endpoint='bulk_upload'))
     # Mantén el endpoint "admin_orders" para la vista de órdenes
@@ -147,6 +162,7 @@ def create_app():
     admin.add_view(CouponsAdminView(name='Cupones', endpoint='admin_coupons'))
     admin.add_view(ReviewsAdminView(name='Reseñas', endpoint='admin_reviews'))
     admin.add_view(PromoAdminView(name='Promociones', endpoint='admin_promo'))
+    admin.add_view(MetricsAdminView(name='Métricas', endpoint='admin_metrics', url='metrics'))
 
     # Reseñas de clientes (API + página /reseñas)
     from .routes.reviews import reviews_bp
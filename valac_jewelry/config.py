@@ -4,6 +4,67 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY')
     SUPABASE_URL = os.environ.get('SUPABASE_URL')
     SUPABASE_KEY = os.environ.get('SUPABASE_KEY')
+    SUPABASE_SERVICE_KEY = os.environ.get('SUPABASE_SERVICE_KEY')
+    # Ingesta de beacons de analytics (services/analytics_ingest.py)
+    ANALYTICS_QUEUE_SIZE = int(os.environ.get('ANALYTICS_QUEUE_SIZE', '5000'))
+    ANALYTICS_BATCH_SIZE = int(os.environ.get('ANALYTICS_BATCH_SIZE', '200'))
+    ANALYTICS_FLUSH_MS = int(os.environ.get('ANALYTICS_FLUSH_MS', '2000'))
+    # Dashboard: 'rollup' (migración 009, cae a 'scan' si falta) o 'scan' (lectura
+    # paginada de las tablas crudas; la página no debe pasar el max-rows de PostgREST)
+    ANALYTICS_SOURCE = os.environ.get('ANALYTICS_SOURCE', 'rollup')
+    ANALYTICS_SCAN_PAGE_SIZE = int(os.environ.get('ANALYTICS_SCAN_PAGE_SIZE', '1000'))
+
+    # Votos "útil" de reseñas (services/review_votes.py): cada cuánto se
+    # aplican a la DB y cuánto se recuerda cada IP que ya votó una reseña
+    REVIEW_VOTES_FLUSH_MS = int(os.environ.get('REVIEW_VOTES_FLUSH_MS', '2000'))
+    REVIEW_VOTES_DEDUP_TTL = int(os.environ.get('REVIEW_VOTES_DEDUP_TTL', '86400'))
+    REVIEW_VOTES_DEDUP_SIZE = int(os.environ.get('REVIEW_VOTES_DEDUP_SIZE', '100000'))
+    # Media de reseñas (services/review_media.py): directorio local donde el
+    # POST deja los archivos para el worker; ffmpeg opcional para videos
+    REVIEW_MEDIA_SPOOL = os.environ.get('REVIEW_MEDIA_SPOOL', 'instance/review_media')
+    REVIEW_MEDIA_FFMPEG = os.environ.get('REVIEW_MEDIA_FFMPEG')  # default: ffmpeg del PATH
+    REVIEW_MEDIA_QUEUE_SIZE = int(os.environ.get('REVIEW_MEDIA_QUEUE_SIZE', '200'))
+
+    # Rate limits por IP (services/rate_limit.py). 'memory' = por proceso;
+    # 'supabase' comparte reseñas/cupones entre workers (migración 014)
+    RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+    # Proxies propios delante de gunicorn: la IP de la clave es la que agregó
+    # el último de ellos a X-Forwarded-For (0 = usar remote_addr)
+    RATE_LIMIT_TRUSTED_PROXIES = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', '1'))
+    RATE_LIMIT_REVIEWS_PER_DAY = int(os.environ.get('RATE_LIMIT_REVIEWS_PER_DAY', '3'))
+    RATE_LIMIT_COUPON_CHECKS = int(os.environ.get('RATE_LIMIT_COUPON_CHECKS', '20'))
+    RATE_LIMIT_COUPON_WINDOW = int(os.environ.get('RATE_LIMIT_COUPON_WINDOW', '600'))  # segundos
+    RATE_LIMIT_BEACONS_PER_SEC = float(os.environ.get('RATE_LIMIT_BEACONS_PER_SEC', '5'))
+    RATE_LIMIT_BEACONS_BURST = int(os.environ.get('RATE_LIMIT_BEACONS_BURST', '100'))
+
+    # Webhooks de MercadoPago (services/payment_webhooks.py): workers que
+    # consultan el pago y actualizan la orden fuera del request (migración 018)
+    # Clave secreta de webhooks del panel de MP (Tus integraciones → Webhooks).
+    # Si está definida se rechazan (401) las notificaciones sin firma x-signature
+    # válida; si no, se aceptan sin verificar
+    MP_WEBHOOK_SECRET = os.environ.get('MP_WEBHOOK_SECRET')
+    MP_WEBHOOK_WORKERS = int(os.environ.get('MP_WEBHOOK_WORKERS', '2'))
+    MP_WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('MP_WEBHOOK_MAX_ATTEMPTS', '6'))
+    MP_WEBHOOK_QUEUE_SIZE = int(os.environ.get('MP_WEBHOOK_QUEUE_SIZE', '1000'))
+    MP_WEBHOOK_DEDUP_TTL = int(os.environ.get('MP_WEBHOOK_DEDUP_TTL', '86400'))
+
+    # Geolocalización local (scripts/build_geoip_table.py); ruta relativa a la raíz del repo
+    GEOIP_DB_PATH = os.environ.get('GEOIP_DB_PATH', 'instance/geoip.bin')
+    GEOIP_CACHE_SIZE = int(os.environ.get('GEOIP_CACHE_SIZE', '65536'))
+    # Sin tabla, ipapi.co por IP (hasta 2.5 s cada una, en serie en el worker
+    # de ingesta); apagado por defecto: la ubicación queda vacía
+    GEOIP_REMOTE_FALLBACK = os.environ.get('GEOIP_REMOTE_FALLBACK', 'False').lower() == 'true'
+
+    # Pool HTTP de los clientes Supabase (ver services/supabase_transport.py).
+    # Con --threads 4 bastan pocas conexiones; las métricas en /admin/metrics
+    # muestran si hay espera de pool.
+    SUPABASE_POOL_SIZE = int(os.environ.get('SUPABASE_POOL_SIZE', '10'))
+    SUPABASE_POOL_KEEPALIVE = int(os.environ.get('SUPABASE_POOL_KEEPALIVE', '10'))
+    SUPABASE_TIMEOUT = float(os.environ.get('SUPABASE_TIMEOUT', '30'))  # read/write
+    SUPABASE_CONNECT_TIMEOUT = float(os.environ.get('SUPABASE_CONNECT_TIMEOUT', '5'))
+    SUPABASE_POOL_TIMEOUT = float(os.environ.get('SUPABASE_POOL_TIMEOUT', '5'))
+    SUPABASE_READ_RETRIES = int(os.environ.get('SUPABASE_READ_RETRIES', '2'))
+    SUPABASE_HTTP2 = os.environ.get('SUPABASE_HTTP2', 'True').lower() == 'true'
     SUPABASE_STORAGE_URL = os.environ.get('SUPABASE_STORAGE_URL')
     CDN_BASE_URL = os.environ.get('CDN_BASE_URL') or os.environ.get('SUPABASE_STORAGE_URL')
     MP_MAX_INSTALLMENTS = os.environ.get('MP_MAX_INSTALLMENTS')
@@ -38,6 +99,11 @@ class Config:
     GEMINI_IMAGEN_MODEL = os.environ.get('GEMINI_IMAGEN_MODEL', 'imagen-4.0-fast-generate-001')
     GEMINI_FLASH_MODEL = os.environ.get('GEMINI_FLASH_MODEL', 'gemini-2.5-flash-image')
 
+    # Snapshot en memoria del catálogo (segundos antes de recargar desde Supabase)
+    CATALOG_CACHE_TTL = int(os.environ.get('CATALOG_CACHE_TTL', '300'))
+    # Settings promo_* del context processor (segundos)
+    PROMO_CACHE_TTL = int(os.environ.get('PROMO_CACHE_TTL', '60'))
+
 class DevelopmentConfig(Config):
     DEBUG = True
 
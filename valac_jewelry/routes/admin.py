@@ -43,12 +43,8 @@ from flask_login import current_user
 
 # Si tienes otras vistas admin en este paquete
 from .admin_bulk_upload import BulkUploadAdminView  # noqa: F401  (referenciado por tu aplicación)
-
-# Supabase client (v2)
-try:
-    from supabase import create_client as sb_create_client  # type: ignore
-except Exception:  # pragma: no cover
-    sb_create_client = None
+from ..services.catalog_cache import invalidate_catalog
+from ..services.supabase_clients import clients as sb_clients
 
 
 # ============================================================
@@ -140,28 +136,10 @@ class SupabaseProductAdmin(BaseView):
     # ---------------------------
     def _get_service_supabase(self):
         """
-        Devuelve un cliente Supabase usando SERVICE KEY si está disponible.
+        Devuelve el cliente Supabase con SERVICE KEY del registro compartido.
         Si no hay SERVICE KEY, cae en la anon key (no recomendado) y loguea warning.
-        Se cachea en current_app para no recrearlo.
         """
-        url = _get_cfg("SUPABASE_URL")
-        service_key = _get_cfg("SUPABASE_SERVICE_KEY")
-        anon_key = _get_cfg("SUPABASE_KEY")
-        key = service_key or anon_key
-
-        if not url or not key:
-            raise RuntimeError("Config de Supabase incompleta (SUPABASE_URL / SUPABASE_KEY).")
-
-        if not service_key:
-            current_app.logger.warning(
-                "[storage_upload] SUPABASE_SERVICE_KEY no configurado; usando anon key (no recomendado)."
-            )
-
-        if not hasattr(current_app, "_sb_service_client"):
-            if sb_create_client is None:
-                raise RuntimeError("supabase.create_client no disponible; instala supabase>=2.x")
-            current_app._sb_service_client = sb_create_client(url, key)
-        return getattr(current_app, "_sb_service_client")
+        return sb_clients.service
 
     @property
     def app_sb(self):
@@ -391,6 +369,7 @@ class SupabaseProductAdmin(BaseView):
                 current_app.logger.error(f"[update_stock] Error Supabase: {response}")
                 _error("Ocurrió un error al actualizar el stock. Revisa los logs.")
             else:
+                invalidate_catalog()
                 _success("Stock actualizado correctamente")
 
         except Exception:  # pragma: no cover
@@ -414,6 +393,7 @@ class SupabaseProductAdmin(BaseView):
 
             new_val = not bool(current.data[0].get("destacado"))
             sb.table("products").update({"destacado": new_val}).eq("id", product_id).execute()
+            invalidate_catalog()
             _success(f"Producto {'destacado' if new_val else 'sin destacar'}")
         except Exception:
             current_app.logger.exception("[toggle_destacado] Error")
@@ -441,6 +421,7 @@ class SupabaseProductAdmin(BaseView):
                 return redirect(url_for("supabase_products.index"))
 
             sb.table("products").update({"activo": not is_active}).eq("id", product_id).execute()
+            invalidate_catalog()
             _success(f"Producto {'activado' if not is_active else 'desactivado'}")
         except Exception:
             current_app.logger.exception("[toggle_estado] Error")
@@ -588,6 +569,7 @@ class SupabaseProductAdmin(BaseView):
                     "message": "Error al actualizar en la base de datos"
                 }), 500
 
+            invalidate_catalog()
             updated_product = upd_response.data[0]
             response_field = field
 
@@ -634,6 +616,7 @@ class SupabaseProductAdmin(BaseView):
                     }
                 ).eq("id", pid).execute()
 
+        invalidate_catalog()
         _success(f"Descuento {pct}% aplicado a {len(ids)} producto(s).")
         return redirect(url_for(".index"))
 
@@ -650,6 +633,7 @@ class SupabaseProductAdmin(BaseView):
                 }
             ).eq("id", pid).execute()
 
+        invalidate_catalog()
         _info(f"Descuentos eliminados de {len(ids)} producto(s).")
         return redirect(url_for(".index"))
 
@@ -679,6 +663,7 @@ class SupabaseProductAdmin(BaseView):
             sb.table("products").update({"activo": True}).eq("id", pid).execute()
             activated += 1
 
+        invalidate_catalog()
         msg = f"{activated} producto(s) activado(s)."
         if skipped:
             msg += f" {skipped} omitido(s) (sin imagen)."
@@ -701,6 +686,7 @@ class SupabaseProductAdmin(BaseView):
             sb.table("products").update({"activo": False}).eq("id", pid).execute()
             deactivated += 1
 
+        invalidate_catalog()
         _success(f"{deactivated} producto(s) desactivado(s).")
         return redirect(url_for(".index"))
 
@@ -773,6 +759,7 @@ class SupabaseProductAdmin(BaseView):
                         "Excepción insertando imagen múltiple %s para producto %s: %s", url, producto_id, ex
                     )
 
+            invalidate_catalog()
             _success("Producto agregado exitosamente con imágenes.")
             return redirect(url_for(".index"))
 
@@ -794,6 +781,7 @@ class SupabaseProductAdmin(BaseView):
 
             # Producto
             response = sb.table("products").delete().eq("id", product_id).execute()
+            invalidate_catalog()
 
             if not response.data:
                 _error("Error al eliminar el producto.")
@@ -902,6 +890,7 @@ class SupabaseProductAdmin(BaseView):
                     for i, url in enumerate(nuevas_imagenes, start=1)
                 ]
                 ins = sb.table("product_images").insert(payload_imgs).execute()
+                invalidate_catalog()
                 if getattr(ins, "error", None):
                     current_app.logger.error(f"[edit_product] Error insertando nuevas imágenes: {ins.error}")
                     _error("El producto se actualizó, pero hubo errores agregando imágenes.")
@@ -912,6 +901,7 @@ class SupabaseProductAdmin(BaseView):
                         }), 400
                     return redirect(url_for(".edit_product", id=id))
 
+            invalidate_catalog()
             _success("Producto actualizado exitosamente.")
             # Si vino por fetch (AJAX), devuelve JSON; si no, redirige
             if request.headers.get("X-Requested-With") == "fetch":
@@ -976,6 +966,7 @@ class SupabaseProductAdmin(BaseView):
                 if "object_position" in item and item["object_position"]:
                     update_payload["object_position"] = item["object_position"]
                 sb.table("product_images").update(update_payload).eq("id", item["id"]).execute()
+            invalidate_catalog()
 
             return jsonify({"status": "success"}), 200
         except Exception as e:  # pragma: no cover
@@ -997,6 +988,7 @@ class SupabaseProductAdmin(BaseView):
         if not response.data:
             _error("Error al eliminar la imagen de la galería.")
         else:
+            invalidate_catalog()
             _success("Imagen eliminada exitosamente.")
         return redirect(url_for(".edit_product", id=request.form.get("product_id")))
 
@@ -1028,6 +1020,7 @@ class SupabaseProductAdmin(BaseView):
         if not upd.data:
             _error("No se pudo establecer la imagen principal.")
         else:
+            invalidate_catalog()
             _success("Imagen principal actualizada.")
 
         return redirect(url_for(".edit_product", id=product_id))
@@ -6,6 +6,8 @@ import unicodedata
 import csv
 import io
 
+from ..services.catalog_cache import invalidate_catalog
+
 try:
     import openpyxl
 except ImportError:
@@ -434,6 +436,9 @@ class BulkUploadAdminView(BaseView):
                             "Error al insertar producto '%s': %s", product["nombre"], resp
                         )
 
+            if inserted or updated:
+                invalidate_catalog()
+
             msg = f"Productos insertados en borrador: {inserted}"
             if updated:
                 msg += f" | Actualizados: {updated}"
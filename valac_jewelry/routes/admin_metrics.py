@@ -0,0 +1,25 @@
+"""
+routes/admin_metrics.py
+Métricas en proceso (services/metrics.py) para el admin: latencias y
+espera de pool de Supabase, contadores de reintentos/errores, etc.
+"""
+
+from flask import request, redirect, url_for, flash, jsonify
+from flask_admin import BaseView, expose
+from flask_login import current_user
+
+from ..services.metrics import metrics
+
+
+class MetricsAdminView(BaseView):
+
+    def is_accessible(self) -> bool:
+        return current_user.is_authenticated and getattr(current_user, "is_admin", False)
+
+    def inaccessible_callback(self, name, **kwargs):
+        flash("Debes iniciar sesión como administrador.", "error")
+        return redirect(url_for("auth.login", next=request.url))
+
+    @expose("/")
+    def index(self):
+        return jsonify(metrics.snapshot())
@@ -1,8 +1,21 @@
 import logging, json, datetime
-from flask import request, redirect, url_for, flash, current_app, jsonify
+from flask import request, redirect, url_for, flash, current_app, jsonify, Response
 from flask_admin import BaseView, expose
 from flask_login import current_user
 
+from ..services.order_listing import (
+    SORT_COLUMNS,
+    OrderFilters,
+    OrderSort,
+    fetch_page,
+    fold_stats,
+    get_stats as get_listing_stats,
+    invalidate_order_listing,
+)
+from ..services.order_export import ExportError, plan_export
+from ..services.schema_errors import is_missing_function
+from ..services.supabase_clients import clients
+
 logger = logging.getLogger(__name__)
 
 # Flujos de estados para pago y envío
@@ -28,6 +41,14 @@ ORDER_STATES = {
     'cancelled': []
 }
 
+# Campo → máquina de estados para las transiciones masivas
+STATE_MACHINES = {
+    'estado': ORDER_STATES,
+    'estado_envio': SHIPPING_STATES,
+    'estado_pago': PAYMENT_STATES,
+}
+BULK_MAX_ORDERS = 500
+
 class OrderService:
     def __init__(self, supabase_client):
         self.client = supabase_client
@@ -72,54 +93,13 @@ class OrderService:
             logger.error("Error obteniendo detalle de orden %s: %s", order_id, e)
             return None
 
-    def get_stats(self, orders):
+    def get_stats(self, filters=None):
         """
-        Calcula estadísticas clave a partir de la lista de órdenes.
-        Devuelve un diccionario con:
-          {
-            'total': int,
-            'pending_payment': int,
-            'paid': int,
-            'refunded': int,
-            'unshipped': int,
-            'processing': int,
-            'shipped': int,
-            'delivered': int
-          }
+        KPIs del listado (total, pagos y envíos por estado) con los filtros
+        de fecha/estado, a partir de un conteo agrupado en la DB.
+        Ver services/order_listing.py.
         """
-        stats = {
-            'total': 0,
-            'pending_payment': 0,
-            'paid': 0,
-            'refunded': 0,
-            'unshipped': 0,
-            'processing': 0,
-            'shipped': 0,
-            'delivered': 0
-        }
-        if orders is None:
-            return stats
-        for order in orders:
-            stats['total'] += 1
-            # Estadísticas de pago
-            payment = (order.get('estado_pago') or '').lower()
-            if payment == 'pending':
-                stats['pending_payment'] += 1
-            elif payment == 'paid':
-                stats['paid'] += 1
-            elif payment == 'refunded':
-                stats['refunded'] += 1
-            # Estadísticas de envío
-            shipping = (order.get('estado_envio') or 'unshipped').lower()
-            if shipping == 'unshipped':
-                stats['unshipped'] += 1
-            elif shipping == 'processing':
-                stats['processing'] += 1
-            elif shipping == 'shipped':
-                stats['shipped'] += 1
-            elif shipping == 'delivered':
-                stats['delivered'] += 1
-        return stats
+        return get_listing_stats(self.client, OrderFilters(**(filters or {})))
 
     def update_order_detail(self, order_id, update_data):
         """
@@ -147,6 +127,76 @@ class OrderService:
             logger.error("Error actualizando estado de la orden %s: %s", order_id, e)
             return None
 
+    def bulk_transition(self, order_ids, field, action):
+        """
+        Lleva varias órdenes al estado `action` del campo `field`.
+          - Lee el estado actual de todas en una consulta y valida la
+            transición en memoria con STATE_MACHINES.
+          - Aplica las válidas con una sola RPC (bulk_order_transition,
+            migración 017) que también agrega la entrada a status_history.
+            La RPC sólo la puede ejecutar el service role.
+        Devuelve {'updated': [ids], 'rejected': [{'id', 'reason'}]}.
+        """
+        machine = STATE_MACHINES[field]
+        result = self.client.table('orders').select(f"id, {field}").in_('id', order_ids).execute()
+        current = {row['id']: row.get(field) for row in result.data or []}
+
+        rejected, valid, from_states = [], [], set()
+        for order_id in order_ids:
+            if order_id not in current:
+                rejected.append({'id': order_id, 'reason': 'no encontrada'})
+                continue
+            state = (current[order_id] or ('unshipped' if field == 'estado_envio' else '')).strip().lower()
+            if action not in machine.get(state, []):
+                rejected.append({'id': order_id, 'reason': f"de '{state}' a '{action}' no permitido"})
+                continue
+            valid.append(order_id)
+            from_states.add(current[order_id] or 'unshipped')
+        if not valid:
+            return {'updated': [], 'rejected': rejected}
+
+        entry = {
+            "fecha": datetime.datetime.now().strftime("%d/%m/%Y %H:%M"),
+            "user": current_user.email if hasattr(current_user, "email") else "admin",
+            field: action,
+            "masivo": True,
+        }
+        try:
+            resp = clients.service.rpc('bulk_order_transition', {
+                'p_ids': valid,
+                'p_field': field,
+                'p_from': sorted(from_states),
+                'p_to': action,
+                'p_entry': entry,
+            }).execute()
+            updated = [row if isinstance(row, int) else next(iter(row.values())) for row in resp.data or []]
+        except Exception as e:
+            if not is_missing_function(e):
+                raise
+            logger.warning("bulk_order_transition no existe (¿falta migración 017?); actualizando una por una")
+            updated = self._transition_each(valid, field, action, entry)
+
+        # Cambiaron entre la lectura y el UPDATE
+        missed = set(valid) - set(updated)
+        rejected.extend({'id': order_id, 'reason': 'cambió de estado'} for order_id in valid if order_id in missed)
+        return {'updated': sorted(updated), 'rejected': rejected}
+
+    def _transition_each(self, order_ids, field, action, entry):
+        updated = []
+        rows = self.client.table('orders').select("id, status_history").in_('id', order_ids).execute().data or []
+        for row in rows:
+            history = row.get("status_history") or []
+            if isinstance(history, str):
+                try:
+                    history = json.loads(history)
+                except Exception:
+                    history = []
+            history.append(entry)
+            result = self.update_order_detail(row['id'], {field: action, "status_history": json.dumps(history)})
+            if result and result.data:
+                updated.append(row['id'])
+        return updated
+
     def update_order_payment(self, order_id, current_order):
         """
         Actualiza el estado de pago de la orden validando la transición usando PAYMENT_STATES.
@@ -239,30 +289,43 @@ class OrderAdminView(BaseView):
         # Considerar mover esta función a un proceso asíncrono o eliminarla de la vista principal
         # self.update_all_direccion_completa()
         service = OrderService(self.admin.app.supabase)
-        orders_result = service.get_orders()
-        orders = orders_result.data if orders_result and orders_result.data else []
-        stats = service.get_stats(orders)
+        try:
+            stats = service.get_stats()
+        except Exception as e:
+            logger.error("Error obteniendo estadísticas de órdenes: %s", e)
+            stats = fold_stats({})
         logger.debug("Mostrando vista de órdenes con estadísticas: %s", stats)
         return self.render('admin/orders_list.html', stats=stats)
 
 
     def update_all_direccion_completa(self):
         """
-        Recorre todas las órdenes y actualiza 'direccion_completa' concatenando
-        direccion_envio, colonia, ciudad, codigo_postal y estado_geografico.
+        Actualiza 'direccion_completa' de todas las órdenes concatenando
+        dirección_envío, colonia, ciudad, codigo_postal y estado_geografico.
+        Un solo UPDATE con la RPC refresh_direccion_completa (migración 017);
+        sin la migración, una escritura por orden que cambió.
         """
+        try:
+            resp = clients.service.rpc('refresh_direccion_completa', {}).execute()
+            logger.debug("direccion_completa actualizada en %s órdenes", resp.data)
+            return
+        except Exception as e:
+            if not is_missing_function(e):
+                raise
+            logger.warning("refresh_direccion_completa no existe (¿falta migración 017?); actualizando una por una")
+
         service = OrderService(self.admin.app.supabase)
         result = service.get_orders()
         if not result or not result.data:
             logger.debug("No se encontraron órdenes para actualizar direccion_completa.")
             return
         for order in result.data:
-            direccion = order.get("direccion_envio") or ""
+            direccion = order.get("dirección_envío") or order.get("direccion_envio") or ""
             colonia = order.get("colonia") or ""
             ciudad = order.get("ciudad") or ""
             codigo_postal = order.get("codigo_postal") or ""
             estado_geografico = order.get("estado_geografico") or ""
-            complete_address = ", ".join(filter(None, [direccion, colonia, ciudad, codigo_postal, estado_geografico]))
+            complete_address = ", ".join(str(p) for p in [direccion, colonia, ciudad, codigo_postal, estado_geografico] if p)
             if order.get("direccion_completa") != complete_address:
                 update_data = {"direccion_completa": complete_address}
                 update_result = service.update_order_detail(order["id"], update_data)
@@ -285,10 +348,63 @@ class OrderAdminView(BaseView):
             flash("No se pudo actualizar el estado de la orden.", "error")
             logger.error("Error al actualizar la orden %s con acción %s", order_id, action)
         else:
+            invalidate_order_listing()
             flash("Estado de la orden actualizado exitosamente.", "success")
             logger.debug("Orden %s actualizada a %s exitosamente.", order_id, action)
         return redirect(url_for('.index'))
 
+    @expose('/bulk_transition', methods=['POST'])
+    def bulk_transition(self):
+        """Transición masiva: ids (lista o "1,2,3"), action y field
+        ('estado' por defecto, 'estado_envio' o 'estado_pago'). Acepta JSON
+        (responde JSON) o formulario (flash + redirect)."""
+        data = request.get_json(silent=True) if request.is_json else request.form
+        data = data or {}
+        field = (data.get('field') or 'estado').strip()
+        action = (data.get('action') or '').strip().lower()
+        raw_ids = (data.get('ids') or []) if request.is_json else request.form.getlist('ids')
+        if isinstance(raw_ids, str):
+            raw_ids = raw_ids.split(',')
+        elif len(raw_ids) == 1 and isinstance(raw_ids[0], str):
+            raw_ids = raw_ids[0].split(',')
+        try:
+            order_ids = list(dict.fromkeys(int(i) for i in raw_ids if str(i).strip()))
+        except ValueError:
+            order_ids = []
+
+        error = None
+        if field not in STATE_MACHINES:
+            error = f"Campo no permitido: {field}."
+        elif not order_ids or not action:
+            error = "Selecciona órdenes y una acción."
+        elif len(order_ids) > BULK_MAX_ORDERS:
+            error = f"Máximo {BULK_MAX_ORDERS} órdenes por operación."
+        if error:
+            if request.is_json:
+                return jsonify({"error": error}), 400
+            flash(error, "error")
+            return redirect(url_for('.index'))
+
+        service = OrderService(self.admin.app.supabase)
+        try:
+            result = service.bulk_transition(order_ids, field, action)
+        except Exception as e:
+            logger.error("Error en transición masiva (%s → %s): %s", field, action, e)
+            if request.is_json:
+                return jsonify({"error": "No se pudo actualizar las órdenes."}), 500
+            flash("No se pudo actualizar las órdenes.", "error")
+            return redirect(url_for('.index'))
+
+        if result['updated']:
+            invalidate_order_listing()
+        logger.info("Transición masiva %s → %s: %d actualizadas, %d rechazadas",
+                    field, action, len(result['updated']), len(result['rejected']))
+        if request.is_json:
+            return jsonify(result)
+        flash(f"{len(result['updated'])} órdenes actualizadas, {len(result['rejected'])} sin cambio.",
+              "success" if result['updated'] else "error")
+        return redirect(url_for('.index'))
+
     @expose('/<int:order_id>', methods=['GET', 'POST'])
     def detail(self, order_id, **kwargs):
         logger.debug("Entrando al endpoint detail con order_id: %s", order_id)
@@ -310,6 +426,7 @@ class OrderAdminView(BaseView):
             
             if ((result_payment is None or (result_payment and result_payment.data)) and 
                 (result_shipping is None or (result_shipping and result_shipping.data))):
+                invalidate_order_listing()
                 flash("Detalles de la orden actualizados exitosamente.", "success")
                 logger.debug("Orden actualizada correctamente para order_id: %s", order_id)
             else:
@@ -398,35 +515,86 @@ class OrderAdminView(BaseView):
         result = service.update_order_detail(order_id, update_data)
         return result
 
+    @expose('/export')
+    def export(self):
+        """CSV/XLSX de órdenes en streaming (services/order_export.py).
+
+        format=csv|xlsx y los mismos filtros de la tabla; since_last=1
+        exporta sólo las órdenes nuevas desde la última incremental."""
+        args = request.args
+        since_last = args.get('since_last') == '1'
+        filters = OrderFilters(
+            start_date=args.get('start_date') or None,
+            end_date=args.get('end_date') or None,
+            estado_pago=args.get('estado') or None,
+            estado_envio=args.get('estado_envio') or None,
+        )
+        sb = self.admin.app.supabase
+        try:
+            export = plan_export(sb, args.get('format', 'csv'), filters, since_last)
+        except ExportError as e:
+            flash(str(e), "error")
+            return redirect(url_for('.index'))
+        except Exception as e:
+            logger.error("Error preparando exportación de órdenes: %s", e)
+            flash("No se pudo preparar la exportación.", "error")
+            return redirect(url_for('.index'))
+
+        if export.empty:
+            flash(f"No hay órdenes nuevas desde la última exportación (#{export.after_id}); "
+                  "las de los últimos minutos entran en la siguiente.", "info")
+            return redirect(url_for('.index'))
+
+        logger.info("Exportación de órdenes %s solicitada por %s (ids %d-%d)", export.fmt,
+                    getattr(current_user, 'email', current_user.get_id()), export.after_id + 1, export.upto_id)
+        return Response(export.stream(sb), mimetype=export.mimetype, headers={
+            "Content-Disposition": f'attachment; filename="{export.filename}"',
+            "X-Export-Last-Id": str(export.upto_id),
+        })
+
     @expose('/json')
     def json(self):
+        """Protocolo server-side de DataTables: draw/start/length,
+        search[value] y order[0][column|dir], más los filtros de la página
+        (start_date, end_date, estado, estado_envio)."""
         service = OrderService(self.admin.app.supabase)
         try:
-            filters = {
-                'start_date': request.args.get('start_date'),
-                'end_date': request.args.get('end_date'),
-                'estado_pago': request.args.get('estado'),
-                'estado_envio': request.args.get('estado_envio')
-            }
-            filters = {k: v for k, v in filters.items() if v}
-            logger.debug("Filtros recibidos para la consulta de órdenes: %s", filters)
-            response = service.get_orders(filters)
-            orders = response.data or []
+            args = request.args
+            filters = OrderFilters(
+                start_date=args.get('start_date') or None,
+                end_date=args.get('end_date') or None,
+                estado_pago=args.get('estado') or None,
+                estado_envio=args.get('estado_envio') or None,
+                search=(args.get('search[value]') or '').strip(),
+            )
+            column = args.get('order[0][column]', type=int)
+            sort = OrderSort(
+                column=SORT_COLUMNS[column] if column is not None and 0 <= column < len(SORT_COLUMNS) else 'fecha_pedido',
+                desc=args.get('order[0][dir]', 'desc') != 'asc',
+            )
+            start = max(0, args.get('start', 0, type=int))
+            length = args.get('length', 25, type=int)
+            logger.debug("Órdenes: filtros=%s orden=%s start=%s length=%s", filters, sort, start, length)
 
+            orders, filtered = fetch_page(service.client, filters, sort, start, length)
             for order in orders:
                 order['cliente'] = {
                     "id": order.get("cliente_id"),
                     "nombre": order.get("nombre", "")
                 }
 
-            stats = service.get_stats(orders)
-            logger.debug("Enviando JSON con %d órdenes", len(orders))
+            stats = service.get_stats({
+                'start_date': filters.start_date,
+                'end_date': filters.end_date,
+                'estado_pago': filters.estado_pago,
+                'estado_envio': filters.estado_envio,
+            })
             return jsonify({
                 "data": orders,
                 "stats": stats,
-                "recordsTotal": len(orders),
-                "recordsFiltered": len(orders),
-                "draw": 1
+                "recordsTotal": service.get_stats()['total'],
+                "recordsFiltered": filtered,
+                "draw": args.get('draw', 1, type=int)
             })
         except Exception as e:
             logger.error("Error en /admin/orders/json: %s", e)
@@ -13,6 +13,8 @@ from flask import request, redirect, url_for, flash, current_app, jsonify
 from flask_admin import BaseView, expose
 from flask_login import current_user
 
+from ..services.promo_settings import invalidate_promo_settings
+
 logger = logging.getLogger(__name__)
 
 STORAGE_BUCKET = "CatalogoJoyasValacJoyas"
@@ -66,6 +68,7 @@ class PromoAdminView(BaseView):
 
     def _save_setting(self, key: str, value: str) -> None:
         self.app_sb.table("site_settings").upsert({"key": key, "value": value}).execute()
+        invalidate_promo_settings()
 
     # ── INDEX ────────────────────────────────────────
 
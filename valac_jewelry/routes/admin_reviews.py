@@ -8,6 +8,9 @@ from flask import request, redirect, url_for, flash, current_app
 from flask_admin import BaseView, expose
 from flask_login import current_user
 
+from ..services.review_listing import invalidate_review_listing
+from ..services.review_stats import invalidate_review_stats
+
 logger = logging.getLogger(__name__)
 
 
@@ -110,6 +113,8 @@ class ReviewsAdminView(BaseView):
         sb = self.app_sb
         try:
             sb.table("reviews").update({"verificado": True, "admin_notes": None}).eq("id", review_id).execute()
+            invalidate_review_stats()
+            invalidate_review_listing()
             flash("Reseña aprobada exitosamente.", "success")
             logger.info("Reseña %s aprobada por admin", review_id)
         except Exception as e:
@@ -128,6 +133,8 @@ class ReviewsAdminView(BaseView):
                 "verificado": False,
                 "admin_notes": notes or "Rechazada por admin",
             }).eq("id", review_id).execute()
+            invalidate_review_stats()
+            invalidate_review_listing()
             flash("Reseña rechazada.", "warning")
             logger.info("Reseña %s rechazada por admin", review_id)
         except Exception as e:
@@ -141,10 +148,11 @@ class ReviewsAdminView(BaseView):
     def delete(self, review_id: int):
         sb = self.app_sb
         try:
-            # Obtener media_urls antes de borrar
-            resp = sb.table("reviews").select("media_urls").eq("id", review_id).execute()
+            # Obtener media_urls (y miniaturas/pósters) antes de borrar
+            resp = sb.table("reviews").select("*").eq("id", review_id).execute()
             if resp.data:
-                media_urls = resp.data[0].get("media_urls") or []
+                row = resp.data[0]
+                media_urls = (row.get("media_urls") or []) + [t for t in row.get("media_thumbs") or [] if t]
                 # Eliminar archivos del Storage
                 for path in media_urls:
                     try:
@@ -155,6 +163,8 @@ class ReviewsAdminView(BaseView):
                         logger.warning("No se pudo eliminar archivo %s: %s", path, storage_err)
 
             sb.table("reviews").delete().eq("id", review_id).execute()
+            invalidate_review_stats()
+            invalidate_review_listing()
             flash("Reseña y archivos eliminados.", "success")
             logger.info("Reseña %s eliminada por admin", review_id)
         except Exception as e:
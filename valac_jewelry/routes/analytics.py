@@ -1,12 +1,18 @@
-from flask import request, current_app, flash, redirect, url_for
+from flask import request, current_app, flash, redirect, session, url_for
 from flask_admin import BaseView, expose
 from flask_login import current_user
 from collections import Counter
 from datetime import datetime, timedelta, timezone
 import uuid
-import requests
 import logging
 
+from ..services.analytics_ingest import ingest
+from ..services.analytics_rollups import load_summary
+from ..services.analytics_sessions import load_session_summary
+from ..services.path_classifier import FUNNEL_STAGES, PathTally, analytics_classifier
+from ..services.geolocation import lookup_location
+from ..services.rate_limit import beacons, client_ip
+
 logger = logging.getLogger(__name__)
 
 # ---------- Helpers de fechas ----------
@@ -73,17 +79,17 @@ def _extract_city_region(loc):
     return None, None, None
 
 
-def _get_client_ip(req):
-    """
-    Obtén la IP del cliente respetando proxies/reverse-proxies.
-    """
-    xff = req.headers.get("X-Forwarded-For", "")
-    if xff:
-        # XFF puede traer "ip1, ip2, ip3", nos quedamos con la primera pública
-        first = xff.split(",")[0].strip()
-        if first:
-            return first
-    return req.remote_addr
+def _session_id(payload):
+    """Id anónimo de sesión: el del navegador (localStorage) o, si no llega,
+    uno guardado en la cookie de sesión de Flask para no crear un id
+    distinto por evento."""
+    sid = payload.get("session_id")
+    if sid:
+        return str(sid)[:64]
+    sid = session.get("analytics_sid")
+    if not sid:
+        sid = session["analytics_sid"] = str(uuid.uuid4())
+    return sid
 
 
 class AnalyticsAdmin(BaseView):
@@ -102,44 +108,46 @@ class AnalyticsAdmin(BaseView):
         dt_from, dt_to = _parse_date_range(request.args)
 
         try:
-            # ---------- PRODUCT VIEWS (filtrado por rango) ----------
-            logger.debug("Consultando product_views con rango: from=%s to=%s", dt_from, dt_to)
-            q_views = supabase.table("product_views").select("product_id, timestamp, location")
-            if dt_from:
-                q_views = q_views.gte("timestamp", dt_from.isoformat())
-            if dt_to:
-                q_views = q_views.lte("timestamp", dt_to.isoformat())
-            pv_resp = q_views.execute()
-            pv_rows = pv_resp.data or []
-
-            product_ids = [row["product_id"] for row in pv_rows if row.get("product_id") is not None]
-            counts = Counter(product_ids)
+            # ---------- CONTEOS DEL RANGO (rollups diarios) ----------
+            logger.debug("Consultando rollups de analytics con rango: from=%s to=%s", dt_from, dt_to)
+            summary = load_summary(
+                supabase, dt_from, dt_to, _extract_city_region,
+                source=current_app.config.get("ANALYTICS_SOURCE", "rollup"),
+                page_size=int(current_app.config.get("ANALYTICS_SCAN_PAGE_SIZE", 1000)),
+            )
+            counts = Counter({pid: n for pid, n in summary.product_views.items() if pid})
+            path_counts = summary.paths
 
             # ---------- PRODUCT NAMES ----------
             product_names = {}
             try:
                 # Traer TODOS para poder armar la tabla completa con 0 vistas
-                names_resp = supabase.table("products").select("id, nombre").execute()
-                for prod in names_resp.data or []:
-                    product_names[prod["id"]] = prod["nombre"]
+                # (por páginas de id: una sola consulta se corta en el max-rows de PostgREST)
+                last_id = None
+                while True:
+                    q_names = supabase.table("products").select("id, nombre").order("id").limit(1000)
+                    if last_id is not None:
+                        q_names = q_names.gt("id", last_id)
+                    batch = q_names.execute().data or []
+                    for prod in batch:
+                        product_names[prod["id"]] = prod["nombre"]
+                    if len(batch) < 1000:
+                        break
+                    last_id = batch[-1]["id"]
                 all_products = list(product_names.items())  # [(id, nombre), ...]
             except Exception as e:
                 logger.warning("No se pudieron traer todos los productos: %s", e)
                 all_products = []
 
             # Top más vistos (10)
-            product_views = sorted(
-                [
-                    {
-                        "product_id": pid,
-                        "nombre": product_names.get(pid, f"Producto ID {pid}"),
-                        "views": cnt,
-                    }
-                    for pid, cnt in counts.items()
-                ],
-                key=lambda x: x["views"],
-                reverse=True,
-            )[:10]
+            product_views = [
+                {
+                    "product_id": pid,
+                    "nombre": product_names.get(pid, f"Producto ID {pid}"),
+                    "views": cnt,
+                }
+                for pid, cnt in counts.most_common(10)
+            ]
 
             # Lista completa (todos los productos, incl. 0 vistas)
             all_product_views = [
@@ -153,84 +161,50 @@ class AnalyticsAdmin(BaseView):
             # Orden ascendente: menos vistos primero
             all_product_views.sort(key=lambda x: x["views"])
 
-            # ---------- NAVIGATION (filtrado por rango) ----------
-            logger.debug("Consultando user_navigation con rango: from=%s to=%s", dt_from, dt_to)
-            q_nav = supabase.table("user_navigation").select("path, timestamp")
-            if dt_from:
-                q_nav = q_nav.gte("timestamp", dt_from.isoformat())
-            if dt_to:
-                q_nav = q_nav.lte("timestamp", dt_to.isoformat())
-            nav_resp = q_nav.execute()
-            nav_rows = nav_resp.data or []
-            paths = [row["path"] for row in nav_rows if row.get("path")]
-            path_counts = Counter(paths)
-
-            navigation = sorted(
-                [{"path": p, "count": c} for p, c in path_counts.items()],
-                key=lambda x: x["count"],
-                reverse=True,
-            )[:10]
-
-            # ---------- FUNNEL (por paths) ----------
-            funnel_stages = [
-                {"name": "Home", "path": "/"},
-                {"name": "Colección", "path": "/collection"},
-                {"name": "Detalle de producto", "path_prefix": "/producto/"},
-                {"name": "Click en comprar", "path_prefix": "/buy-click/"},
-                {"name": "WhatsApp click", "path_prefix": "/wa-click/"},
+            # ---------- NAVIGATION ----------
+            navigation = [{"path": p, "count": c} for p, c in path_counts.most_common(10)]
+
+            # ---------- FUNNEL, KPIs y WhatsApp (una pasada por path) ----------
+            tally = PathTally(analytics_classifier).update(path_counts)
+            funnel_data = [
+                {"name": stage["name"], "count": tally.counts[stage["name"]]} for stage in FUNNEL_STAGES
+            ]
+            total_views = summary.total_views
+            total_buy_clicks = tally.counts["buy_click"]
+            total_wa_clicks = tally.counts["wa_click"]
+            wa_per_product = tally.captures.get("wa_product", Counter())
+            wa_product_clicks = [
+                {"product_id": pid, "nombre": product_names.get(pid, f"Producto ID {pid}"), "clicks": cnt}
+                for pid, cnt in wa_per_product.most_common(20)
             ]
-            funnel_data = []
-            for stage in funnel_stages:
-                if "path" in stage:
-                    count = path_counts.get(stage["path"], 0)
-                else:
-                    pref = stage["path_prefix"]
-                    count = sum(1 for p in paths if p and p.startswith(pref))
-                funnel_data.append({"name": stage["name"], "count": count})
-
-            # ---------- KPIs ----------
-            total_views = len(pv_rows)
-            total_buy_clicks = sum(1 for p in paths if p and p.startswith("/buy-click/"))
-
-            # ---------- WhatsApp clicks ----------
-            wa_clicks = [p for p in paths if p and p.startswith("/wa-click/")]
-            total_wa_clicks = len(wa_clicks)
-            wa_per_product = Counter()
-            for p in wa_clicks:
-                tag = p.replace("/wa-click/", "")
-                if tag.startswith("product_"):
-                    try:
-                        pid = int(tag.replace("product_", ""))
-                        wa_per_product[pid] += 1
-                    except ValueError:
-                        pass
-            wa_product_clicks = sorted(
-                [
-                    {"product_id": pid, "nombre": product_names.get(pid, f"Producto ID {pid}"), "clicks": cnt}
-                    for pid, cnt in wa_per_product.items()
-                ],
-                key=lambda x: x["clicks"],
-                reverse=True,
-            )[:20]
 
             # ---------- Ubicaciones (Top regiones/ciudades) ----------
             cities_counter = Counter()
             regions_counter = Counter()
             location_set = set()
 
-            for row in pv_rows:
-                city, region, country = _extract_city_region(row.get("location"))
+            for key, n in summary.locations.items():
+                city, region, _country = key
                 if city:
-                    cities_counter[city] += 1
+                    cities_counter[city] += n
                 if region:
-                    regions_counter[region] += 1
-                key = (city or "", region or "", country or "")
+                    regions_counter[region] += n
                 if any(key):
                     location_set.add(key)
 
             top_cities = [{"city": c, "count": n} for c, n in cities_counter.most_common(10)]
             top_regions = [{"region": r, "count": n} for r, n in regions_counter.most_common(10)]
 
+            # ---------- Funnel por sesión (migración 010) ----------
+            try:
+                session_funnel = load_session_summary(supabase, dt_from, dt_to)
+            except Exception as e:
+                logger.warning("No se pudo leer el funnel por sesión: %s", e)
+                session_funnel = None
+            if session_funnel:
+                for row in session_funnel["products"]:
+                    row["nombre"] = product_names.get(row["product_id"], f"Producto ID {row['product_id']}")
+
         except Exception as e:
             logger.error("[AnalyticsAdmin] Error al consultar Supabase: %s", e)
             flash("Error al cargar analíticas. Revisa los logs.", "error")
@@ -241,6 +215,7 @@ class AnalyticsAdmin(BaseView):
             funnel_data = []
             top_cities, top_regions = [], []
             location_set = set()
+            session_funnel = None
 
         # Render con los nombres que el template espera + nuevas tablas de ubicación
         return self.render(
@@ -256,26 +231,29 @@ class AnalyticsAdmin(BaseView):
             funnel_data=funnel_data,
             top_cities=top_cities,
             top_regions=top_regions,
+            session_funnel=session_funnel,
         )
 
     # -------------------- Endpoints de tracking --------------------
+    # Sólo encolan: el insert (y la geolocalización de la IP) lo hace el
+    # worker de services/analytics_ingest.py en lotes. Pasado el token
+    # bucket por IP el beacon se descarta (igual responde 204).
 
     @expose('/t/v/<int:product_id>', methods=['POST'])
     @expose('/track_view/<int:product_id>', methods=['POST'])
     def track_view(self, product_id):
         try:
+            ip = client_ip(request)  # el mismo hop confiable para límite y ubicación
+            if not beacons.hit(ip).allowed:
+                return "", 204
             payload = request.get_json(silent=True) or {}
-            session_id = payload.get("session_id") or str(uuid.uuid4())
+            session_id = _session_id(payload)
             referrer = request.headers.get("Referer")
-            ip = _get_client_ip(request)
-            location = self.get_location_from_ip(ip)
-
-            current_app.supabase.table("product_views").insert({
+            ingest.enqueue("product_views", {
                 "product_id": product_id,
                 "session_id": session_id,
                 "referrer": referrer,
-                "location": location,   # <-- JSON estructurado
-            }).execute()
+            }, ip=ip)
             return "", 204
         except Exception as e:
             logger.error("Error en track_view: %s", e)
@@ -285,17 +263,16 @@ class AnalyticsAdmin(BaseView):
     @expose('/track_navigation', methods=['POST'])
     def track_navigation(self):
         try:
+            ip = client_ip(request)  # el mismo hop confiable para límite y ubicación
+            if not beacons.hit(ip).allowed:
+                return "", 204
             payload = request.get_json(silent=True) or {}
-            session_id = payload.get("session_id") or str(uuid.uuid4())
+            session_id = _session_id(payload)
             path = payload.get("path") or ""
-            ip = _get_client_ip(request)
-            location = self.get_location_from_ip(ip)
-
-            current_app.supabase.table("user_navigation").insert({
+            ingest.enqueue("user_navigation", {
                 "path": path,
                 "session_id": session_id,
-                "location": location,   # <-- JSON estructurado
-            }).execute()
+            }, ip=ip)
             return "", 204
         except Exception as e:
             logger.error("Error en track_navigation: %s", e)
@@ -305,16 +282,15 @@ class AnalyticsAdmin(BaseView):
     @expose('/track_buy_click/<int:product_id>', methods=['POST'])
     def track_buy_click(self, product_id):
         try:
+            ip = client_ip(request)  # el mismo hop confiable para límite y ubicación
+            if not beacons.hit(ip).allowed:
+                return "", 204
             payload = request.get_json(silent=True) or {}
-            session_id = payload.get("session_id") or str(uuid.uuid4())
-            ip = _get_client_ip(request)
-            location = self.get_location_from_ip(ip)
-
-            current_app.supabase.table("user_navigation").insert({
+            session_id = _session_id(payload)
+            ingest.enqueue("user_navigation", {
                 "session_id": session_id,
                 "path": f"/buy-click/{product_id}",
-                "location": location,   # <-- JSON estructurado
-            }).execute()
+            }, ip=ip)
             return "", 204
         except Exception as e:
             logger.error("Error en track_buy_click: %s", e)
@@ -323,36 +299,5 @@ class AnalyticsAdmin(BaseView):
     # -------------------- Utilidades --------------------
 
     def get_location_from_ip(self, ip_address):
-        """
-        Devuelve un dict JSON listo para guardar en jsonb:
-        {
-          ip, city, region, region_code, country, country_code, postal,
-          latitude, longitude, timezone
-        }
-        Backwards-safe: si falla, devuelve city/region/country = None.
-        """
-        try:
-            # Evita resolver localhost/privadas
-            private_prefixes = ("127.", "10.", "192.168.", "172.16.", "172.17.", "172.18.", "172.19.")
-            if not ip_address or ip_address.startswith(private_prefixes):
-                return {"ip": ip_address, "city": None, "region": None, "country": None}
-
-            resp = requests.get(f"https://ipapi.co/{ip_address}/json/", timeout=2.5)
-            if resp.status_code == 200:
-                d = resp.json() or {}
-                return {
-                    "ip": ip_address,
-                    "city": d.get("city"),
-                    "region": d.get("region"),
-                    "region_code": d.get("region_code"),
-                    "country": d.get("country_name"),
-                    "country_code": d.get("country"),
-                    "postal": d.get("postal"),
-                    "latitude": d.get("latitude"),
-                    "longitude": d.get("longitude"),
-                    "timezone": d.get("timezone"),
-                }
-        except Exception:
-            pass
-
-        return {"ip": ip_address, "city": None, "region": None, "country": None}
+        """Ver services.geolocation.lookup_location."""
+        return lookup_location(ip_address)
@@ -1,13 +1,16 @@
 # valac_jewelry/routes/cart.py
 from __future__ import annotations
 
-from flask import Blueprint, render_template, redirect, url_for, session, current_app, flash, request, jsonify
+from flask import Blueprint, render_template, redirect, url_for, session, current_app, flash, request, jsonify, g, make_response
 from functools import wraps
 from decimal import Decimal, ROUND_HALF_UP
 from datetime import datetime, timezone
 from uuid import uuid4
 import logging
 
+from ..services.metrics import metrics
+from ..services.product_lookup import fetch_products_by_id
+
 cart_bp = Blueprint('cart', __name__, url_prefix='/cart')
 logger = logging.getLogger(__name__)
 
@@ -125,6 +128,8 @@ def compute_totals(
 # =========================
 # Helpers de Carrito (sesión)
 # =========================
+CART_PRODUCT_FIELDS = 'id,nombre,precio,descuento_pct,precio_descuento,stock_total,imagen'
+
 def get_cart_data() -> dict[str, int]:
     cart_data = session.get('cart', {})
     if not isinstance(cart_data, dict):
@@ -147,7 +152,18 @@ def cart_not_empty(f):
 def view_cart():
     """
     Renderiza el carrito. El servidor calcula montos (fuente de verdad).
+    Tiempos en el header Server-Timing y en metrics ("cart.view", "cart.hydrate").
     """
+    with metrics.timer("cart.view") as total:
+        response = make_response(_render_cart())
+    timing = [f"total;dur={total['ms']:.1f}"]
+    if "cart_hydrate_ms" in g:
+        timing.insert(0, f"hydrate;dur={g.cart_hydrate_ms:.1f}")
+    response.headers["Server-Timing"] = ", ".join(timing)
+    return response
+
+
+def _render_cart():
     sb = current_app.supabase
     cart_data = get_cart_data()
 
@@ -165,15 +181,20 @@ def view_cart():
             free_shipping_threshold=float(FREE_SHIPPING_THRESHOLD),
         )
 
-    # Carga productos vigentes
+    # Carga productos vigentes: un solo query para todo el carrito
     products = []
-    for product_key, quantity in cart_data.items():
+    with metrics.timer("cart.hydrate") as hydrate:
+        try:
+            rows = fetch_products_by_id(sb, [int(k) for k in cart_data], CART_PRODUCT_FIELDS)
+        except Exception as e:
+            logger.exception("Error consultando productos del carrito %s: %s", list(cart_data), e)
+            flash("Error al consultar los productos del carrito.", 'error')
+            rows = None
+
+    for product_key, quantity in (cart_data.items() if rows is not None else ()):
         try:
             pid = int(product_key)
-            resp = sb.table('products').select(
-                'id,nombre,precio,descuento_pct,precio_descuento,stock_total,imagen'
-            ).eq('id', pid).single().execute()
-            row = resp.data
+            row = rows.get(pid)
             if not row:
                 flash(f"El producto con ID {pid} no está disponible.", 'error')
                 continue
@@ -191,8 +212,10 @@ def view_cart():
                 "unit_price": unit_price
             })
         except Exception as e:
-            logger.exception("Error consultando producto %s: %s", product_key, e)
+            logger.exception("Error procesando producto %s: %s", product_key, e)
             flash(f"Error al consultar el producto con ID {product_key}.", 'error')
+    g.cart_hydrate_ms = hydrate["ms"]
+    logger.debug("Carrito: %s productos hidratados en %.1f ms", len(products), hydrate["ms"])
 
     # Normaliza para cálculo
     items = [
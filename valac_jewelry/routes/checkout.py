@@ -3,7 +3,13 @@ import logging
 from decimal import Decimal
 from flask import Blueprint, render_template, request, redirect, flash, url_for, current_app, session, jsonify
 import mercadopago
-from supabase import create_client, Client
+from werkzeug.local import LocalProxy
+
+from ..services.catalog_cache import on_catalog_invalidate
+from ..services.order_listing import invalidate_order_listing
+from ..services.product_lookup import fetch_products_by_id
+from ..services.supabase_clients import get_anon_client
+from ..services.ttl_cache import TTLCache
 
 def _dec(x) -> Decimal:
     return x if isinstance(x, Decimal) else Decimal(str(x or "0"))
@@ -12,32 +18,53 @@ def sanitize_input(input_str):
     return str(input_str).strip().replace("<", "&lt;").replace(">", "&gt;")
 
 # ---------------- Supabase ----------------
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Mismo cliente que app.supabase (ver services/supabase_clients.py)
+supabase = LocalProxy(get_anon_client)
 
 checkout_bp = Blueprint('checkout', __name__)
 log = logging.getLogger("valac_jewelry")
 
 # ---------------- Helpers ----------------
-def build_order_items_and_subtotal():
-    """
-    Construye items a partir del carrito en sesión y calcula subtotal
-    leyendo precio vigente desde Supabase (precio_descuento si existe).
-    """
-    cart_data = session.get("cart", {}) or {}
+# Sólo lo que usan checkout, /success y el correo; la fila también se guarda
+# en la sesión (cookie), así que no se traen costos ni columnas de inventario.
+CHECKOUT_PRODUCT_FIELDS = "id, nombre, descripcion, imagen, precio, descuento_pct, precio_descuento"
+
+# GET /checkout y el POST que le sigue leen el mismo carrito: los ítems se
+# reutilizan por un rato. La llave es el contenido del carrito, así que
+# cualquier cambio de cantidades o productos vuelve a consultar, y una
+# edición de productos en el admin (invalidate_catalog) lo vacía para no
+# cobrar precios viejos.
+_items_cache = TTLCache(ttl=120, maxsize=256)
+on_catalog_invalidate(_items_cache.invalidate)
+
+
+def _cart_key(cart_data):
+    try:
+        return tuple(sorted((str(k), int(v)) for k, v in cart_data.items()))
+    except (TypeError, ValueError):
+        return None  # cantidades malformadas: _load_order_items descarta esos renglones
+
+
+def _load_order_items(cart_data):
     order_items = []
     subtotal = 0.0
+    # Una llave no numérica no tumba el carrito: el loop descarta ese renglón
+    ids = [int(k) for k in cart_data if str(k).isdigit()]
+    try:
+        rows = fetch_products_by_id(supabase, ids, CHECKOUT_PRODUCT_FIELDS)
+    except Exception as e:
+        current_app.logger.error("Error obteniendo productos del carrito %s: %s", list(cart_data), e)
+        return [], 0.0, False
 
     for product_id_str, quantity in cart_data.items():
         try:
             product_id = int(product_id_str)
-            resp = supabase.table('products').select('*').eq('id', product_id).single().execute()
-            if not resp.data:
+            product = rows.get(product_id)
+            if not product:
                 current_app.logger.error("Producto con ID %s no encontrado.", product_id)
                 continue
 
-            product = resp.data
+            product = dict(product)
             qty = int(quantity)
             product['cantidad'] = qty
             product.setdefault("descripcion", "Sin descripción")
@@ -51,7 +78,39 @@ def build_order_items_and_subtotal():
         except Exception as e:
             current_app.logger.error("Error obteniendo producto %s: %s", product_id_str, e)
 
-    return order_items, subtotal
+    return order_items, subtotal, True
+
+
+def build_order_items_and_subtotal():
+    """
+    Construye items a partir del carrito en sesión y calcula subtotal
+    leyendo precio vigente desde Supabase (precio_descuento si existe).
+    Un solo query para todo el carrito, compartido entre GET y POST.
+    """
+    cart_data = session.get("cart", {}) or {}
+    if not cart_data:
+        return [], 0.0
+
+    key = _cart_key(cart_data)
+    cached = _items_cache.get(key) if key is not None else None
+    if cached is None:
+        order_items, subtotal, ok = _load_order_items(cart_data)
+        if not ok:
+            return [], 0.0
+        cached = (order_items, subtotal)
+        if key is not None:
+            _items_cache.set(key, cached)
+
+    order_items, subtotal = cached
+    # Copias: las vistas agregan claves y la sesión guarda los dicts
+    return [dict(p) for p in order_items], subtotal
+
+
+def sales_metadata(order_items):
+    """Renglones para metadata.ventas de la preferencia: la orden no los
+    guarda y services/payment_webhooks.py suma products.ventas con ellos
+    cuando MP aprueba el pago."""
+    return [{"id": int(p["id"]), "cantidad": int(p["cantidad"])} for p in order_items]
 
 
 def snapshot_totals_fallback(subtotal_calc: float) -> dict:
@@ -104,6 +163,7 @@ def create_order_in_db(order_data, order_items):
             return None
         order_id = response.data[0]["id"]
         order_data["id"] = order_id
+        invalidate_order_listing()  # KPIs y totales del listado admin
         session["order_data"] = order_data
         session["order_items"] = order_items
         session["_pixel_purchase_pending"] = True  # META PIXEL — flag de deduplicación
@@ -325,7 +385,10 @@ def checkout():
                 "installments": 18,
                 "default_installments": 6
             },
-            "metadata": {"environment": "production" if IS_PROD else "sandbox"},
+            "metadata": {
+                "environment": "production" if IS_PROD else "sandbox",
+                "ventas": sales_metadata(order_items),
+            },
             "external_reference": str(order_id)
         }
         if IS_PROD:
@@ -462,7 +525,10 @@ def create_preference():
                 "installments": 18,
                 "default_installments": 6
             },
-            "metadata": {"environment": "production" if IS_PROD else "sandbox"},
+            "metadata": {
+                "environment": "production" if IS_PROD else "sandbox",
+                "ventas": sales_metadata(order_items),
+            },
             "external_reference": str(order_id)
         }
         
@@ -7,14 +7,27 @@
 
 from __future__ import annotations
 
-from flask import Blueprint, render_template, request, current_app, flash
+from flask import Blueprint, render_template, request, current_app, flash, jsonify
 from textwrap import dedent
-from typing import Any, Dict, List
+from itertools import islice
+from typing import Any, Callable, Dict, List, Tuple
 import logging
 
+from ..services.catalog_cache import catalog
+from ..services.catalog_facets import facet_cache
+from ..services.catalog_search import search_products
+from ..services.catalog_sort import sorted_views
+
 collection_bp = Blueprint("collection", __name__, url_prefix="/collection")
 logger = logging.getLogger(__name__)
 
+PAGE_SIZE = 36
+DEFAULT_SORT = "novedades"  # sin búsqueda; con búsqueda manda la relevancia
+
+# Lo que pinta cada tarjeta del grid (ver loadProducts() en collection.html)
+GRID_FIELDS = ("id", "nombre", "precio", "descuento_pct", "precio_descuento",
+               "tipo_oro", "genero", "imagen", "stock_total")
+
 # --------------------------------------------------------------------- #
 # Helper: genera la SQL que *conceptualmente* ejecuta supabase-py
 # --------------------------------------------------------------------- #
@@ -56,58 +69,67 @@ def build_debug_sql(filters: Dict[str, Any], limit: int, offset: int) -> str:
 
 
 # --------------------------------------------------------------------- #
-#  RUTA PRINCIPAL
+# Helper: aplica los filtros de la colección sobre el snapshot en memoria
 # --------------------------------------------------------------------- #
 
-@collection_bp.route("/", methods=["GET"])
-def collection_home():
-    """Renderiza la colección de productos con filtros, búsqueda y paginación."""
-
-    supabase = current_app.supabase
-
-    # ---------------------------- 1) Construcción del query dinámico -----
-    #query = supabase.table("products").select("*")
-    query = supabase.table("products").select(
-        "id, nombre, descripcion, precio, descuento_pct, precio_descuento, " +
-        "tipo_producto, genero, tipo_oro, imagen, created_at"
-    ).eq("activo", True).neq("tipo_producto", "Anillos de Compromiso")
-    logger.debug("📥 Query base creada")
-
-    # Parámetros de la URL
-    category   = request.args.get("category", "").strip()
-    type_oro   = request.args.get("type_oro", "").strip()
-    genero     = request.args.get("genero", "").strip().capitalize()
-    mix_unisex = request.args.get("mix_unisex", "").strip()
-    price_min  = request.args.get("price_min", "").strip()
-    price_max  = request.args.get("price_max", "").strip()
-
-    # Filtros ---------------------
-    if category:
-        query = query.ilike("tipo_producto", f"%{category}%")   # ← %…%
-    if type_oro:
-        query = query.ilike("tipo_oro",   f"%{type_oro}%") 
+def product_matcher(filters: Dict[str, Any]) -> Callable[[Dict[str, Any]], bool]:
+    """Equivalente en memoria de build_debug_sql(): ILIKE '%…%' para tipo
+    de producto y oro, IN/= para género y rango de precio. Excluye los
+    anillos de compromiso, que tienen su propia página."""
+    tp = (filters.get("tipo_producto") or "").lower()
+    to = (filters.get("tipo_oro") or "").lower()
+    g = filters.get("genero")
+    generos = set(g) if isinstance(g, list) else ({g} if g else None)
+    p_min = filters.get("precio_min")
+    p_max = filters.get("precio_max")
+
+    def match(p: Dict[str, Any]) -> bool:
+        tipo = p.get("tipo_producto") or ""
+        if tipo == "Anillos de Compromiso":
+            return False
+        if tp and tp not in tipo.lower():
+            return False
+        if to and to not in (p.get("tipo_oro") or "").lower():
+            return False
+        if generos is not None and p.get("genero") not in generos:
+            return False
+        precio = p.get("precio") or 0
+        if p_min is not None and precio < p_min:
+            return False
+        if p_max is not None and precio > p_max:
+            return False
+        return True
+
+    return match
+
+
+def filter_products(rows: List[Dict[str, Any]], filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+    match = product_matcher(filters)
+    return [p for p in rows if match(p)]
+
+
+# --------------------------------------------------------------------- #
+# Helper: filtros a partir de los parámetros de la URL
+# --------------------------------------------------------------------- #
+
+def parse_filters(args) -> Tuple[Dict[str, Any], bool]:
+    """Devuelve (filters, mix_unisex) con el formato de filter_products().
+    Hombre/Mujer incluyen Unisex salvo mix_unisex=0: así la primera carga,
+    el grid y los conteos del panel cuentan lo mismo."""
+    category   = args.get("category", "").strip()
+    type_oro   = args.get("type_oro", "").strip()
+    genero     = args.get("genero", "").strip().capitalize()
+    mix_unisex = args.get("mix_unisex", "1").strip() != "0"
+    price_min  = args.get("price_min", "").strip()
+    price_max  = args.get("price_max", "").strip()
 
     genero_filter: Any = None
     if genero:
-        if mix_unisex == "1" and genero in ("Hombre", "Mujer"):
+        if mix_unisex and genero in ("Hombre", "Mujer"):
             genero_filter = [genero, "Unisex"]
-            query = query.in_("genero", genero_filter)
         else:
             genero_filter = genero
-            query = query.eq("genero", genero)
-
-    if price_min.isdigit():
-        query = query.gte("precio", int(price_min))
-    if price_max.isdigit():
-        query = query.lte("precio", int(price_max))
 
-    # Paginación ------------------
-    page   = max(int(request.args.get("page", 1) or 1), 1)
-    limit  = 36
-    offset = (page - 1) * limit
-    query  = query.range(offset, offset + limit - 1)
-
-    # ---------------------------- 2) SQL conceptual para depuración -------
     filters = {
         "tipo_producto": category or None,
         "genero": genero_filter,
@@ -115,43 +137,132 @@ def collection_home():
         "precio_min": int(price_min) if price_min.isdigit() else None,
         "precio_max": int(price_max) if price_max.isdigit() else None,
     }
-    logger.debug("\n%s", build_debug_sql(filters, limit, offset))
+    return filters, mix_unisex
+
+
+def facet_counts(catalog_rows, version, filters, mix_unisex, within=None) -> Dict[str, Any]:
+    """Conteos del FacetIndex de esa versión; `within` restringe a un
+    subconjunto (resultados de búsqueda)."""
+    index = facet_cache.index(catalog_rows, version)
+    mask = index.subset(within) if within is not None else None
+    return index.counts(filters, mix_unisex=mix_unisex, within=mask)
+
+
+def grid_item(p: Dict[str, Any]) -> Dict[str, Any]:
+    """Tarjeta del grid: sólo los campos que usa el template y las dos
+    primeras imágenes (principal y hover; el snapshot ya las trae en orden)."""
+    item = {k: p.get(k) for k in GRID_FIELDS}
+    item["product_images"] = [
+        {"imagen": img.get("imagen"), "object_position": img.get("object_position")}
+        for img in (p.get("product_images") or [])[:2]
+    ]
+    return item
+
+
+def parse_page(args) -> int:
+    page = args.get("page", "").strip()
+    return max(int(page), 1) if page.isdigit() else 1
+
+
+def collection_page(catalog_rows, version, args, filters, page) -> Tuple[List[Dict[str, Any]], bool, Any]:
+    """(productos de la página, ¿hay más?, resultados de búsqueda o None).
+
+    El orden se aplica ANTES de paginar: la página 2 de "precio_asc"
+    continúa donde terminó la 1. Se lee una fila de más para saber si
+    hay otra página."""
+    offset = (page - 1) * PAGE_SIZE
+    end = offset + PAGE_SIZE + 1
+    search = args.get("search", "").strip()
+    sort = args.get("sort", "").strip()
+    if search:
+        # Relevancia por defecto; con `sort` explícito se reordenan los resultados
+        results = search_products(catalog_rows, version, search)
+        if sort:
+            results = sorted_views.sort_subset(results, catalog_rows, version, sort)
+        within = results
+        matching = filter_products(results, filters)
+        rows = matching[offset:end]
+        logger.debug("🔍 Búsqueda='%s' → %s coincidencias", search, len(matching))
+    else:
+        within = None
+        # Se recorre el orden precalculado y se corta al completar la página
+        ordered = sorted_views.ordered(catalog_rows, version, sort or DEFAULT_SORT)
+        match = product_matcher(filters)
+        rows = list(islice((p for p in ordered if match(p)), offset, end))
+    logger.info("📦 Filas del snapshot = %s (sort=%s)", min(len(rows), PAGE_SIZE), sort or "default")
+    return rows[:PAGE_SIZE], len(rows) > PAGE_SIZE, within
+
 
-    # ---------------------------- 3) Ejecutar consulta en Supabase --------
-    logger.info("🚀 Ejecutando consulta a Supabase …")
+def grid_payload(products, page, has_more) -> Dict[str, Any]:
+    return {"products": [grid_item(p) for p in products], "page": page, "has_more": has_more}
+
+
+# --------------------------------------------------------------------- #
+#  RUTA PRINCIPAL
+# --------------------------------------------------------------------- #
+
+@collection_bp.route("/", methods=["GET"])
+def collection_home():
+    """Renderiza la colección de productos con filtros, búsqueda y paginación.
+    La primera página del grid va embebida en el HTML; las siguientes y los
+    cambios de filtros las pide el JS a /collection/products."""
+
+    # ---------------------------- 1) Parámetros de la URL ----------------
+    filters, mix_unisex = parse_filters(request.args)
+    page = parse_page(request.args)
+
+    # ---------------------------- 2) SQL conceptual para depuración -------
+    logger.debug("\n%s", build_debug_sql(filters, PAGE_SIZE, (page - 1) * PAGE_SIZE))
+
+    # ---------------------------- 3) Leer del snapshot del catálogo -------
     try:
-        response = query.execute()            # supabase-py v2
-        products = response.data or []        # siempre obtenemos lista
-        logger.info("📦 Filas recibidas = %s", len(products))
+        version, catalog_rows = catalog.versioned(current_app.supabase)
     except Exception as exc:
         logger.exception("❌ Supabase query falló: %s", exc)
         flash("Error al cargar los productos. Intenta de nuevo.", "error")
-        return render_template("collection.html", products=[], page=page), 500
-
-    # ---------------------------- 4) Búsqueda en memoria ------------------
-    search = request.args.get("search", "").strip().lower()
-    if search and products:
-        antes = len(products)
-        products = [
-            p for p in products
-            if search in (p.get("nombre", "") + " " + p.get("descripcion", "")).lower()
-        ]
-        logger.debug("🔍 Búsqueda='%s' filtró %s → %s", search, antes, len(products))
-
-    # ---------------------------- 5) Ordenamiento -------------------------
-    sort = request.args.get("sort", "")
-    if sort == "precio_asc":
-        products.sort(key=lambda x: x.get("precio", 0))
-    elif sort == "precio_desc":
-        products.sort(key=lambda x: x.get("precio", 0), reverse=True)
-    elif sort == "novedades":
-        products.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-    elif sort == "mas_vendidos":
-        products.sort(key=lambda x: x.get("ventas", 0), reverse=True)
-    elif sort == "destacados":
-        products.sort(key=lambda x: x.get("destacado", False), reverse=True)
-    elif sort == "mejor_valoracion":
-        products.sort(key=lambda x: x.get("valoracion", 0), reverse=True)
+        return render_template("collection.html", grid=None, page=page, facets=None), 500
+
+    # ---------------------------- 4) Búsqueda / orden sobre todo el catálogo
+    products, has_more, within = collection_page(catalog_rows, version, request.args, filters, page)
+
+    # ---------------------------- 5) Conteos por faceta -------------------
+    facets = facet_counts(catalog_rows, version, filters, mix_unisex, within)
 
     logger.info("✅ Renderizando template con %s productos finales", len(products))
-    return render_template("collection.html", products=products, page=page)
+    return render_template("collection.html", grid=grid_payload(products, page, has_more),
+                           page=page, facets=facets)
+
+
+@collection_bp.route("/products", methods=["GET"])
+def collection_products():
+    """Una página del grid en JSON. Acepta los mismos parámetros que
+    /collection (filtros, search, sort, page)."""
+    filters, _ = parse_filters(request.args)
+    page = parse_page(request.args)
+    try:
+        version, catalog_rows = catalog.versioned(current_app.supabase)
+    except Exception as exc:
+        logger.exception("❌ Supabase query falló: %s", exc)
+        return jsonify({"error": "No se pudieron cargar los productos"}), 500
+
+    products, has_more, _ = collection_page(catalog_rows, version, request.args, filters, page)
+    return jsonify(grid_payload(products, page, has_more))
+
+
+@collection_bp.route("/facets", methods=["GET"])
+def collection_facets():
+    """Conteos por categoría, oro, género y rango de precio para el panel
+    de filtros. Acepta los mismos parámetros que /collection."""
+    filters, mix_unisex = parse_filters(request.args)
+    try:
+        version, catalog_rows = catalog.versioned(current_app.supabase)
+    except Exception as exc:
+        logger.exception("❌ Supabase query falló: %s", exc)
+        return jsonify({"error": "No se pudieron cargar los productos"}), 500
+
+    within = None
+    search = request.args.get("search", "").strip()
+    if search:
+        within = search_products(catalog_rows, version, search)
+
+    return jsonify(facet_counts(catalog_rows, version, filters, mix_unisex, within))
@@ -5,6 +5,7 @@ from datetime import datetime, timezone
 from decimal import Decimal, ROUND_HALF_UP
 
 from ..services.limits_service import can_use_coupon
+from ..services.rate_limit import client_ip, coupon_checks
 
 coupons_api = Blueprint("coupons_api", __name__, url_prefix="/api/coupons")
 
@@ -57,6 +58,11 @@ def _compute_discount(coupon: dict, subtotal: float, msi_selected: bool) -> floa
 
 @coupons_api.route("/validate", methods=["POST"])
 def validate_coupon():
+    # Por IP, para que no se puedan probar códigos por fuerza bruta
+    limit = coupon_checks.hit(client_ip(request))
+    if not limit.allowed:
+        return jsonify({"ok": False, "reason": "rate_limited"}), 429, limit.headers
+
     try:
         data = request.get_json(silent=True) or {}
         code = (data.get("code") or "").strip().upper()
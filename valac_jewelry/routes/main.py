@@ -2,21 +2,16 @@
 
 from flask import Blueprint, render_template, current_app
 
+from ..services.catalog_cache import catalog
+
 main_bp = Blueprint('main', __name__)
 
 @main_bp.route('/')
 def home():
-    supabase = current_app.supabase
-    # Destacados primero, luego por precio desc
-    response = (supabase.table("products")
-        .select("id, nombre, descripcion, precio, descuento_pct, precio_descuento, tipo_producto, genero, tipo_oro, imagen, stock_total, destacado")
-        .eq("activo", True)
-        .gt("stock_total", 0)
-        .order("destacado", desc=True)
-        .order("precio", desc=True)
-        .limit(3)
-        .execute())
-    products = response.data if response.data else []
+    # Destacados primero, luego por precio desc (desde el snapshot del catálogo)
+    in_stock = [p for p in catalog.products(current_app.supabase) if (p.get("stock_total") or 0) > 0]
+    in_stock.sort(key=lambda p: (bool(p.get("destacado")), p.get("precio") or 0), reverse=True)
+    products = in_stock[:3]
     return render_template('home.html', products=products)
 
 def collection_redirect():
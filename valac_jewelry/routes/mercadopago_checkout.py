@@ -2,7 +2,8 @@ import os
 import logging
 from flask import Blueprint, request, jsonify, current_app, flash, redirect, url_for
 import mercadopago
-from supabase import create_client, Client  # Asegúrate de tener instalado supabase-py
+
+from ..services.payment_webhooks import payment_webhooks
 
 # ✨ ADDITIONS ✨
 ENV = os.getenv("FLASK_ENV", "development").lower()
@@ -17,11 +18,6 @@ MP_ACCESS_TOKEN = os.getenv("MP_ACCESS_TOKEN" if IS_PROD else "MP_ACCESS_TOKEN_T
 MP_PUBLIC_KEY    = os.getenv("MP_PUBLIC_KEY" if IS_PROD else "MP_PUBLIC_KEY_TEST")
 mp = mercadopago.SDK(MP_ACCESS_TOKEN)
 
-# Configuración Supabase
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
 mp_checkout_bp = Blueprint('mp_checkout', __name__)
 
 @mp_checkout_bp.route('/create_preference', methods=['POST'])
@@ -106,78 +102,27 @@ def create_preference():
 @mp_checkout_bp.route('/webhook', methods=['POST'])
 def webhook():
     """
-    Webhook de Mercado Pago - Procesa notificaciones de pago.
-    IMPORTANTE: Consulta la API de MP para confirmar el estado real del pago.
+    Webhook de Mercado Pago - Registra la notificación y responde de inmediato.
+    La consulta a la API de MP (estado real del pago) y la actualización de
+    la orden las hace el worker de services/payment_webhooks.py, con dedup
+    de reintentos de MP.
     """
     try:
-        data = request.get_json() or {}
+        if not payment_webhooks.verify(request):
+            logging.warning("Webhook MP con firma inválida")
+            return jsonify({"status": "invalid_signature"}), 401
+
+        data = request.get_json(silent=True) or {}
         logging.info("Webhook MP recibido: type=%s, action=%s", data.get('type'), data.get('action'))
-        
-        # MP envía diferentes tipos de notificaciones
-        notification_type = data.get('type')
-        
-        # Solo procesamos notificaciones de pago
-        if notification_type == 'payment':
-            payment_id = data.get('data', {}).get('id')
-            
-            if not payment_id:
-                logging.warning("Webhook sin payment_id")
-                return jsonify({"status": "ignored", "reason": "no payment_id"}), 200
-            
-            # CRÍTICO: Consultar la API de MP para obtener datos REALES del pago
-            # No confiar solo en los datos del webhook
-            token = current_app.config.get("MP_ACCESS_TOKEN") or os.getenv("MP_ACCESS_TOKEN")
-            mp_sdk = mercadopago.SDK(token)
-            
-            payment_response = mp_sdk.payment().get(payment_id)
-            
-            if payment_response.get('status') != 200:
-                logging.error("Error consultando pago %s en MP: %s", payment_id, payment_response)
-                return jsonify({"status": "error", "reason": "mp_api_error"}), 200
-            
-            payment_data = payment_response.get('response', {})
-            
-            # Obtener external_reference (nuestro order_id)
-            ext_ref = payment_data.get('external_reference')
-            if not ext_ref:
-                logging.warning("Pago %s sin external_reference", payment_id)
-                return jsonify({"status": "ignored", "reason": "no external_reference"}), 200
-            
-            payment_status = payment_data.get('status', '')
-            transaction_id = str(payment_id)
-            
-            logging.info("Procesando pago: order_id=%s, status=%s, payment_id=%s", 
-                        ext_ref, payment_status, payment_id)
-            
-            # Mapear estado de MP a estado interno
-            status_mapping = {
-                "approved": "Completado",
-                "authorized": "Completado",
-                "pending": "Pendiente",
-                "in_process": "Pendiente",
-                "rejected": "Rechazado",
-                "cancelled": "Cancelado",
-                "refunded": "Reembolsado",
-                "charged_back": "Contracargo"
-            }
-            new_status = status_mapping.get(payment_status, "Pendiente")
-            
-            # Actualizar orden en Supabase
-            data_update = {
-                "estado_pago": new_status,
-                "transaction_id": transaction_id
-            }
-            
-            response = supabase.table("orders").update(data_update).eq("id", ext_ref).execute()
-            
-            if not response.data:
-                logging.error("No se encontró orden %s para actualizar", ext_ref)
-            else:
-                logging.info("Orden %s actualizada a '%s' (payment_id=%s)", ext_ref, new_status, payment_id)
-            
+
+        status = payment_webhooks.accept(data)
+        if status == "busy":
+            # Cola llena: MP reintenta con su propio backoff
+            return jsonify({"status": status}), 503
+
         # Siempre responder 200 para que MP no reintente
-        return jsonify({"status": "ok"}), 200
-        
+        return jsonify({"status": status}), 200
+
     except Exception as e:
         # Log del error pero NO exponerlo
         logging.exception("Error procesando webhook de MP")
@@ -1,41 +1,49 @@
 from flask import Blueprint, render_template, abort, current_app
 
+from ..services.catalog_cache import catalog
+
 products_bp = Blueprint('products', __name__, url_prefix='/product')
 
+_PUBLIC_FIELDS = (
+    "id, nombre, descripcion, precio, descuento_pct, precio_descuento, "
+    "tipo_producto, genero, tipo_oro, imagen, stock_total, destacado, created_at"
+)
+
 @products_bp.route('/<int:product_id>', methods=['GET'])
 def product_detail(product_id):
     """
     Muestra la página de detalle de un producto específico.
+    Lee del snapshot del catálogo; si el producto no está ahí (p. ej. recién
+    creado en otro worker) cae a Supabase como antes.
     """
     supabase = current_app.supabase
-    _PUBLIC_FIELDS = (
-        "id, nombre, descripcion, precio, descuento_pct, precio_descuento, "
-        "tipo_producto, genero, tipo_oro, imagen, stock_total, destacado, created_at"
-    )
-    response = supabase.table('products').select(_PUBLIC_FIELDS).eq('id', product_id).single().execute()
-    
-    if not response.data:
-        abort(404, description="Producto no encontrado")
-
-    product = response.data
-    if not product.get("activo", True):
-        abort(404, description="Producto no encontrado")
-
-    # 🔄 MVP 1: Cargar imágenes múltiples del producto desde product_images
-    images_resp = supabase.table('product_images')\
-        .select('*')\
-        .eq('product_id', product_id)\
-        .order('orden')\
-        .execute()
-    product['images'] = images_resp.data or []
-
-    related_resp = supabase.table('products')\
-                    .select('id, nombre, precio, descuento_pct, precio_descuento, tipo_producto, imagen, product_images(imagen,orden)')\
-                    .eq('tipo_producto', product['tipo_producto'])\
-                    .eq('activo', True)\
-                    .neq('id', product_id)\
-                    .limit(4)\
-                    .execute()
-    related_products = related_resp.data if related_resp.data else []
-    
+    cached = catalog.get(supabase, product_id)
+
+    if cached is not None:
+        # Copia: el template recibe 'images' y el dict del snapshot es compartido
+        product = dict(cached)
+        product['images'] = cached.get('product_images') or []
+    else:
+        response = supabase.table('products').select(_PUBLIC_FIELDS).eq('id', product_id).single().execute()
+
+        if not response.data:
+            abort(404, description="Producto no encontrado")
+
+        product = response.data
+        if not product.get("activo", True):
+            abort(404, description="Producto no encontrado")
+
+        # 🔄 MVP 1: Cargar imágenes múltiples del producto desde product_images
+        images_resp = supabase.table('product_images')\
+            .select('*')\
+            .eq('product_id', product_id)\
+            .order('orden')\
+            .execute()
+        product['images'] = images_resp.data or []
+
+    related_products = [
+        p for p in catalog.products(supabase)
+        if p.get('tipo_producto') == product.get('tipo_producto') and p['id'] != product_id
+    ][:4]
+
     return render_template('product.html', product=product, related_products=related_products)
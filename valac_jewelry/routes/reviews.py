@@ -5,7 +5,6 @@ Blueprint público de reseñas: API JSON + página /reseñas.
 
 import logging
 import re
-import uuid
 from datetime import datetime, timezone
 
 from flask import (
@@ -17,6 +16,21 @@ from flask import (
     session,
 )
 
+from ..services.review_listing import (
+    ReviewFilters,
+    decode_cursor,
+    encode_cursor,
+    fetch_after,
+    fetch_featured,
+    fetch_page,
+    invalidate_review_listing,
+)
+from ..services.review_media import media
+from ..services.schema_errors import is_missing_column
+from ..services.rate_limit import client_ip, review_posts
+from ..services.review_stats import get_review_stats, invalidate_review_stats
+from ..services.review_votes import DuplicateVote, ReviewNotFound, votes
+
 logger = logging.getLogger(__name__)
 
 reviews_bp = Blueprint("reviews", __name__)
@@ -29,8 +43,7 @@ MAX_PHOTO_SIZE = 10 * 1024 * 1024   # 10 MB
 MAX_VIDEO_SIZE = 50 * 1024 * 1024   # 50 MB
 MAX_FILES = 6
 EMAIL_RE = re.compile(r"^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$")
-STORAGE_BUCKET = "CatalogoJoyasValacJoyas"
-STORAGE_PREFIX = "products/reviews"
+STATS_MAX_AGE = 60  # segundos de caché HTTP de /api/reviews/stats
 
 
 # ── Helpers ─────────────────────────────────────────────────
@@ -80,8 +93,14 @@ def _ext(filename: str) -> str:
 def _serialize_review(r: dict) -> dict:
     """Transforma row de Supabase a formato público JSON."""
     cdn = current_app.config.get("CDN_BASE_URL", "")
-    media = r.get("media_urls") or []
-    media_full = [f"{cdn}{u}" if not u.startswith("http") else u for u in media]
+
+    def full(u: str) -> str:
+        return f"{cdn}{u}" if u and not u.startswith("http") else u
+
+    media_urls = r.get("media_urls") or []
+    # Miniatura/póster paralela a media_urls ('' si no hay; migración 013)
+    thumbs = list(r.get("media_thumbs") or [])
+    thumbs += [""] * (len(media_urls) - len(thumbs))
     return {
         "id": r["id"],
         "nombre": _abreviar_nombre(r.get("nombre", "")),
@@ -89,7 +108,8 @@ def _serialize_review(r: dict) -> dict:
         "product_id": r.get("product_id"),
         "estrellas": r.get("estrellas", 5),
         "texto": r.get("texto", ""),
-        "media_urls": media_full,
+        "media_urls": [full(u) for u in media_urls],
+        "media_thumbs": [full(t) for t in thumbs[:len(media_urls)]],
         "util_count": r.get("util_count", 0),
         "fecha_relativa": _fecha_relativa(r.get("created_at", "")),
         "verificado": r.get("verificado", False),
@@ -97,57 +117,34 @@ def _serialize_review(r: dict) -> dict:
 
 
 def _get_client_ip() -> str:
-    """IP real detrás de proxy."""
-    return request.headers.get("X-Forwarded-For", request.remote_addr or "").split(",")[0].strip()
-
-
-def _count_reviews_today(sb, ip: str) -> int:
-    """Cuenta reseñas enviadas hoy desde esta IP."""
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%dT00:00:00+00:00")
-    try:
-        resp = (
-            sb.table("reviews")
-            .select("id", count="exact")
-            .eq("ip_address", ip)
-            .gte("created_at", today)
-            .execute()
-        )
-        return resp.count or 0
-    except Exception:
-        return 0
+    """IP real detrás de proxy (la que agregó nuestro proxy, no la del cliente)."""
+    return client_ip(request)
 
 
 # ── GET /api/reviews/ ───────────────────────────────────────
 
 @reviews_bp.route("/api/reviews/", methods=["GET"])
 def list_reviews():
-    """Lista reseñas verificadas con paginación y filtros."""
+    """Lista reseñas verificadas con paginación y filtros.
+
+    ?page=N devuelve total y has_more (una consulta con count); ?cursor=
+    (el next_cursor de la respuesta anterior) pide las siguientes sin contar."""
     sb = current_app.supabase
 
     page = max(1, request.args.get("page", 1, type=int))
     per_page = min(18, max(1, request.args.get("per_page", 9, type=int)))
-    product_id = request.args.get("product_id", type=int)
-    estrellas = request.args.get("estrellas", type=int)
-    con_media = request.args.get("con_media", "").lower() in ("1", "true")
+    cursor = request.args.get("cursor")
     featured = request.args.get("featured", "").lower() in ("1", "true")
-
-    offset = (page - 1) * per_page
+    filters = ReviewFilters(
+        product_id=request.args.get("product_id", type=int),
+        estrellas=request.args.get("estrellas", type=int),
+        con_media=request.args.get("con_media", "").lower() in ("1", "true"),
+    )
 
     try:
-        # Datos
-        q = sb.table("reviews").select("*").eq("verificado", "true")
-        if product_id:
-            q = q.eq("product_id", product_id)
-        if estrellas and 1 <= estrellas <= 5:
-            q = q.eq("estrellas", estrellas)
-        if con_media:
-            q = q.neq("media_urls", "{}")
-
         if featured:
             # Home mode: solo top 6, sin paginación ni count extra
-            q = q.order("estrellas", desc=True).order("created_at", desc=True).limit(6)
-            resp = q.execute()
-            reviews = [_serialize_review(r) for r in (resp.data or [])]
+            reviews = [_serialize_review(r) for r in fetch_featured(sb, filters)]
             return jsonify({
                 "reviews": reviews,
                 "total": len(reviews),
@@ -155,25 +152,24 @@ def list_reviews():
                 "has_more": False,
             })
 
-        # Conteo total (solo para paginación, no featured)
-        count_q = sb.table("reviews").select("id", count="exact").eq("verificado", "true")
-        if product_id:
-            count_q = count_q.eq("product_id", product_id)
-        if estrellas and 1 <= estrellas <= 5:
-            count_q = count_q.eq("estrellas", estrellas)
-        count_resp = count_q.execute()
-        total = count_resp.count or 0
-
-        q = q.order("created_at", desc=True).range(offset, offset + per_page - 1)
-        resp = q.execute()
-        reviews = [_serialize_review(r) for r in (resp.data or [])]
-
-        return jsonify({
-            "reviews": reviews,
-            "total": total,
-            "page": page,
-            "has_more": (offset + per_page) < total,
-        })
+        if cursor:
+            try:
+                after = decode_cursor(cursor)
+            except ValueError:
+                return jsonify({"error": "Cursor inválido"}), 400
+            rows, has_more = fetch_after(sb, filters, after, per_page)
+            body = {"reviews": [_serialize_review(r) for r in rows], "has_more": has_more}
+        else:
+            rows, total = fetch_page(sb, filters, page, per_page)
+            has_more = (page - 1) * per_page + len(rows) < total
+            body = {
+                "reviews": [_serialize_review(r) for r in rows],
+                "total": total,
+                "page": page,
+                "has_more": has_more,
+            }
+        body["next_cursor"] = encode_cursor(rows[-1]) if rows and has_more else None
+        return jsonify(body)
     except Exception as e:
         logger.exception("Error al listar reseñas: %s", e)
         return jsonify({"error": "Error al obtener reseñas"}), 500
@@ -188,35 +184,20 @@ def review_stats():
     product_id = request.args.get("product_id", type=int)
 
     try:
-        q = sb.table("reviews").select("estrellas").eq("verificado", "true")
-        if product_id:
-            q = q.eq("product_id", product_id)
-        resp = q.execute()
-        rows = resp.data or []
-
-        total = len(rows)
-        if total == 0:
-            return jsonify({
-                "total": 0,
-                "promedio": 0,
-                "distribucion": {str(i): 0 for i in range(1, 6)},
-            })
-
-        dist = {str(i): 0 for i in range(1, 6)}
-        for r in rows:
-            dist[str(r["estrellas"])] = dist.get(str(r["estrellas"]), 0) + 1
-
-        promedio = sum(r["estrellas"] for r in rows) / total
-
-        return jsonify({
-            "total": total,
-            "promedio": round(promedio, 1),
-            "distribucion": dist,
-        })
+        stats = get_review_stats(sb, product_id)
     except Exception as e:
         logger.exception("Error al obtener stats de reseñas: %s", e)
         return jsonify({"error": "Error al obtener estadísticas"}), 500
 
+    resp = jsonify(stats)
+    # El widget la pide en home, producto y /resenas: el navegador/CDN la
+    # reutiliza un minuto y revalida con ETag (304 si no cambió)
+    resp.headers["Cache-Control"] = (
+        f"public, max-age={STATS_MAX_AGE}, stale-while-revalidate={STATS_MAX_AGE * 5}"
+    )
+    resp.add_etag()
+    return resp.make_conditional(request)
+
 
 # ── POST /api/reviews/ ──────────────────────────────────────
 
@@ -225,10 +206,12 @@ def create_review():
     """Recibe reseña con archivos media (multipart/form-data)."""
     sb = current_app.supabase
 
-    # ── Rate limiting por IP (3 por día) ─────────────
+    # ── Rate limiting por IP (3 en 24 h) ─────────────
+    # Aquí sólo se consulta; el cupo se gasta al insertar la reseña
     ip = _get_client_ip()
-    if _count_reviews_today(sb, ip) >= 3:
-        return jsonify({"error": "Has alcanzado el límite de reseñas por hoy. Intenta mañana."}), 429
+    limit = review_posts.check(ip)
+    if not limit.allowed:
+        return jsonify({"error": "Has alcanzado el límite de reseñas por hoy. Intenta mañana."}), 429, limit.headers
 
     # ── Validar campos ───────────────────────────────
     nombre = (request.form.get("nombre") or "").strip()
@@ -260,12 +243,13 @@ def create_review():
     if errors:
         return jsonify({"error": " ".join(errors)}), 400
 
-    # ── Validar y subir archivos ─────────────────────
+    # ── Validar archivos ─────────────────────────────
+    # Se procesan y suben en segundo plano (services/review_media.py)
     files = request.files.getlist("media")
     if len(files) > MAX_FILES:
         return jsonify({"error": f"Máximo {MAX_FILES} archivos permitidos."}), 400
 
-    media_paths: list[str] = []
+    uploads: list[tuple[str, bytes]] = []
     for f in files:
         if not f or not f.filename:
             continue
@@ -279,28 +263,7 @@ def create_review():
             return jsonify({"error": f"La imagen {f.filename} excede 10 MB."}), 400
         if ext in VIDEO_EXTENSIONS and len(content) > MAX_VIDEO_SIZE:
             return jsonify({"error": f"El video {f.filename} excede 50 MB."}), 400
-
-        # Generar nombre seguro y subir
-        safe_name = f"review_{uuid.uuid4().hex[:12]}_{uuid.uuid4().hex[:6]}.{ext}"
-        storage_path = f"{STORAGE_PREFIX}/{safe_name}"  # products/reviews/xxx.jpg (bucket path)
-        cdn_path = f"reviews/{safe_name}"  # reviews/xxx.jpg (CDN_BASE_URL ya incluye products/)
-
-        mime_map = {
-            "jpg": "image/jpeg", "jpeg": "image/jpeg",
-            "png": "image/png", "webp": "image/webp",
-            "mp4": "video/mp4", "mov": "video/quicktime",
-        }
-
-        try:
-            sb.storage.from_(STORAGE_BUCKET).upload(
-                storage_path,
-                content,
-                {"content-type": mime_map.get(ext, "application/octet-stream")},
-            )
-            media_paths.append(cdn_path)
-        except Exception as upload_err:
-            logger.exception("Error subiendo archivo %s: %s", safe_name, upload_err)
-            return jsonify({"error": "Error al subir archivos. Intenta de nuevo."}), 500
+        uploads.append((ext, content))
 
     # ── Check auto-approve setting ──────────────────
     auto_approve = False
@@ -319,53 +282,77 @@ def create_review():
         "product_id": product_id,
         "estrellas": estrellas,
         "texto": texto,
-        "media_urls": media_paths,
+        "media_urls": [],
         "verificado": auto_approve,
         "ip_address": ip,
     }
+    if uploads:
+        review_data["media_status"] = "pending"
 
     status_msg = "publicada" if auto_approve else "pendiente de aprobación"
 
+    token = None
     try:
-        sb.table("reviews").insert(review_data).execute()
-        logger.info("Reseña creada (auto_approve=%s) para producto=%s, ip=%s", auto_approve, producto, ip)
-        return jsonify({
-            "success": True,
-            "message": f"¡Gracias! Tu reseña ha sido enviada y está {status_msg}.",
-        }), 201
+        if uploads:
+            token = media.spool(uploads)
+        try:
+            resp = sb.table("reviews").insert(review_data).execute()
+        except Exception as e:
+            if not is_missing_column(e):
+                raise
+            review_data.pop("media_status", None)
+            resp = sb.table("reviews").insert(review_data).execute()
+        review_id = resp.data[0]["id"]
     except Exception as e:
+        if token:
+            media.discard(token)
         logger.exception("Error al insertar reseña: %s", e)
         return jsonify({"error": "Error al guardar la reseña. Intenta de nuevo."}), 500
 
+    review_posts.hit(ip)
+    if token:
+        try:
+            media.submit(token, review_id)
+        except Exception:
+            # La reseña ya está guardada: el media queda como error de fondo
+            logger.exception("No se pudo encolar el media de la reseña %s", review_id)
+            media.mark_failed(review_id)
+    if auto_approve:
+        invalidate_review_stats()
+        invalidate_review_listing()
+    logger.info("Reseña creada (auto_approve=%s) para producto=%s, ip=%s", auto_approve, producto, ip)
+    return jsonify({
+        "success": True,
+        "message": f"¡Gracias! Tu reseña ha sido enviada y está {status_msg}.",
+    }), 201
+
 
 # ── POST /api/reviews/<id>/util ─────────────────────────────
 
 @reviews_bp.route("/api/reviews/<int:review_id>/util", methods=["POST"])
 def vote_util(review_id: int):
-    """Incrementa el contador de 'útil' de una reseña (1 voto por reseña por sesión)."""
+    """Suma un voto 'útil' (1 por reseña por sesión y por IP). El incremento
+    se aplica en lote; ver services/review_votes.py."""
     # Rate limit: 1 voto por reseña por sesión
     voted: list = session.get("reviews_voted", [])
     if review_id in voted:
         return jsonify({"error": "Ya votaste esta reseña."}), 429
 
-    sb = current_app.supabase
     try:
-        # Verificar que existe y está verificada
-        resp = sb.table("reviews").select("util_count").eq("id", review_id).eq("verificado", "true").execute()
-        if not resp.data:
-            return jsonify({"error": "Reseña no encontrada."}), 404
-
-        new_count = (resp.data[0].get("util_count") or 0) + 1
-        sb.table("reviews").update({"util_count": new_count}).eq("id", review_id).execute()
-
-        voted.append(review_id)
-        session["reviews_voted"] = voted
-
-        return jsonify({"util_count": new_count})
+        new_count = votes.vote(review_id, _get_client_ip())
+    except ReviewNotFound:
+        return jsonify({"error": "Reseña no encontrada."}), 404
+    except DuplicateVote:
+        return jsonify({"error": "Ya votaste esta reseña."}), 429
     except Exception as e:
         logger.exception("Error al votar útil: %s", e)
         return jsonify({"error": "Error al registrar voto."}), 500
 
+    voted.append(review_id)
+    session["reviews_voted"] = voted[-200:]
+
+    return jsonify({"util_count": new_count})
+
 
 # ── GET /resenas ─────────────────────────────────────────────
 
@@ -0,0 +1,135 @@
+# valac_jewelry/services/analytics_ingest.py
+"""
+Ingesta asíncrona de los beacons de analytics (/admin/analytics/t/*).
+
+Los endpoints de tracking sólo encolan el evento y responden 204. Un thread
+de fondo vacía la cola en lotes (cada ANALYTICS_BATCH_SIZE eventos o cada
+ANALYTICS_FLUSH_MS), resuelve la ubicación de cada IP una sola vez por lote
+y hace un insert masivo por tabla.
+
+La cola es acotada: si se llena (Supabase caído o lento) el beacon se
+descarta y se cuenta en metrics ("analytics.dropped") en lugar de frenar
+los threads de gunicorn. Al apagar el proceso se vacía lo pendiente.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+Event = Tuple[str, Dict[str, Any], Optional[str]]  # (tabla, fila, ip)
+_STOP = object()
+
+
+class AnalyticsIngest:
+    def __init__(self, maxsize: int = 5000, batch_size: int = 200, flush_ms: int = 2000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self._queue: "queue.Queue" = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._sb = None
+        self._locate: Callable[[Optional[str]], Dict[str, Any]] = lambda ip: {"ip": ip}
+
+    def init_app(self, app, locate: Callable[[Optional[str]], Dict[str, Any]]) -> None:
+        self.batch_size = int(app.config.get("ANALYTICS_BATCH_SIZE", self.batch_size))
+        self.flush_interval = int(app.config.get("ANALYTICS_FLUSH_MS", 2000)) / 1000
+        self._queue = queue.Queue(maxsize=int(app.config.get("ANALYTICS_QUEUE_SIZE", 5000)))
+        self._sb = app.supabase
+        self._locate = locate
+        atexit.register(self.shutdown)
+
+    # ── Productores (threads de request) ─────────────
+
+    def enqueue(self, table: str, row: Dict[str, Any], ip: Optional[str] = None) -> bool:
+        """Encola una fila; False si la cola está llena y se descartó."""
+        self._ensure_worker()
+        row.setdefault("timestamp", datetime.now(timezone.utc).isoformat())
+        try:
+            self._queue.put_nowait((table, row, ip))
+        except queue.Full:
+            metrics.incr("analytics.dropped")
+            return False
+        metrics.incr("analytics.enqueued")
+        return True
+
+    # ── Worker ───────────────────────────────────────
+
+    def _ensure_worker(self) -> None:
+        # El pid cubre el caso de un fork después de arrancar el thread
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="analytics-ingest", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        batch: List[Event] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self._flush(batch)
+                return
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, batch: List[Event]) -> None:
+        if not batch or self._sb is None:
+            return
+        start = time.perf_counter()
+        locations: Dict[Optional[str], Dict[str, Any]] = {}
+        by_table: Dict[str, List[Dict[str, Any]]] = {}
+        for table, row, ip in batch:
+            if "location" not in row:
+                if ip not in locations:
+                    locations[ip] = self._locate(ip)
+                row["location"] = locations[ip]
+            by_table.setdefault(table, []).append(row)
+
+        for table, rows in by_table.items():
+            try:
+                self._sb.table(table).insert(rows).execute()
+                metrics.incr("analytics.inserted", len(rows))
+            except Exception as e:
+                metrics.incr("analytics.failed", len(rows))
+                logger.error("Analytics: no se pudieron insertar %d filas en %s: %s", len(rows), table, e)
+        metrics.observe("analytics.flush", (time.perf_counter() - start) * 1000)
+
+    # ── Apagado ──────────────────────────────────────
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Vacía lo pendiente y detiene el worker (atexit)."""
+        thread = self._thread
+        if thread is None or not thread.is_alive() or self._pid != os.getpid():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning("Analytics: cola llena al apagar; se pierden %d eventos", self._queue.qsize())
+            return
+        thread.join(timeout)
+
+
+ingest = AnalyticsIngest()
@@ -0,0 +1,156 @@
+# valac_jewelry/services/analytics_rollups.py
+"""
+Conteos de analytics pre-agregados por día (migración 009).
+
+Los triggers de product_views / user_navigation mantienen:
+
+    analytics_daily_product_views  (day, product_id) → views
+    analytics_daily_paths          (day, path)       → hits
+    analytics_daily_locations      (day, city, region, country) → views
+
+El dashboard pide el rango completo con una sola RPC
+(analytics_rollup_summary) que devuelve un JSON con las sumas, así el costo
+depende del número de productos/paths distintos y no de las visitas.
+
+Si la migración aún no está aplicada (o ANALYTICS_SOURCE=scan) se recorren
+las tablas crudas por páginas con keyset sobre `timestamp`, contando en una
+sola pasada; el resultado tiene el mismo formato.
+"""
+from __future__ import annotations
+
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from .schema_errors import is_missing_function
+
+logger = logging.getLogger(__name__)
+
+LocationKey = Tuple[str, str, str]  # (city, region, country); '' = desconocido
+LocationExtractor = Callable[[Any], Tuple[Optional[str], Optional[str], Optional[str]]]
+
+
+@dataclass
+class RollupSummary:
+    product_views: Counter = field(default_factory=Counter)   # product_id → vistas (0 = sin id)
+    paths: Counter = field(default_factory=Counter)           # path → hits
+    locations: Counter = field(default_factory=Counter)       # (city, region, country) → vistas
+    source: str = "rollup"
+
+    @property
+    def total_views(self) -> int:
+        return sum(self.product_views.values())
+
+
+def rollup_days(dt_from: Optional[datetime], dt_to: Optional[datetime]) -> Tuple[Optional[date], Optional[date]]:
+    """Convierte el rango de _parse_date_range (fin exclusivo) a días UTC
+    inclusivos. Los rollups son diarios: ?days=N cubre días completos."""
+    d_from = dt_from.date() if dt_from else None
+    d_to = (dt_to - timedelta(microseconds=1)).date() if dt_to else None
+    return d_from, d_to
+
+
+def load_summary(
+    sb,
+    dt_from: Optional[datetime],
+    dt_to: Optional[datetime],
+    extract_location: LocationExtractor,
+    source: str = "rollup",
+    page_size: int = 1000,
+) -> RollupSummary:
+    """Conteos del rango desde los rollups; con source="scan", o si la
+    migración no está aplicada, lectura paginada de las tablas crudas."""
+    if source == "scan":
+        return scan_summary(sb, dt_from, dt_to, extract_location, page_size)
+    d_from, d_to = rollup_days(dt_from, dt_to)
+    try:
+        resp = sb.rpc("analytics_rollup_summary", {
+            "p_from": d_from.isoformat() if d_from else None,
+            "p_to": d_to.isoformat() if d_to else None,
+        }).execute()
+    except Exception as e:
+        if not is_missing_function(e):
+            raise
+        logger.warning("Rollups de analytics no disponibles (¿migración 009?); escaneando tablas crudas")
+        return scan_summary(sb, dt_from, dt_to, extract_location, page_size)
+    return _from_rpc(resp.data or {})
+
+
+def _from_rpc(data: Dict[str, Any]) -> RollupSummary:
+    summary = RollupSummary()
+    for pid, views in (data.get("product_views") or {}).items():
+        summary.product_views[int(pid)] = int(views)
+    for path, hits in (data.get("paths") or {}).items():
+        summary.paths[path] = int(hits)
+    for city, region, country, views in data.get("locations") or []:
+        summary.locations[(city or "", region or "", country or "")] += int(views)
+    return summary
+
+
+# ── Lectura paginada de las tablas crudas ──────────────
+
+def iter_rows(
+    sb,
+    table: str,
+    columns: str,
+    order: Tuple[str, ...],
+    dt_from: Optional[datetime],
+    dt_to: Optional[datetime],
+    page_size: int = 1000,
+) -> Iterator[Dict[str, Any]]:
+    """Recorre `table` en orden de timestamp con keyset pagination.
+
+    Cada página pide timestamp >= el último visto y se salta (offset) las
+    filas de ese mismo timestamp que ya salieron. Para que el salto sea
+    exacto, `order` desempata por las columnas que se cuentan: dos filas
+    iguales en ellas son intercambiables para los conteos. Sólo hay una
+    página en memoria a la vez."""
+    last_ts: Optional[str] = None
+    ties = 0
+    while True:
+        q = sb.table(table).select(f"timestamp, {columns}")
+        if last_ts is not None:
+            q = q.gte("timestamp", last_ts)
+        elif dt_from:
+            q = q.gte("timestamp", dt_from.isoformat())
+        if dt_to:
+            q = q.lte("timestamp", dt_to.isoformat())
+        q = q.order("timestamp")
+        for col in order:
+            q = q.order(col)
+        rows = q.range(ties, ties + page_size - 1).execute().data or []
+        for row in rows:
+            ts = row.get("timestamp")
+            if ts == last_ts:
+                ties += 1
+            else:
+                last_ts, ties = ts, 1
+            yield row
+        if len(rows) < page_size:
+            return
+
+
+def scan_summary(
+    sb,
+    dt_from: Optional[datetime],
+    dt_to: Optional[datetime],
+    extract_location: LocationExtractor,
+    page_size: int = 1000,
+) -> RollupSummary:
+    """Conteos en una pasada sobre las tablas crudas; la memoria depende
+    de los productos/paths/ubicaciones distintos, no de las filas."""
+    summary = RollupSummary(source="scan")
+    product_views, locations, paths = summary.product_views, summary.locations, summary.paths
+
+    for row in iter_rows(sb, "product_views", "product_id, location", ("product_id", "location"),
+                         dt_from, dt_to, page_size):
+        product_views[row.get("product_id") or 0] += 1
+        city, region, country = extract_location(row.get("location"))
+        locations[(city or "", region or "", country or "")] += 1
+
+    for row in iter_rows(sb, "user_navigation", "path", ("path",), dt_from, dt_to, page_size):
+        if row.get("path"):
+            paths[row["path"]] += 1
+    return summary
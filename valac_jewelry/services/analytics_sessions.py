@@ -0,0 +1,121 @@
+# valac_jewelry/services/analytics_sessions.py
+"""
+Rollups del funnel por sesión (migración 010).
+
+run_sessionization() lee user_navigation en orden de tiempo (keyset,
+una página en memoria), arma las sesiones con services/sessionizer.py y
+reemplaza los días del rango con la RPC store_session_rollups, que sólo
+puede ejecutar el service role (clients.service). Lo corre
+scripts/sessionize_analytics.py (cron diario, o a mano para rehacer días).
+
+load_session_summary() es lo que lee el dashboard: una RPC con las sumas
+del rango, o None si la migración no está aplicada.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .analytics_rollups import iter_rows, rollup_days
+from .path_classifier import FUNNEL_STAGES
+from .schema_errors import is_missing_function
+from .supabase_clients import clients
+from .sessionizer import MAX_SESSION, SESSION_GAP, TTP_LABELS, DayStats, sessionize_days
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_ts(value: str) -> datetime:
+    ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def navigation_events(sb, dt_from: datetime, dt_to: datetime, page_size: int = 1000) -> Iterator[Tuple[str, datetime, str]]:
+    for row in iter_rows(sb, "user_navigation", "session_id, path", ("session_id", "path"),
+                         dt_from, dt_to, page_size):
+        ts = row.get("timestamp")
+        if ts:
+            yield row.get("session_id"), _parse_ts(ts), row.get("path") or ""
+
+
+def _day_payload(day: date, stats: DayStats) -> Dict[str, Any]:
+    return {
+        "day": day.isoformat(),
+        "sessions": stats.sessions,
+        "converted": stats.converted,
+        "ttp_sum_s": round(stats.ttp_sum, 3),
+        "ttp_hist": stats.ttp_hist,
+        "steps": [
+            {"step": i, "stage": stage["name"],
+             "sessions": stats.stage_sessions[i], "from_prev": stats.step_sessions[i]}
+            for i, stage in enumerate(FUNNEL_STAGES)
+        ],
+        "products": [
+            [pid, viewed, stats.product_converted.get(pid, 0)]
+            for pid, viewed in stats.product_viewed.items()
+        ],
+    }
+
+
+def run_sessionization(sb, day_from: date, day_to: date, page_size: int = 1000, **kwargs) -> Dict[date, DayStats]:
+    """Recalcula y guarda los rollups de sesión de [day_from, day_to] (UTC)."""
+    start = datetime.combine(day_from, time.min, tzinfo=timezone.utc) - SESSION_GAP
+    end = datetime.combine(day_to + timedelta(days=1), time.min, tzinfo=timezone.utc) + MAX_SESSION
+    days = sessionize_days(navigation_events(sb, start, end, page_size), day_from, day_to, **kwargs)
+    clients.service.rpc("store_session_rollups", {
+        "p_from": day_from.isoformat(),
+        "p_to": day_to.isoformat(),
+        "p_data": [_day_payload(day, stats) for day, stats in sorted(days.items())],
+    }).execute()
+    return days
+
+
+def load_session_summary(sb, dt_from: Optional[datetime], dt_to: Optional[datetime], products: int = 20) -> Optional[Dict[str, Any]]:
+    """Funnel por sesión del rango para el dashboard, o None sin migración 010."""
+    d_from, d_to = rollup_days(dt_from, dt_to)
+    try:
+        resp = sb.rpc("analytics_session_summary", {
+            "p_from": d_from.isoformat() if d_from else None,
+            "p_to": d_to.isoformat() if d_to else None,
+            "p_products": products,
+        }).execute()
+    except Exception as e:
+        if not is_missing_function(e):
+            raise
+        return None
+    data = resp.data or {}
+
+    sessions = int(data.get("sessions") or 0)
+    converted = int(data.get("converted") or 0)
+    steps: List[Dict[str, Any]] = []
+    prev_sessions = None
+    for row in data.get("steps") or []:
+        reached = int(row.get("sessions") or 0)
+        from_prev = int(row.get("from_prev") or 0)
+        steps.append({
+            "name": row.get("stage"),
+            "sessions": reached,
+            "from_prev": from_prev,
+            # Conversión real paso a paso: de quienes llegaron a la etapa
+            # anterior, cuántos llegaron después a ésta
+            "rate": (from_prev / prev_sessions * 100) if prev_sessions else None,
+        })
+        prev_sessions = reached
+
+    hist = [int(n) for n in data.get("ttp_hist") or []]
+    return {
+        "sessions": sessions,
+        "converted": converted,
+        "conversion_rate": (converted / sessions * 100) if sessions else 0.0,
+        "avg_ttp_min": (float(data.get("ttp_sum_s") or 0) / converted / 60) if converted else None,
+        "ttp_hist": [{"label": label, "count": hist[i] if i < len(hist) else 0}
+                     for i, label in enumerate(TTP_LABELS)],
+        "steps": steps,
+        "products": [
+            {"product_id": int(pid), "viewed": int(viewed), "converted": int(conv),
+             "dropoff": int(viewed) - int(conv),
+             "dropoff_rate": ((int(viewed) - int(conv)) / int(viewed) * 100) if int(viewed) else 0.0}
+            for pid, viewed, conv in data.get("products") or []
+        ],
+    }
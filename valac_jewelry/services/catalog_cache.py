@@ -0,0 +1,167 @@
+# valac_jewelry/services/catalog_cache.py
+"""
+Snapshot en memoria del catálogo activo (products + product_images).
+
+Las vistas públicas (home, colección, detalle y anillos de compromiso) leen de
+aquí en lugar de consultar Supabase en cada request. SupabaseProductAdmin y la
+carga masiva invalidan el snapshot después de cada escritura; el TTL cubre los
+cambios hechos por fuera de la app (scripts, SQL Editor) y por otros workers.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .schema_errors import is_missing_column
+
+logger = logging.getLogger(__name__)
+
+# Columnas públicas (sin costos de inventario) + galería embebida
+BASE_FIELDS = (
+    "id, nombre, descripcion, precio, descuento_pct, precio_descuento, "
+    "tipo_producto, genero, tipo_oro, imagen, stock_total, destacado, created_at, "
+)
+RANKING_FIELDS = "ventas, valoracion, num_resenas, "  # migración 008
+IMAGES_FIELDS = "product_images ( id, product_id, imagen, orden, object_position )"
+CATALOG_FIELDS = BASE_FIELDS + RANKING_FIELDS + IMAGES_FIELDS
+PAGE_SIZE = 1000  # límite por defecto de PostgREST
+
+
+class CatalogSnapshot:
+    """
+    Lista inmutable de productos activos, ordenada por created_at desc,
+    más un índice por id. Se reconstruye completa al expirar el TTL o tras
+    `invalidate()`; mientras tanto los lectores comparten la misma lista.
+    """
+
+    def __init__(self, ttl: int = 300, retry_interval: int = 30):
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._products: List[Dict[str, Any]] = []
+        self._by_id: Dict[int, Dict[str, Any]] = {}
+        self._current: Tuple[int, List[Dict[str, Any]]] = (0, [])
+        self._loaded_at = 0.0
+        self._retry_at = 0.0
+        self._stale = True
+        self._fields = CATALOG_FIELDS
+        self.version = 0
+
+    # ── Lectura ──────────────────────────────────────
+
+    def products(self, sb) -> List[Dict[str, Any]]:
+        """Productos activos. No mutar los dicts: se comparten entre requests."""
+        self._ensure_fresh(sb)
+        return self._products
+
+    def versioned(self, sb) -> Tuple[int, List[Dict[str, Any]]]:
+        """(versión, productos) de forma atómica, para índices derivados."""
+        self._ensure_fresh(sb)
+        return self._current
+
+    def get(self, sb, product_id: int) -> Optional[Dict[str, Any]]:
+        """Producto activo por id, o None si no está en el snapshot."""
+        self._ensure_fresh(sb)
+        return self._by_id.get(product_id)
+
+    # ── Invalidación ─────────────────────────────────
+
+    def invalidate(self) -> None:
+        """Marca el snapshot como viejo; el siguiente lector lo reconstruye
+        (también durante el backoff de un refresh fallido)."""
+        self._stale = True
+        self._retry_at = 0.0
+        logger.debug("Catálogo invalidado (versión %s)", self.version)
+
+    # ── Internos ─────────────────────────────────────
+
+    def _is_fresh(self) -> bool:
+        now = time.monotonic()
+        if now < self._retry_at:
+            # Tras un refresh fallido se sirve la versión anterior hasta
+            # retry_interval en lugar de reintentar en cada request
+            return True
+        return not self._stale and (now - self._loaded_at) < self.ttl
+
+    def _ensure_fresh(self, sb) -> None:
+        if self._is_fresh():
+            return
+        with self._lock:
+            if self._is_fresh():
+                return
+            # Se limpia antes de leer: una invalidación durante la carga
+            # vuelve a marcarlo y fuerza otra reconstrucción.
+            self._stale = False
+            try:
+                rows = self._fetch(sb)
+            except Exception as e:
+                self._stale = True
+                if not self.version:
+                    raise
+                self._retry_at = time.monotonic() + self.retry_interval
+                logger.warning("No se pudo refrescar el catálogo, sirviendo versión %s por %ss: %s",
+                               self.version, self.retry_interval, e)
+                return
+
+            for row in rows:
+                imgs = row.get("product_images") or []
+                row["product_images"] = sorted(imgs, key=lambda i: i.get("orden") or 0)
+
+            self._products = rows
+            self._by_id = {row["id"]: row for row in rows}
+            self._loaded_at = time.monotonic()
+            self.version += 1
+            self._current = (self.version, rows)
+            logger.info("Catálogo cargado: %d productos activos (versión %s)", len(rows), self.version)
+
+    def _fetch(self, sb) -> List[Dict[str, Any]]:
+        try:
+            return self._fetch_pages(sb, self._fields)
+        except Exception as e:
+            if self._fields == CATALOG_FIELDS and is_missing_column(e):
+                # Sin la migración 008 no existen ventas/valoracion: se carga
+                # igual y esos órdenes quedan con el orden por defecto.
+                logger.warning("Catálogo sin columnas de ranking (¿falta migración 008?): %s", e)
+                self._fields = BASE_FIELDS + IMAGES_FIELDS
+                return self._fetch_pages(sb, self._fields)
+            raise
+
+    def _fetch_pages(self, sb, fields: str) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        offset = 0
+        while True:
+            resp = (
+                sb.table("products")
+                .select(fields)
+                .eq("activo", True)
+                .order("created_at", desc=True)
+                .order("id", desc=True)  # desempate: created_at no es único
+                .range(offset, offset + PAGE_SIZE - 1)
+                .execute()
+            )
+            batch = resp.data or []
+            rows.extend(batch)
+            if len(batch) < PAGE_SIZE:
+                return rows
+            offset += PAGE_SIZE
+
+
+catalog = CatalogSnapshot()
+
+# Cachés derivados de products que no leen del snapshot (p. ej. los precios
+# del checkout) y deben vaciarse en el mismo momento
+_invalidation_hooks: List[Callable[[], None]] = []
+
+
+def on_catalog_invalidate(hook: Callable[[], None]) -> Callable[[], None]:
+    _invalidation_hooks.append(hook)
+    return hook
+
+
+def invalidate_catalog() -> None:
+    """Atajo para las vistas admin que escriben en products/product_images."""
+    catalog.invalidate()
+    for hook in _invalidation_hooks:
+        hook()
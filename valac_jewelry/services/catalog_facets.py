@@ -0,0 +1,181 @@
+# valac_jewelry/services/catalog_facets.py
+"""
+Conteos por faceta para el panel de filtros de /collection.
+
+Por cada versión del CatalogSnapshot se arma un bitset (un int de Python,
+bit i = producto en la posición i del snapshot) por cada categoría, tipo de
+oro, género y rango de precio. Contar cuántos productos deja una opción es
+un AND de bitsets y un popcount, sin recorrer el catálogo.
+
+Los conteos son "disjuntivos": los de una faceta se calculan con todos los
+filtros activos menos el de esa misma faceta, así el cliente ve cuántos
+productos quedarían si cambia de opción.
+"""
+from __future__ import annotations
+
+import bisect
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Rangos de precio (MXN) que se muestran en el panel: [min, max)
+PRICE_BUCKETS: Tuple[Tuple[int, Optional[int]], ...] = (
+    (0, 2000),
+    (2000, 5000),
+    (5000, 10000),
+    (10000, 20000),
+    (20000, None),
+)
+EXCLUDED_TIPO = "Anillos de Compromiso"  # tiene su propia página
+_BLOCK = 64  # granularidad de los prefijos por precio
+
+
+def _count(mask: int) -> int:
+    return bin(mask).count("1")
+
+
+def _bits(positions: Iterable[int]) -> int:
+    mask = 0
+    for i in positions:
+        mask |= 1 << i
+    return mask
+
+
+class FacetIndex:
+    """Bitsets de una versión del catálogo. Inmutable una vez construido."""
+
+    def __init__(self, products: List[Dict[str, Any]]):
+        self.positions: Dict[int, int] = {p["id"]: i for i, p in enumerate(products)}
+        self.tipo: Dict[str, int] = {}
+        self.oro: Dict[str, int] = {}
+        self.genero: Dict[str, int] = {}
+        base: List[int] = []
+        for i, p in enumerate(products):
+            tipo = p.get("tipo_producto") or ""
+            if tipo == EXCLUDED_TIPO:
+                continue
+            base.append(i)
+            bit = 1 << i
+            self.tipo[tipo] = self.tipo.get(tipo, 0) | bit
+            oro = p.get("tipo_oro") or ""
+            self.oro[oro] = self.oro.get(oro, 0) | bit
+            genero = p.get("genero") or ""
+            self.genero[genero] = self.genero.get(genero, 0) | bit
+        self.all = _bits(base)
+
+        # Posiciones ordenadas por precio + prefijos cada _BLOCK productos:
+        # un rango arbitrario se arma con dos prefijos y a lo más 2*_BLOCK bits sueltos.
+        by_price = sorted(base, key=lambda i: products[i].get("precio") or 0)
+        self._prices = [products[i].get("precio") or 0 for i in by_price]
+        self._by_price = by_price
+        self._prefix = [0]
+        for start in range(0, len(by_price), _BLOCK):
+            self._prefix.append(self._prefix[-1] | _bits(by_price[start:start + _BLOCK]))
+        self.buckets = [
+            self._slice(bisect.bisect_left(self._prices, lo),
+                        len(self._prices) if hi is None else bisect.bisect_left(self._prices, hi))
+            for lo, hi in PRICE_BUCKETS
+        ]
+
+    # ── Máscaras por filtro ──────────────────────────
+
+    def price_range(self, p_min: Optional[float], p_max: Optional[float]) -> int:
+        """Bitset de productos con p_min <= precio <= p_max."""
+        a = 0 if p_min is None else bisect.bisect_left(self._prices, p_min)
+        b = len(self._prices) if p_max is None else bisect.bisect_right(self._prices, p_max)
+        return self._slice(a, b)
+
+    def _slice(self, a: int, b: int) -> int:
+        """Bitset de los productos a..b-1 en orden de precio."""
+        if a >= b:
+            return 0
+        ba, bb = -(-a // _BLOCK), b // _BLOCK
+        if ba >= bb:
+            return _bits(self._by_price[a:b])
+        mask = self._prefix[bb] & ~self._prefix[ba]
+        return mask | _bits(self._by_price[a:ba * _BLOCK]) | _bits(self._by_price[bb * _BLOCK:b])
+
+    def _substring(self, table: Dict[str, int], needle: str) -> int:
+        """Equivalente a ILIKE '%needle%' sobre los valores distintos."""
+        needle = needle.lower()
+        mask = 0
+        for value, bits in table.items():
+            if needle in value.lower():
+                mask |= bits
+        return mask
+
+    def _generos(self, values: Iterable[str]) -> int:
+        mask = 0
+        for v in values:
+            mask |= self.genero.get(v, 0)
+        return mask
+
+    def subset(self, rows: List[Dict[str, Any]]) -> int:
+        """Bitset de un subconjunto del catálogo (p. ej. resultados de búsqueda)."""
+        pos = self.positions
+        return _bits(pos[p["id"]] for p in rows if p["id"] in pos)
+
+    # ── Conteos ──────────────────────────────────────
+
+    def counts(self, filters: Dict[str, Any], mix_unisex: bool = False,
+               within: Optional[int] = None) -> Dict[str, Any]:
+        """Conteos por opción de cada faceta para la combinación `filters`
+        (mismo formato que collection.filter_products)."""
+        scope = self.all if within is None else self.all & within
+
+        tp = filters.get("tipo_producto")
+        m_tipo = self._substring(self.tipo, tp) if tp else scope
+        to = filters.get("tipo_oro")
+        m_oro = self._substring(self.oro, to) if to else scope
+        g = filters.get("genero")
+        m_gen = self._generos(g if isinstance(g, list) else [g]) if g else scope
+        p_min, p_max = filters.get("precio_min"), filters.get("precio_max")
+        m_price = self.price_range(p_min, p_max) if (p_min is not None or p_max is not None) else scope
+
+        def without(skip: int) -> int:
+            mask = scope
+            for i, m in enumerate((m_tipo, m_oro, m_gen, m_price)):
+                if i != skip:
+                    mask &= m
+            return mask
+
+        ctx_tipo, ctx_oro, ctx_gen, ctx_price = without(0), without(1), without(2), without(3)
+
+        generos = {}
+        for value, bits in self.genero.items():
+            if mix_unisex and value in ("Hombre", "Mujer"):
+                bits |= self.genero.get("Unisex", 0)
+            generos[value] = _count(bits & ctx_gen)
+
+        return {
+            "total": _count(ctx_tipo & m_tipo),
+            # Claves en minúsculas, igual que el parámetro ?category=
+            "category": {t.lower(): _count(b & ctx_tipo) for t, b in self.tipo.items() if t},
+            "type_oro": {o: _count(b & ctx_oro) for o, b in self.oro.items() if o},
+            "genero": {v: c for v, c in generos.items() if v},
+            "price": [
+                {"min": lo, "max": hi, "count": _count(b & ctx_price)}
+                for (lo, hi), b in zip(PRICE_BUCKETS, self.buckets)
+            ],
+        }
+
+
+class FacetCache:
+    """Un FacetIndex por versión del catálogo (sólo se guarda el último)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current: Optional[Tuple[int, FacetIndex]] = None
+
+    def index(self, products: List[Dict[str, Any]], version: int) -> FacetIndex:
+        current = self._current
+        if current is not None and current[0] == version:
+            return current[1]
+        with self._lock:
+            current = self._current
+            if current is None or current[0] != version:
+                current = (version, FacetIndex(products))
+                self._current = current
+            return current[1]
+
+
+facet_cache = FacetCache()
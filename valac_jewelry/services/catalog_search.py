@@ -0,0 +1,140 @@
+# valac_jewelry/services/catalog_search.py
+"""
+Búsqueda de texto sobre el snapshot del catálogo.
+
+Índice invertido en memoria sobre nombre, descripcion, tipo_producto y
+tipo_oro, con acentos plegados ("cadena dorada" encuentra "Cadéna Doráda") y
+coincidencia por prefijo ("anill" → "anillo", "anillos"). El índice se
+sincroniza con la versión del CatalogSnapshot: sólo se reindexan los
+productos nuevos o cuyo texto cambió, y se eliminan los que ya no están.
+"""
+from __future__ import annotations
+
+import bisect
+import re
+import threading
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# Peso por campo: un match en el nombre pesa más que uno en la descripción
+FIELD_WEIGHTS = {
+    "nombre": 3.0,
+    "tipo_producto": 2.0,
+    "tipo_oro": 2.0,
+    "descripcion": 1.0,
+}
+PREFIX_FACTOR = 0.6  # un término que sólo coincide por prefijo vale menos
+STOPWORDS = frozenset({"de", "del", "la", "las", "el", "los", "y", "en", "con", "para", "por", "a", "un", "una"})
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def fold(text: str) -> str:
+    """Minúsculas y sin acentos/diacríticos (ñ → n)."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(fold(text)) if t not in STOPWORDS]
+
+
+class SearchIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[int, float]] = {}  # término → {product_id: peso}
+        self._doc_terms: Dict[int, Tuple[str, ...]] = {}
+        self._doc_sig: Dict[int, Tuple[str, ...]] = {}
+        self._vocab: List[str] = []
+        self.positions: Dict[int, int] = {}  # posición en el catálogo (desempate)
+        self.version: Optional[int] = None
+
+    # ── Construcción incremental ─────────────────────
+
+    def _sync(self, products: List[Dict[str, Any]], version: int) -> None:
+        """Alinea el índice con una versión del catálogo (con el lock tomado)."""
+        if version == self.version:
+            return
+        seen: Set[int] = set()
+        changed = False
+        for p in products:
+            pid = p["id"]
+            seen.add(pid)
+            sig = tuple(str(p.get(f) or "") for f in FIELD_WEIGHTS)
+            if self._doc_sig.get(pid) == sig:
+                continue
+            self._remove(pid)
+            self._add(pid, sig)
+            changed = True
+        for pid in [pid for pid in self._doc_sig if pid not in seen]:
+            self._remove(pid)
+            changed = True
+        if changed:
+            self._vocab = sorted(self._postings)
+        self.positions = {p["id"]: i for i, p in enumerate(products)}
+        self.version = version
+
+    def _add(self, pid: int, sig: Tuple[str, ...]) -> None:
+        weights: Dict[str, float] = {}
+        for field_text, weight in zip(sig, FIELD_WEIGHTS.values()):
+            for term in tokenize(field_text):
+                weights[term] = weights.get(term, 0.0) + weight
+        for term, w in weights.items():
+            self._postings.setdefault(term, {})[pid] = w
+        self._doc_terms[pid] = tuple(weights)
+        self._doc_sig[pid] = sig
+
+    def _remove(self, pid: int) -> None:
+        for term in self._doc_terms.pop(pid, ()):
+            docs = self._postings.get(term)
+            if docs is not None:
+                docs.pop(pid, None)
+                if not docs:
+                    del self._postings[term]
+        self._doc_sig.pop(pid, None)
+
+    # ── Consulta ─────────────────────────────────────
+
+    def _expand(self, token: str) -> Iterable[str]:
+        """Términos del vocabulario que empiezan con `token`."""
+        vocab = self._vocab
+        i = bisect.bisect_left(vocab, token)
+        while i < len(vocab) and vocab[i].startswith(token):
+            yield vocab[i]
+            i += 1
+
+    def query(self, products: List[Dict[str, Any]], version: int, query: str) -> List[Dict[str, Any]]:
+        """Productos de esa versión del catálogo que contienen todos los
+        términos de `query`, ordenados por relevancia."""
+        with self._lock:
+            self._sync(products, version)
+            return [products[self.positions[pid]] for pid in self._search(query)]
+
+    def _search(self, query: str) -> List[int]:
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        scores: Optional[Dict[int, float]] = None
+        for token in dict.fromkeys(tokens):
+            token_scores: Dict[int, float] = {}
+            for term in self._expand(token):
+                factor = 1.0 if term == token else PREFIX_FACTOR
+                for pid, w in self._postings.get(term, {}).items():
+                    s = w * factor
+                    if s > token_scores.get(pid, 0.0):
+                        token_scores[pid] = s
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {pid: s + token_scores[pid] for pid, s in scores.items() if pid in token_scores}
+            if not scores:
+                return []
+        pos = self.positions
+        return sorted(scores, key=lambda pid: (-scores[pid], pos.get(pid, 0)))
+
+
+search_index = SearchIndex()
+
+
+def search_products(products: List[Dict[str, Any]], version: int, query: str) -> List[Dict[str, Any]]:
+    """Filtra `products` (una versión del snapshot) por `query`, ordenados por relevancia."""
+    return search_index.query(products, version, query)
@@ -0,0 +1,91 @@
+# valac_jewelry/services/catalog_sort.py
+"""
+Órdenes precalculados del catálogo para /collection.
+
+Por cada versión del CatalogSnapshot se ordena una sola vez la lista
+completa por cada modo de `sort`. Una página se obtiene recorriendo ese
+orden y aplicando los filtros hasta juntar offset+limit filas, así que el
+costo por request depende de la página pedida y no del tamaño del catálogo.
+Como en el grid de la tienda, los agotados van al final en cualquier orden.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .catalog_search import fold
+
+SortKey = Callable[[Dict[str, Any]], Any]
+
+
+def _created(p: Dict[str, Any]) -> str:
+    return p.get("created_at") or ""
+
+
+def effective_price(p: Dict[str, Any]) -> float:
+    """Precio que ve el cliente: precio_descuento si hay oferta vigente."""
+    precio = float(p.get("precio") or 0)
+    oferta = float(p.get("precio_descuento") or 0)
+    if float(p.get("descuento_pct") or 0) > 0 and 0 < oferta < precio:
+        return oferta
+    return precio
+
+
+def _in_stock(p: Dict[str, Any]) -> bool:
+    return (p.get("stock_total") or 0) > 0
+
+
+# (clave, descendente). Los empates conservan el orden del snapshot
+# (created_at desc) porque sorted() es estable.
+SORTS: Dict[str, Tuple[SortKey, bool]] = {
+    "precio_asc": (effective_price, False),
+    "precio_desc": (effective_price, True),
+    "novedades": (_created, True),
+    "mas_vendidos": (lambda p: p.get("ventas") or 0, True),
+    "destacados": (lambda p: bool(p.get("destacado")), True),
+    # Sin reseñas va al final; a igual promedio gana el que tiene más
+    "mejor_valoracion": (lambda p: (float(p.get("valoracion") or 0), p.get("num_resenas") or 0), True),
+    "nombre_asc": (lambda p: fold(p.get("nombre") or ""), False),
+    "nombre_desc": (lambda p: fold(p.get("nombre") or ""), True),
+}
+
+
+class SortedViews:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._orders: Dict[str, List[Dict[str, Any]]] = {}
+        self._positions: Dict[str, Dict[int, int]] = {}
+
+    def _view(self, products: List[Dict[str, Any]], version: int, sort: str):
+        with self._lock:
+            if version != self._version:
+                self._orders = {}
+                self._positions = {}
+                self._version = version
+            rows = self._orders.get(sort)
+            if rows is None:
+                key, desc = SORTS[sort]
+                rows = sorted(products, key=key, reverse=desc)
+                rows = [p for p in rows if _in_stock(p)] + [p for p in rows if not _in_stock(p)]
+                self._orders[sort] = rows
+                self._positions[sort] = {p["id"]: i for i, p in enumerate(rows)}
+            return rows, self._positions[sort]
+
+    def ordered(self, products: List[Dict[str, Any]], version: int, sort: str) -> List[Dict[str, Any]]:
+        """Catálogo completo en el orden `sort` (o el del snapshot si no aplica)."""
+        if sort not in SORTS:
+            return products
+        return self._view(products, version, sort)[0]
+
+    def sort_subset(self, rows: List[Dict[str, Any]], products: List[Dict[str, Any]],
+                    version: int, sort: str) -> List[Dict[str, Any]]:
+        """Ordena un subconjunto (p. ej. resultados de búsqueda) por `sort`
+        usando las posiciones precalculadas en lugar de volver a comparar claves."""
+        if sort not in SORTS:
+            return rows
+        pos = self._view(products, version, sort)[1]
+        return sorted(rows, key=lambda p: pos.get(p["id"], 0))
+
+
+sorted_views = SortedViews()
@@ -0,0 +1,76 @@
+# valac_jewelry/services/geoip.py
+"""
+Tabla local de rangos IPv4 → ubicación, leída con mmap.
+
+El archivo lo genera scripts/build_geoip_table.py a partir de un CSV
+(DB-IP Lite o IP2Location LITE). Formato, todo en uint32 little-endian:
+
+    "VGEOIP01"                         magic (8 bytes)
+    count, locs_count                  2 × uint32
+    starts[count]                      inicio de cada rango (ordenado)
+    ends[count]                        fin de cada rango (inclusive)
+    loc_idx[count]                     índice de la ubicación del rango
+    loc_offsets[locs_count + 1]        offsets dentro del blob
+    blob                               ubicaciones en JSON UTF-8
+
+La búsqueda es un bisect sobre `starts` (memoryview del mmap, sin copiar
+el archivo a memoria) y un LRU por IP delante.
+"""
+from __future__ import annotations
+
+import json
+import mmap
+import socket
+import struct
+import sys
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+MAGIC = b"VGEOIP01"
+_HEADER = struct.Struct("<8sII")
+
+
+class GeoIPTable:
+    def __init__(self, path: str, cache_size: int = 65536):
+        if sys.byteorder != "little":  # memoryview.cast usa el orden nativo
+            raise RuntimeError("GeoIPTable requiere una plataforma little-endian")
+        self.path = path
+        with open(path, "rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, locs_count = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: no es una tabla GeoIP ({magic!r})")
+
+        n_words = 3 * count + locs_count + 1
+        words = memoryview(self._mm)[_HEADER.size:_HEADER.size + 4 * n_words].cast("I")
+        self._starts = words[0:count]
+        self._ends = words[count:2 * count]
+        self._loc_idx = words[2 * count:3 * count]
+        self._offsets = words[3 * count:3 * count + locs_count + 1]
+        self._blob_start = _HEADER.size + 4 * n_words
+        self.count = count
+        self._lookup = lru_cache(maxsize=cache_size)(self._lookup_uncached)
+
+    def lookup(self, ip_address: str) -> Optional[Dict[str, Any]]:
+        """Ubicación de una IPv4 o None si no está en ningún rango
+        (o no es IPv4). El dict se comparte vía LRU: no mutarlo."""
+        return self._lookup(ip_address)
+
+    def _lookup_uncached(self, ip_address: str) -> Optional[Dict[str, Any]]:
+        try:
+            ip = int.from_bytes(socket.inet_aton(ip_address), "big")
+        except (OSError, TypeError):
+            return None  # IPv6 u otro formato
+        i = bisect_right(self._starts, ip) - 1
+        if i < 0 or ip > self._ends[i]:
+            return None
+        return self._location(self._loc_idx[i])
+
+    def _location(self, idx: int) -> Dict[str, Any]:
+        a = self._blob_start + self._offsets[idx]
+        b = self._blob_start + self._offsets[idx + 1]
+        return json.loads(self._mm[a:b].decode("utf-8"))
+
+    def cache_info(self):
+        return self._lookup.cache_info()
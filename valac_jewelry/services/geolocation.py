@@ -0,0 +1,96 @@
+# valac_jewelry/services/geolocation.py
+"""
+Ubicación aproximada por IP para analytics.
+
+Con GEOIP_DB_PATH apuntando a una tabla generada por
+scripts/build_geoip_table.py se resuelve localmente (services/geoip.py,
+sin red). Sin tabla la ubicación queda vacía; con GEOIP_REMOTE_FALLBACK=True
+se consulta ipapi.co (una llamada HTTP por IP nueva, en serie dentro del
+flush del worker, así que sólo conviene con poco tráfico).
+
+Se llama desde el worker de analytics_ingest, nunca dentro de un request.
+Las respuestas remotas se cachean por IP para no repetir la consulta en
+cada beacon del mismo visitante.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any, Dict, Optional
+
+import requests
+
+from .geoip import GeoIPTable
+from .ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+PRIVATE_PREFIXES = ("127.", "10.", "192.168.", "172.16.", "172.17.", "172.18.", "172.19.")
+_cache = TTLCache(ttl=6 * 3600, maxsize=10000)
+_table: Optional[GeoIPTable] = None
+_remote_fallback = False
+
+
+def init_app(app) -> None:
+    global _table, _remote_fallback
+    _remote_fallback = app.config.get("GEOIP_REMOTE_FALLBACK", False)
+    path = app.config.get("GEOIP_DB_PATH")
+    if not path:
+        return
+    if not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(app.root_path), path)
+    if not os.path.exists(path):
+        logger.warning("GEOIP_DB_PATH=%s no existe; geolocalización %s", path,
+                       "vía ipapi.co" if _remote_fallback else "deshabilitada")
+        return
+    try:
+        _table = GeoIPTable(path, cache_size=int(app.config.get("GEOIP_CACHE_SIZE", 65536)))
+        logger.info("Tabla GeoIP cargada: %s (%d rangos)", path, _table.count)
+    except Exception as e:
+        logger.error("No se pudo abrir la tabla GeoIP %s: %s", path, e)
+
+
+def _empty(ip_address: Optional[str]) -> Dict[str, Any]:
+    return {"ip": ip_address, "city": None, "region": None, "country": None}
+
+
+def _fetch(ip_address: str) -> Dict[str, Any]:
+    try:
+        resp = requests.get(f"https://ipapi.co/{ip_address}/json/", timeout=2.5)
+        if resp.status_code == 200:
+            d = resp.json() or {}
+            return {
+                "ip": ip_address,
+                "city": d.get("city"),
+                "region": d.get("region"),
+                "region_code": d.get("region_code"),
+                "country": d.get("country_name"),
+                "country_code": d.get("country"),
+                "postal": d.get("postal"),
+                "latitude": d.get("latitude"),
+                "longitude": d.get("longitude"),
+                "timezone": d.get("timezone"),
+            }
+    except Exception:
+        pass
+    return _empty(ip_address)
+
+
+def lookup_location(ip_address: Optional[str]) -> Dict[str, Any]:
+    """
+    Devuelve un dict JSON listo para guardar en jsonb:
+    {
+      ip, city, region, region_code, country, country_code, postal,
+      latitude, longitude, timezone
+    }
+    Backwards-safe: si falla, devuelve city/region/country = None.
+    """
+    # Evita resolver localhost/privadas
+    if not ip_address or ip_address.startswith(PRIVATE_PREFIXES):
+        return _empty(ip_address)
+    if _table is not None:
+        loc = _table.lookup(ip_address)
+        return {"ip": ip_address, **loc} if loc else _empty(ip_address)
+    if not _remote_fallback:
+        return _empty(ip_address)
+    return _cache.get_or_load(ip_address, lambda: _fetch(ip_address))
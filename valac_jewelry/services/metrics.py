@@ -0,0 +1,79 @@
+# valac_jewelry/services/metrics.py
+"""
+Métricas en proceso: tiempos por nombre (últimas N muestras) y contadores.
+
+Sin dependencias externas; cada worker de gunicorn lleva las suyas. Sirve
+para comparar antes/después de un cambio desde los logs o el header
+Server-Timing, no como sistema de monitoreo.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List
+
+_SAMPLES = 500
+
+
+class Metrics:
+    def __init__(self, samples: int = _SAMPLES):
+        self._lock = threading.Lock()
+        self._samples = samples
+        self._timings: Dict[str, Deque[float]] = {}
+        self._totals: Dict[str, int] = {}
+        self._counters: Dict[str, int] = {}
+
+    def observe(self, name: str, ms: float) -> None:
+        with self._lock:
+            q = self._timings.get(name)
+            if q is None:
+                q = self._timings[name] = deque(maxlen=self._samples)
+            q.append(ms)
+            self._totals[name] = self._totals.get(name, 0) + 1
+
+    def incr(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[Dict[str, float]]:
+        """`with metrics.timer("x") as t:` → al salir, t["ms"] trae la duración."""
+        out: Dict[str, float] = {}
+        start = time.perf_counter()
+        try:
+            yield out
+        finally:
+            out["ms"] = (time.perf_counter() - start) * 1000
+            self.observe(name, out["ms"])
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """{'timings': {name: {count, avg_ms, p50_ms, p95_ms, max_ms}}, 'counters': {...}}"""
+        with self._lock:
+            timings = {k: list(v) for k, v in self._timings.items()}
+            totals = dict(self._totals)
+            counters = dict(self._counters)
+        return {
+            "timings": {name: _summary(values, totals[name]) for name, values in timings.items()},
+            "counters": counters,
+        }
+
+
+def _summary(values: List[float], total: int) -> Dict[str, float]:
+    ordered = sorted(values)
+    n = len(ordered)
+
+    def pct(p: float) -> float:
+        return round(ordered[min(n - 1, int(p * n))], 2) if n else 0.0
+
+    return {
+        "count": total,
+        "avg_ms": round(sum(ordered) / n, 2) if n else 0.0,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "max_ms": round(ordered[-1], 2) if n else 0.0,
+    }
+
+
+metrics = Metrics()
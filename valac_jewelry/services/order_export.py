@@ -0,0 +1,237 @@
+# valac_jewelry/services/order_export.py
+"""
+Exportación de órdenes para contabilidad (/admin/admin_orders/export).
+
+Las filas se leen por keyset sobre id (`id > último` de a PAGE_SIZE) y se
+escriben conforme llegan, así que la memoria no depende de cuántas órdenes
+haya:
+
+  • CSV: cada página se codifica y se manda como un chunk de la respuesta
+    (UTF-8 con BOM para que Excel respete los acentos)
+  • XLSX: openpyxl en modo write-only vuelca las filas a un temporal en
+    disco; el .xlsx es un zip que sólo puede cerrarse al final, así que se
+    manda en chunks una vez escrita la última fila
+
+El rango de ids se fija al empezar (hasta la orden más reciente en ese
+momento): lo que entre durante la descarga queda para la siguiente.
+
+Exportación incremental ("desde la última"): la marca es el último id
+exportado y vive en site_settings (WATERMARK_KEY). Sólo avanza cuando el
+generador terminó de mandar el archivo; si la descarga se corta, la
+siguiente vuelve a incluir esas órdenes. Trae órdenes nuevas: un cambio
+de estado posterior aparece en una exportación completa, no en la
+incremental.
+
+Postgres asigna el id en el INSERT, no en el COMMIT: un checkout que aún
+no confirma puede tener un id menor que otro ya visible. Por eso la
+incremental sólo llega hasta la orden más reciente con fecha_pedido
+(now() de su transacción) anterior a SAFETY_WINDOW; las más nuevas quedan
+para la siguiente. Sólo se saltaría una orden cuya transacción siguiera
+abierta más de SAFETY_WINDOW.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import logging
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from .metrics import metrics
+from .order_listing import OrderFilters, filter_orders
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+logger = logging.getLogger(__name__)
+
+# (columna en orders, encabezado); los acentos son los del esquema
+EXPORT_COLUMNS = (
+    ("id", "ID"),
+    ("fecha_pedido", "Fecha"),
+    ("nombre", "Cliente"),
+    ("email", "Email"),
+    ("telefono", "Teléfono"),
+    ("método_pago", "Método de pago"),
+    ("transaction_id", "Transacción"),
+    ("subtotal", "Subtotal"),
+    ("costo_envío", "Envío"),
+    ("total", "Total"),
+    ("estado_pago", "Estado de pago"),
+    ("estado_envio", "Estado de envío"),
+    ("estado", "Estado"),
+    ("ciudad", "Ciudad"),
+    ("estado_geografico", "Estado (geográfico)"),
+    ("codigo_postal", "C.P."),
+)
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+PAGE_SIZE = 500
+CHUNK_SIZE = 64 * 1024
+WATERMARK_KEY = "orders_export_last_id"
+SAFETY_WINDOW = timedelta(minutes=10)
+
+Row = Dict[str, Any]
+
+
+class ExportError(ValueError):
+    pass
+
+
+# ── Marca de la exportación incremental ─────────────
+
+def get_watermark(sb) -> int:
+    resp = sb.table("site_settings").select("value").eq("key", WATERMARK_KEY).execute()
+    value = (resp.data or [{}])[0].get("value")
+    return int(value) if value and str(value).isdigit() else 0
+
+
+def set_watermark(sb, last_id: int) -> None:
+    sb.table("site_settings").upsert({"key": WATERMARK_KEY, "value": str(last_id)}).execute()
+
+
+# ── Lectura por keyset ──────────────────────────────
+
+def _max_order_id(sb, before: Optional[datetime] = None) -> int:
+    q = sb.table("orders").select("id")
+    if before is not None:
+        q = q.lte("fecha_pedido", before.isoformat())
+    resp = q.order("id", desc=True).limit(1).execute()
+    return int(resp.data[0]["id"]) if resp.data else 0
+
+
+def iter_pages(sb, f: OrderFilters, after_id: int, upto_id: int,
+               page_size: int = PAGE_SIZE) -> Iterator[List[Row]]:
+    """Páginas de órdenes con after_id < id <= upto_id, en orden de id."""
+    last_id = after_id
+    while last_id < upto_id:
+        q = filter_orders(sb.table("orders").select("*"), f)
+        rows = (
+            q.gt("id", last_id)
+            .lte("id", upto_id)
+            .order("id")
+            .limit(page_size)
+            .execute()
+            .data
+            or []
+        )
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1]["id"]
+
+
+# ── Formatos ────────────────────────────────────────
+
+def _cell(value: Any) -> Any:
+    if value is None:
+        return ""
+    # Un texto que empieza con = + - @ Excel lo evalúa como fórmula
+    if isinstance(value, str) and value[:1] in ("=", "+", "-", "@", "\t", "\r"):
+        return "'" + value
+    return value
+
+
+def _values(order: Row) -> List[Any]:
+    return [_cell(order.get(column)) for column, _ in EXPORT_COLUMNS]
+
+
+def _csv_chunks(pages: Iterator[List[Row]]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow([title for _, title in EXPORT_COLUMNS])
+    yield ("\ufeff" + buf.getvalue()).encode("utf-8")
+    for rows in pages:
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(_values(r) for r in rows)
+        yield buf.getvalue().encode("utf-8")
+
+
+def _xlsx_chunks(pages: Iterator[List[Row]]) -> Iterator[bytes]:
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Órdenes")
+    ws.append([title for _, title in EXPORT_COLUMNS])
+    for rows in pages:
+        for r in rows:
+            ws.append(_values(r))
+    with tempfile.TemporaryFile() as fh:
+        wb.save(fh)
+        fh.seek(0)
+        while True:
+            chunk = fh.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+# ── Exportación ─────────────────────────────────────
+
+@dataclass(frozen=True)
+class OrderExport:
+    fmt: str
+    filters: OrderFilters
+    after_id: int          # exclusivo
+    upto_id: int           # inclusivo
+    incremental: bool
+
+    @property
+    def empty(self) -> bool:
+        return self.upto_id <= self.after_id
+
+    @property
+    def mimetype(self) -> str:
+        return FORMATS[self.fmt]
+
+    @property
+    def filename(self) -> str:
+        stamp = datetime.now().strftime("%Y%m%d")
+        return f"ordenes_{stamp}_{self.after_id + 1}-{self.upto_id}.{self.fmt}"
+
+    def stream(self, sb) -> Iterator[bytes]:
+        """Cuerpo de la respuesta; al agotarse mueve la marca si es
+        incremental."""
+        exported = 0
+
+        def pages():
+            nonlocal exported
+            for rows in iter_pages(sb, self.filters, self.after_id, self.upto_id):
+                exported += len(rows)
+                yield rows
+
+        chunks = _csv_chunks(pages()) if self.fmt == "csv" else _xlsx_chunks(pages())
+        with metrics.timer(f"orders.export.{self.fmt}"):
+            yield from chunks
+
+        metrics.incr("orders.export.rows", exported)
+        if self.incremental:
+            set_watermark(sb, self.upto_id)
+        logger.info("Exportación de órdenes %s: %d filas (ids %d-%d%s)", self.fmt, exported,
+                    self.after_id + 1, self.upto_id, ", incremental" if self.incremental else "")
+
+
+def plan_export(sb, fmt: str, filters: Optional[OrderFilters] = None,
+                since_last: bool = False) -> OrderExport:
+    """Fija formato y rango de ids. La incremental ignora los filtros: es
+    el corte de todas las órdenes nuevas."""
+    fmt = (fmt or "csv").lower()
+    if fmt not in FORMATS:
+        raise ExportError(f"Formato no soportado: {fmt}")
+    if fmt == "xlsx" and openpyxl is None:
+        raise ExportError("openpyxl no está instalado. pip install openpyxl")
+
+    filters = OrderFilters() if since_last or filters is None else filters.without_search()
+    if since_last:
+        after_id = get_watermark(sb)
+        upto_id = _max_order_id(sb, before=datetime.now(timezone.utc) - SAFETY_WINDOW)
+    else:
+        after_id, upto_id = 0, _max_order_id(sb)
+    return OrderExport(fmt, filters, after_id, upto_id, since_last)
@@ -0,0 +1,223 @@
+# valac_jewelry/services/order_listing.py
+"""
+Listado admin de órdenes (/admin/admin_orders/json) paginado en el servidor.
+
+El DataTable manda start/length/search/order (protocolo server-side) y
+aquí se traduce a una sola consulta con las columnas que pinta la tabla:
+
+  • por offset: range(start, start + length - 1) con count="exact"
+    (PostgREST devuelve filas y total filtrado juntos)
+  • por keyset: al servir una página se recuerda la última fila; si luego
+    piden la siguiente con el mismo filtro y orden, se filtra
+    (fecha_pedido, id) < última en vez de saltar `start` filas. Sólo para
+    columnas sin NULL (id, fecha_pedido) y sin búsqueda de texto: el total
+    filtrado sale de los mismos conteos que los KPIs (get_stats), que
+    siguen al día con las órdenes nuevas
+
+Las tarjetas de KPIs sin filtros leen order_status_counters (migración
+016), que un trigger sobre orders mantiene por (estado_pago, estado_envio)
+en la misma transacción de cada escritura: son unas cuantas filas sin
+importar cuántas órdenes haya. Con filtros de fecha/estado se usa
+order_status_counts (migración 015), un GROUP BY con esos filtros; sin
+las migraciones se cuentan bajando sólo esas dos columnas por páginas.
+"""
+from __future__ import annotations
+
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from .schema_errors import is_missing_function, is_missing_table
+from .ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+LIST_FIELDS = "id, fecha_pedido, nombre, email, total, estado_pago, estado_envio"
+# Índice = columna del DataTable (la de acciones no ordena)
+SORT_COLUMNS = ("id", "fecha_pedido", "nombre", "total", "estado_pago", "estado_envio")
+KEYSET_COLUMNS = {"id", "fecha_pedido"}
+MAX_LENGTH = 100
+SCAN_PAGE = 1000
+
+Row = Dict[str, Any]
+
+_boundaries = TTLCache(ttl=300, maxsize=2048)  # (filtros, orden, start) → (valor, id)
+stats_cache = TTLCache(ttl=30, maxsize=256)
+
+
+@dataclass(frozen=True)
+class OrderFilters:
+    start_date: Optional[str] = None   # YYYY-MM-DD
+    end_date: Optional[str] = None
+    estado_pago: Optional[str] = None
+    estado_envio: Optional[str] = None
+    search: str = ""
+
+    def without_search(self) -> "OrderFilters":
+        return OrderFilters(self.start_date, self.end_date, self.estado_pago, self.estado_envio)
+
+
+@dataclass(frozen=True)
+class OrderSort:
+    column: str = "fecha_pedido"
+    desc: bool = True
+
+
+# ── Consulta ────────────────────────────────────────
+
+def filter_orders(q, f: OrderFilters):
+    """Filtros de fecha y estado (no la búsqueda de texto) sobre un select
+    de orders; también los usa services/order_export.py."""
+    if f.start_date:
+        q = q.gte("fecha_pedido", f"{f.start_date}T00:00:00")
+    if f.end_date:
+        q = q.lte("fecha_pedido", f"{f.end_date}T23:59:59")
+    if f.estado_pago:
+        q = q.eq("estado_pago", f.estado_pago)
+    if f.estado_envio:
+        q = q.eq("estado_envio", f.estado_envio)
+    return q
+
+
+def _search_clause(term: str) -> Optional[str]:
+    """Cláusula `or` de PostgREST: nombre/email contienen el texto o el id
+    es ese número."""
+    term = term.replace('"', "").replace("\\", "").strip()
+    if not term:
+        return None
+    parts = [f'nombre.ilike."*{term}*"', f'email.ilike."*{term}*"']
+    if term.lstrip("#").isdigit():
+        parts.append(f"id.eq.{int(term.lstrip('#'))}")
+    return ",".join(parts)
+
+
+def _keyset_clause(sort: OrderSort, value: Any, last_id: int) -> str:
+    op = "lt" if sort.desc else "gt"
+    if sort.column == "id":
+        return f"id.{op}.{last_id}"
+    return f'{sort.column}.{op}."{value}",and({sort.column}.eq."{value}",id.{op}.{last_id})'
+
+
+def _query(sb, f: OrderFilters, sort: OrderSort, count: Optional[str], after: Optional[str] = None):
+    q = filter_orders(sb.table("orders").select(LIST_FIELDS, count=count), f)
+    search = _search_clause(f.search)
+    if search and after:
+        q = q.or_(f"and(or({search}),or({after}))")
+    elif search or after:
+        q = q.or_(search or after)
+
+    q = q.order(sort.column, desc=sort.desc)
+    if sort.column != "id":
+        q = q.order("id", desc=sort.desc)
+    return q
+
+
+def fetch_page(sb, f: OrderFilters, sort: OrderSort, start: int, length: int) -> Tuple[List[Row], int]:
+    """(filas, total filtrado) de la página que empieza en `start`."""
+    length = max(1, min(length, MAX_LENGTH))
+    # Con búsqueda no hay conteo barato del total: se pagina por offset
+    keyset = sort.column in KEYSET_COLUMNS and not f.search
+    boundary = _boundaries.get((f, sort, start)) if keyset else None
+
+    if boundary is not None:
+        value, last_id = boundary
+        rows = _query(sb, f, sort, None, _keyset_clause(sort, value, last_id)).limit(length).execute().data or []
+        total = get_stats(sb, f)["total"]
+    else:
+        resp = _query(sb, f, sort, "exact").range(start, start + length - 1).execute()
+        rows, total = resp.data or [], resp.count or 0
+
+    if rows and keyset:
+        last = rows[-1]
+        _boundaries.set((f, sort, start + len(rows)), (last[sort.column], last["id"]))
+    return rows, total
+
+
+# ── KPIs ────────────────────────────────────────────
+
+def fold_stats(counts: Dict[Tuple[str, str], int]) -> Dict[str, int]:
+    """Tarjetas del listado a partir de {(estado_pago, estado_envio): n}."""
+    stats = {
+        'total': 0,
+        'pending_payment': 0,
+        'paid': 0,
+        'refunded': 0,
+        'unshipped': 0,
+        'processing': 0,
+        'shipped': 0,
+        'delivered': 0
+    }
+    payment_keys = {'pending': 'pending_payment', 'paid': 'paid', 'refunded': 'refunded'}
+    for (payment, shipping), n in counts.items():
+        stats['total'] += n
+        key = payment_keys.get((payment or '').lower())
+        if key:
+            stats[key] += n
+        shipping = (shipping or 'unshipped').lower()
+        if shipping in ('unshipped', 'processing', 'shipped', 'delivered'):
+            stats[shipping] += n
+    return stats
+
+
+def _load_counters(sb) -> Optional[Counter]:
+    """Contadores mantenidos (migración 016); None si no existen."""
+    try:
+        resp = sb.table("order_status_counters").select("estado_pago, estado_envio, n").execute()
+    except Exception as e:
+        if not is_missing_table(e):
+            raise
+        logger.warning("order_status_counters no existe (¿falta migración 016?); usando conteo agrupado")
+        return None
+    # '' en la tabla es NULL en orders
+    return Counter({
+        (r.get("estado_pago") or None, r.get("estado_envio") or None): int(r["n"])
+        for r in resp.data or [] if r.get("n")
+    })
+
+
+def _scan_counts(sb, f: OrderFilters) -> Counter:
+    """Sin migración 015: baja (estado_pago, estado_envio) por páginas."""
+    counts: Counter = Counter()
+    offset = 0
+    while True:
+        q = filter_orders(sb.table("orders").select("estado_pago, estado_envio"), f)
+        rows = q.order("id").range(offset, offset + SCAN_PAGE - 1).execute().data or []
+        for r in rows:
+            counts[(r.get("estado_pago"), r.get("estado_envio"))] += 1
+        if len(rows) < SCAN_PAGE:
+            return counts
+        offset += SCAN_PAGE
+
+
+def _load_counts(sb, f: OrderFilters) -> Counter:
+    try:
+        resp = sb.rpc("order_status_counts", {
+            "p_start": f"{f.start_date}T00:00:00" if f.start_date else None,
+            "p_end": f"{f.end_date}T23:59:59" if f.end_date else None,
+            "p_estado_pago": f.estado_pago,
+            "p_estado_envio": f.estado_envio,
+        }).execute()
+    except Exception as e:
+        if not is_missing_function(e):
+            raise
+        logger.warning("order_status_counts no existe (¿falta migración 015?); contando por páginas")
+        return _scan_counts(sb, f)
+    return Counter({(r.get("estado_pago"), r.get("estado_envio")): int(r["n"]) for r in resp.data or []})
+
+
+def get_stats(sb, f: OrderFilters = OrderFilters()) -> Dict[str, int]:
+    """KPIs con los filtros de fecha/estado (la búsqueda de texto no aplica)."""
+    f = f.without_search()
+
+    def load():
+        counts = _load_counters(sb) if f == OrderFilters() else None
+        if counts is None:
+            counts = _load_counts(sb, f)
+        return fold_stats(counts)
+    return stats_cache.get_or_load(f, load)
+
+
+def invalidate_order_listing() -> None:
+    stats_cache.invalidate()
+    _boundaries.invalidate()
@@ -0,0 +1,161 @@
+# valac_jewelry/services/path_classifier.py
+"""
+Clasificador de paths de navegación para el funnel de analytics.
+
+Las reglas (path exacto o prefijo, opcionalmente con un id entero después
+del prefijo, p.ej. /wa-click/product_<id>) se compilan una vez en un trie
+de caracteres. Clasificar un path es un solo recorrido del trie que
+devuelve todas las reglas que coinciden, sin importar cuántas haya; con un
+LRU delante, los paths repetidos no recorren nada.
+
+    classifier = PathClassifier([
+        PathRule("Home", path="/"),
+        PathRule("wa_product", prefix="/wa-click/product_", capture_int=True),
+    ])
+    tally = PathTally(classifier)
+    tally.add("/wa-click/product_12", 3)
+    tally.counts["wa_product"], tally.captures["wa_product"][12]   # 3, 3
+
+Este módulo no importa nada de la app (lo usa scripts/bench_path_classifier.py).
+"""
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Claves de los nodos del trie que no chocan con caracteres del path
+_EXACT = 0
+_PREFIX = 1
+
+Match = Tuple[str, Optional[int]]  # (tag, id capturado o None)
+
+
+@dataclass(frozen=True)
+class PathRule:
+    tag: str
+    path: Optional[str] = None    # coincidencia exacta
+    prefix: Optional[str] = None  # coincidencia por prefijo
+    capture_int: bool = False     # lo que sigue al prefijo es un id entero
+
+    def __post_init__(self):
+        if (self.path is None) == (self.prefix is None):
+            raise ValueError(f"PathRule {self.tag!r}: usar path o prefix (uno de los dos)")
+        if self.capture_int and self.prefix is None:
+            raise ValueError(f"PathRule {self.tag!r}: capture_int requiere prefix")
+
+
+def funnel_rules(stages: Sequence[Dict[str, str]]) -> List[PathRule]:
+    """Convierte etapas {"name", "path" | "path_prefix"} en reglas con tag = name."""
+    return [
+        PathRule(stage["name"], path=stage["path"]) if "path" in stage
+        else PathRule(stage["name"], prefix=stage["path_prefix"])
+        for stage in stages
+    ]
+
+
+class PathClassifier:
+    def __init__(self, rules: Iterable[PathRule], cache_size: int = 65536):
+        self.rules: Tuple[PathRule, ...] = tuple(rules)
+        self._root: dict = {}
+        for idx, rule in enumerate(self.rules):
+            node = self._root
+            for ch in rule.path if rule.path is not None else rule.prefix:
+                node = node.setdefault(ch, {})
+            node.setdefault(_EXACT if rule.path is not None else _PREFIX, []).append(idx)
+        self.classify = lru_cache(maxsize=cache_size)(self._classify)
+
+    @property
+    def tags(self) -> List[str]:
+        return list(dict.fromkeys(rule.tag for rule in self.rules))
+
+    def _classify(self, path: str) -> Tuple[Match, ...]:
+        """Reglas que coinciden con `path`, en el orden en que se definieron."""
+        hits: List[Tuple[int, int]] = []  # (índice de regla, fin del prefijo)
+        node = self._root
+        for i, ch in enumerate(path):
+            pre = node.get(_PREFIX)
+            if pre:
+                hits.extend((r, i) for r in pre)
+            node = node.get(ch)
+            if node is None:
+                break
+        else:
+            pre = node.get(_PREFIX)
+            if pre:
+                hits.extend((r, len(path)) for r in pre)
+            exact = node.get(_EXACT)
+            if exact:
+                hits.extend((r, len(path)) for r in exact)
+        if not hits:
+            return ()
+
+        out: List[Match] = []
+        for r, end in sorted(hits):
+            rule = self.rules[r]
+            value = None
+            if rule.capture_int:
+                value = _leading_int(path, end)
+            out.append((rule.tag, value))
+        return tuple(out)
+
+
+def _leading_int(path: str, start: int) -> Optional[int]:
+    """Id entero en path[start:], terminado en fin, '?', '#' o '/'
+    ("/producto/12?utm=x" → 12; "/wa-click/product_x" → None)."""
+    end = start
+    n = len(path)
+    while end < n and "0" <= path[end] <= "9":
+        end += 1
+    if end == start or (end < n and path[end] not in "?#/"):
+        return None
+    return int(path[start:end])
+
+
+class PathTally:
+    """Acumula hits por tag (y por id capturado) a partir de paths."""
+
+    def __init__(self, classifier: PathClassifier):
+        self.classify = classifier.classify
+        self.counts: Counter = Counter()
+        self.captures: Dict[str, Counter] = {}
+
+    def add(self, path: str, n: int = 1) -> Tuple[Match, ...]:
+        matches = self.classify(path)
+        for tag, value in matches:
+            self.counts[tag] += n
+            if value is not None:
+                self.captures.setdefault(tag, Counter())[value] += n
+        return matches
+
+    def update(self, path_counts: Dict[str, int]) -> "PathTally":
+        for path, n in path_counts.items():
+            self.add(path, n)
+        return self
+
+
+# ── Reglas de la tienda ───────────────────────────────
+
+# Etapas del funnel (en orden). Una etapa nueva sólo se agrega aquí: el
+# clasificador evalúa todas las reglas en un solo recorrido por path.
+FUNNEL_STAGES: List[Dict[str, str]] = [
+    {"name": "Home", "path": "/"},
+    {"name": "Colección", "path": "/collection"},
+    {"name": "Detalle de producto", "path_prefix": "/producto/"},
+    {"name": "Click en comprar", "path_prefix": "/buy-click/"},
+    {"name": "WhatsApp click", "path_prefix": "/wa-click/"},
+]
+
+
+def analytics_rules() -> List[PathRule]:
+    """Etapas del funnel + tags de KPIs; los de producto capturan el id."""
+    return funnel_rules(FUNNEL_STAGES) + [
+        PathRule("product_view", prefix="/producto/", capture_int=True),
+        PathRule("buy_click", prefix="/buy-click/", capture_int=True),
+        PathRule("wa_click", prefix="/wa-click/"),
+        PathRule("wa_product", prefix="/wa-click/product_", capture_int=True),
+    ]
+
+
+analytics_classifier = PathClassifier(analytics_rules())
@@ -0,0 +1,440 @@
+# valac_jewelry/services/payment_webhooks.py
+"""
+Notificaciones de pago de MercadoPago procesadas fuera del request.
+
+Los dos webhooks (/webhook/mercadopago y el de mercadopago_checkout)
+verifican la firma (verify(): header x-signature, HMAC-SHA256 con
+MP_WEBHOOK_SECRET, la clave secreta del panel de MP) y llaman accept():
+registran el evento y responden 200 enseguida. Sin MP_WEBHOOK_SECRET no
+se verifica la firma (se aceptan con un warning): el worker no confía en
+el cuerpo y consulta el pago en la API de MP. La consulta del pago y
+el UPDATE de orders los hace un pool de MP_WEBHOOK_WORKERS threads, que
+arranca en init_app.
+
+  • dedup: el id de la notificación se guarda en mp_webhook_events
+    (migración 018, PRIMARY KEY) y en un TTLSet local; los reintentos de
+    MP del mismo evento se descartan. Sin la tabla sólo queda el local
+  • colapso: mientras un pago espera en la cola, los eventos nuevos del
+    mismo pago se suman a ese trabajo; el worker consulta el estado actual
+    en MP, así que basta una consulta. Un pago nunca se procesa en dos
+    workers a la vez
+  • reintentos: si MP o Supabase fallan se reprograma con backoff
+    exponencial (2, 4, 8… s, tope BACKOFF_MAX) hasta MP_WEBHOOK_MAX_ATTEMPTS;
+    luego el evento queda 'failed'. Si MP lo reenvía vuelve a la cola, y
+    al arrancar se retoman los 'pending' y 'failed' de RESUME_WINDOW
+  • la orden sólo se escribe si cambia estado_pago o transaction_id
+
+"mp_webhook.lag_ms" en /admin/metrics es el tiempo desde que llegó la
+notificación hasta que la orden quedó actualizada (incluye reintentos).
+Los eventos 'pending' que quedan al apagar se retoman cuando arrancan los
+workers del siguiente proceso.
+"""
+from __future__ import annotations
+
+import atexit
+import hashlib
+import heapq
+import hmac
+import itertools
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+import mercadopago
+
+from .metrics import metrics
+from .order_listing import invalidate_order_listing
+from .schema_errors import is_missing_table
+from .supabase_clients import clients
+from .ttl_cache import TTLSet
+
+logger = logging.getLogger(__name__)
+
+# Estado de MP → estado_pago de orders
+STATUS_MAP = {
+    "approved": "Completado",
+    "authorized": "Completado",
+    "pending": "Pendiente",
+    "in_process": "Pendiente",
+    "rejected": "Rechazado",
+    "cancelled": "Cancelado",
+    "refunded": "Reembolsado",
+    "charged_back": "Contracargo",
+}
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 300.0
+BUSY_DELAY = 0.5        # pago ya en proceso en otro worker
+RESUME_WINDOW = timedelta(days=7)
+
+
+class PaymentLookupError(Exception):
+    pass
+
+
+def signature_valid(secret: str, signature: str, request_id: str, data_id: str) -> bool:
+    """Firma de MP: x-signature = "ts=<ts>,v1=<hmac>", con el HMAC-SHA256
+    de "id:<data.id>;request-id:<x-request-id>;ts:<ts>;" (se omiten las
+    partes que no vengan; data.id alfanumérico va en minúsculas)."""
+    parts = dict(p.strip().split("=", 1) for p in (signature or "").split(",") if "=" in p)
+    ts, v1 = parts.get("ts"), parts.get("v1")
+    if not secret or not ts or not v1:
+        return False
+    manifest = ""
+    if data_id:
+        manifest += f"id:{data_id.lower() if data_id.isalnum() else data_id};"
+    if request_id:
+        manifest += f"request-id:{request_id};"
+    manifest += f"ts:{ts};"
+    expected = hmac.new(secret.encode(), manifest.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, v1)
+
+
+def sold_items(payment: dict) -> List[dict]:
+    """Renglones de la orden que checkout guarda en metadata.ventas de la
+    preferencia (la orden no los persiste): [{"id": 12, "cantidad": 2}, ...]."""
+    items = []
+    for it in (payment.get("metadata") or {}).get("ventas") or []:
+        try:
+            items.append({"id": int(it["id"]), "cantidad": int(it["cantidad"])})
+        except (KeyError, TypeError, ValueError):
+            continue
+    return [it for it in items if it["cantidad"] > 0]
+
+
+def _epoch(value: Optional[str]) -> float:
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+class _Job:
+    __slots__ = ("payment_id", "event_ids", "received", "attempt")
+
+    def __init__(self, payment_id: str, event_ids: List[str], received: float, attempt: int = 1):
+        self.payment_id = payment_id
+        self.event_ids = event_ids
+        self.received = received
+        self.attempt = attempt
+
+
+class PaymentWebhookQueue:
+    def __init__(self, workers: int = 2, maxsize: int = 1000, max_attempts: int = 6):
+        self.workers = workers
+        self.maxsize = maxsize
+        self.max_attempts = max_attempts
+        self._cond = threading.Condition()
+        self._heap: List[Tuple[float, int, _Job]] = []
+        self._seq = itertools.count()
+        self._pending: Dict[str, _Job] = {}   # payment_id → trabajo aún no iniciado
+        self._running: Set[str] = set()
+        self._seen = TTLSet(ttl=86400, maxsize=50_000)
+        self._threads: List[threading.Thread] = []
+        self._pid: Optional[int] = None
+        self._stop = False
+        self._store = True   # mp_webhook_events disponible
+        self._sb = None
+        self._token: Optional[str] = None
+        self._secret: Optional[str] = None
+        self._mp = None
+
+    def init_app(self, app) -> None:
+        cfg = app.config
+        self.workers = max(1, int(cfg.get("MP_WEBHOOK_WORKERS", 2)))
+        self.maxsize = int(cfg.get("MP_WEBHOOK_QUEUE_SIZE", 1000))
+        self.max_attempts = int(cfg.get("MP_WEBHOOK_MAX_ATTEMPTS", 6))
+        self._seen = TTLSet(ttl=int(cfg.get("MP_WEBHOOK_DEDUP_TTL", 86400)), maxsize=50_000)
+        self._token = cfg.get("MP_ACCESS_TOKEN") or os.getenv("MP_ACCESS_TOKEN")
+        if not self._token:
+            logger.error("MP_ACCESS_TOKEN no configurado; los webhooks de pago no podrán verificarse")
+        self._secret = cfg.get("MP_WEBHOOK_SECRET")
+        if not self._secret:
+            logger.warning("MP_WEBHOOK_SECRET no configurado; los webhooks de MercadoPago se aceptan sin verificar la firma")
+        self._sb = app.supabase
+        atexit.register(self.shutdown)
+        self._ensure_workers()
+
+    # ── Intake (threads de request) ──────────────────
+
+    def verify(self, req) -> bool:
+        """¿La notificación viene firmada por MP? Se llama antes de accept()
+        para que ids inventados no ocupen la cola. Sin MP_WEBHOOK_SECRET
+        siempre es True."""
+        if not self._secret:
+            metrics.incr("mp_webhook.unsigned")
+            return True
+        payload = req.get_json(silent=True) or {}
+        data_id = req.args.get("data.id") or str((payload.get("data") or {}).get("id") or "")
+        ok = signature_valid(self._secret, req.headers.get("x-signature", ""),
+                             req.headers.get("x-request-id", ""), data_id)
+        if not ok:
+            metrics.incr("mp_webhook.bad_signature")
+        return ok
+
+    def accept(self, payload: dict) -> str:
+        """Registra una notificación de MP. Devuelve 'queued', 'collapsed',
+        'duplicate', 'ignored' o 'busy' (cola llena: responder 503 para que
+        MP la reintente más tarde)."""
+        if payload.get("type") != "payment":
+            return "ignored"
+        payment_id = str((payload.get("data") or {}).get("id") or "")
+        if not payment_id:
+            return "ignored"
+        action = payload.get("action") or ""
+        event_id = str(payload.get("id") or f"{payment_id}:{action}:{payload.get('date_created') or ''}")
+        metrics.incr("mp_webhook.received")
+
+        with self._cond:
+            if payment_id not in self._pending and len(self._heap) >= self.maxsize:
+                metrics.incr("mp_webhook.busy")
+                logger.warning("Cola de webhooks MP llena; se pide reintento del pago %s", payment_id)
+                return "busy"
+
+        if not self._seen.add(event_id) or not self._record(event_id, payment_id, action):
+            metrics.incr("mp_webhook.duplicate")
+            return "duplicate"
+
+        self._ensure_workers()
+        status = self._schedule(_Job(payment_id, [event_id], time.time()))
+        if status == "collapsed":
+            metrics.incr("mp_webhook.collapsed")
+        return status
+
+    def _record(self, event_id: str, payment_id: str, action: str) -> bool:
+        """False si el evento ya estaba en mp_webhook_events."""
+        if not self._store:
+            return True
+        try:
+            resp = self._sb.table("mp_webhook_events").upsert(
+                {"event_id": event_id, "payment_id": payment_id, "action": action},
+                on_conflict="event_id", ignore_duplicates=True,
+            ).execute()
+            if resp.data:
+                return True
+            # Uno que agotó sus intentos vuelve a la cola si MP lo reenvía;
+            # el filtro por status hace que sólo un reenvío lo reclame
+            resp = (
+                self._sb.table("mp_webhook_events")
+                .update({"status": "pending", "last_error": None})
+                .eq("event_id", event_id)
+                .eq("status", "failed")
+                .execute()
+            )
+        except Exception as e:
+            if is_missing_table(e):
+                logger.warning("mp_webhook_events no existe (¿falta migración 018?); dedup sólo en memoria")
+                self._store = False
+            else:
+                # Mejor procesar de más (el UPDATE es idempotente) que perder el pago
+                logger.error("No se pudo registrar el evento MP %s: %s", event_id, e)
+            return True
+        return bool(resp.data)
+
+    def _schedule(self, job: _Job, delay: float = 0.0) -> str:
+        with self._cond:
+            queued = self._pending.get(job.payment_id)
+            if queued is not None:
+                queued.event_ids.extend(job.event_ids)
+                queued.received = min(queued.received, job.received)
+                return "collapsed"
+            self._pending[job.payment_id] = job
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), job))
+            self._cond.notify()
+        return "queued"
+
+    # ── Workers ──────────────────────────────────────
+
+    def _ensure_workers(self) -> None:
+        # El pid cubre el caso de un fork después de arrancar los threads
+        if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+            return
+        with self._cond:
+            if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+                return
+            resume = self._pid != os.getpid()
+            self._pid = os.getpid()
+            self._stop = False
+            self._threads = [t for t in self._threads if t.is_alive()] if not resume else []
+            for n in range(len(self._threads), self.workers):
+                thread = threading.Thread(target=self._run, name=f"mp-webhook-{n}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        if resume:
+            self._resume()
+
+    def _resume(self) -> None:
+        """Encola los eventos 'pending' que dejó un proceso anterior y los
+        'failed' recientes (p. ej. tras una caída de MP o Supabase)."""
+        if not self._store:
+            return
+        since = (datetime.now(timezone.utc) - RESUME_WINDOW).isoformat()
+        try:
+            resp = (
+                self._sb.table("mp_webhook_events")
+                .select("event_id, payment_id, received_at")
+                .in_("status", ["pending", "failed"])
+                .gte("received_at", since)
+                .order("received_at")
+                .limit(self.maxsize)
+                .execute()
+            )
+        except Exception as e:
+            logger.warning("No se pudieron retomar eventos MP pendientes: %s", e)
+            return
+        for row in resp.data or []:
+            self._seen.add(row["event_id"])
+            self._schedule(_Job(str(row["payment_id"]), [row["event_id"]], _epoch(row.get("received_at"))))
+        if resp.data:
+            logger.info("Retomando %d eventos MP pendientes o fallidos", len(resp.data))
+
+    def _next_job(self) -> Optional[_Job]:
+        with self._cond:
+            while not self._stop:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                due = self._heap[0][0] - time.monotonic()
+                if due > 0:
+                    self._cond.wait(due)
+                    continue
+                _, _, job = heapq.heappop(self._heap)
+                if job.payment_id in self._running:
+                    # Otro worker tiene este pago; se reintenta en un momento
+                    heapq.heappush(self._heap, (time.monotonic() + BUSY_DELAY, next(self._seq), job))
+                    continue
+                if self._pending.get(job.payment_id) is job:
+                    del self._pending[job.payment_id]
+                self._running.add(job.payment_id)
+                return job
+        return None
+
+    def _run(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                self._handle(job)
+            finally:
+                with self._cond:
+                    self._running.discard(job.payment_id)
+                    self._cond.notify()
+
+    def _handle(self, job: _Job) -> None:
+        try:
+            outcome = self.process(job.payment_id)
+        except Exception as e:
+            if job.attempt < self.max_attempts:
+                delay = min(BACKOFF_MAX, BACKOFF_BASE ** job.attempt)
+                logger.warning("Pago MP %s falló (intento %d), reintento en %.0fs: %s",
+                               job.payment_id, job.attempt, delay, e)
+                metrics.incr("mp_webhook.retried")
+                job.attempt += 1
+                self._schedule(job, delay)
+            else:
+                logger.error("Pago MP %s sin procesar tras %d intentos: %s", job.payment_id, job.attempt, e)
+                metrics.incr("mp_webhook.failed")
+                self._mark(job, "failed", str(e)[:500])
+                # Un reenvío de MP debe poder reclamarlo (ver _record)
+                for event_id in job.event_ids:
+                    self._seen.discard(event_id)
+            return
+
+        metrics.observe("mp_webhook.lag_ms", (time.time() - job.received) * 1000)
+        metrics.incr(f"mp_webhook.{outcome}")
+        self._mark(job, "ignored" if outcome == "ignored" else "done")
+
+    def process(self, payment_id: str) -> str:
+        """Consulta el pago en MP y actualiza la orden. Devuelve 'updated',
+        'unchanged' o 'ignored'; lanza excepción si hay que reintentar."""
+        with metrics.timer("mp_webhook.process"):
+            if self._mp is None:
+                if not self._token:
+                    raise PaymentLookupError("MP_ACCESS_TOKEN no configurado")
+                self._mp = mercadopago.SDK(self._token)
+            # CRÍTICO: el estado sale de la API de MP, no del cuerpo del webhook
+            resp = self._mp.payment().get(payment_id)
+            if resp.get("status") == 404:
+                logger.warning("Pago %s no existe en MP", payment_id)
+                return "ignored"
+            if resp.get("status") != 200:
+                raise PaymentLookupError(f"MP respondió {resp.get('status')} para el pago {payment_id}")
+
+            payment = resp.get("response") or {}
+            order_id = str(payment.get("external_reference") or "")
+            if not order_id.isdigit():
+                logger.warning("Pago %s sin external_reference válido: %r", payment_id, order_id)
+                return "ignored"
+
+            fields = {
+                "estado_pago": STATUS_MAP.get(payment.get("status", ""), "Pendiente"),
+                "transaction_id": str(payment_id),
+            }
+            current = self._sb.table("orders").select("estado_pago, transaction_id").eq("id", order_id).execute()
+            if not current.data:
+                logger.error("No se encontró orden %s para el pago %s", order_id, payment_id)
+                return "ignored"
+            if all(current.data[0].get(k) == v for k, v in fields.items()):
+                return "unchanged"
+
+            orders = self._sb.table("orders")
+            if fields["estado_pago"] == "Completado":
+                # Sólo la transición a Completado cuenta la venta; el filtro
+                # hace que dos pagos de la misma orden no la cuenten dos veces
+                resp = orders.update(fields).eq("id", order_id).neq("estado_pago", "Completado").execute()
+                if resp.data:
+                    self._register_sales(order_id, payment)
+                else:
+                    # Ya estaba Completado: sólo cambia transaction_id
+                    orders.update(fields).eq("id", order_id).execute()
+            else:
+                orders.update(fields).eq("id", order_id).execute()
+        # order_status_counters lo ajusta el trigger; aquí sólo se refresca el caché del admin
+        invalidate_order_listing()
+        logger.info("Orden %s actualizada a '%s' (payment_id=%s)", order_id, fields["estado_pago"], payment_id)
+        return "updated"
+
+    def _register_sales(self, order_id: str, payment: dict) -> None:
+        """Suma las unidades a products.ventas (orden "Más vendidos"). Un
+        error aquí no reintenta el evento: la orden ya quedó actualizada."""
+        items = sold_items(payment)
+        if not items:
+            return
+        try:
+            clients.service.rpc("incrementar_ventas", {"p_items": items}).execute()
+            metrics.incr("mp_webhook.sales", len(items))
+        except Exception as e:
+            logger.error("No se pudieron registrar ventas de la orden %s %s: %s", order_id, items, e)
+
+    def _mark(self, job: _Job, status: str, error: Optional[str] = None) -> None:
+        if not self._store:
+            return
+        try:
+            self._sb.table("mp_webhook_events").update({
+                "status": status,
+                "attempts": job.attempt,
+                "last_error": error,
+                "processed_at": datetime.now(timezone.utc).isoformat(),
+            }).in_("event_id", job.event_ids).execute()
+        except Exception as e:
+            logger.error("No se pudo marcar %d eventos MP como %s: %s", len(job.event_ids), status, e)
+
+    # ── Apagado ──────────────────────────────────────
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Detiene los workers (atexit). Lo encolado sigue 'pending' en
+        mp_webhook_events para el próximo arranque."""
+        if self._pid != os.getpid():
+            return
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+
+payment_webhooks = PaymentWebhookQueue()
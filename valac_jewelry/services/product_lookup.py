@@ -0,0 +1,26 @@
+# valac_jewelry/services/product_lookup.py
+"""
+Lectura de varios productos por id en un solo viaje a Supabase.
+
+Carrito y checkout calculan montos que terminan cobrándose, así que leen
+precio y stock directo de la DB (no del CatalogSnapshot), pero con un
+`in_("id", ...)` en lugar de un `.single()` por renglón.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List
+
+# PostgREST recibe los ids en la URL; trozos moderados evitan URLs enormes
+_CHUNK = 100
+
+
+def fetch_products_by_id(sb, ids: Iterable[int], fields: str) -> Dict[int, Dict[str, Any]]:
+    """{id: fila} para los ids que existen. Los que no, simplemente no aparecen."""
+    unique: List[int] = list(dict.fromkeys(int(i) for i in ids))
+    found: Dict[int, Dict[str, Any]] = {}
+    for start in range(0, len(unique), _CHUNK):
+        chunk = unique[start:start + _CHUNK]
+        resp = sb.table("products").select(fields).in_("id", chunk).execute()
+        for row in resp.data or []:
+            found[row["id"]] = row
+    return found
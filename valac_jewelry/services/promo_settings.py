@@ -0,0 +1,53 @@
+# valac_jewelry/services/promo_settings.py
+"""
+Settings promo_* de site_settings para el context processor global.
+
+Se guardan ya parseados (dict + lista de mensajes del banner) en un TTLCache
+que PromoAdminView invalida al guardar, así que renderizar un template no
+toca Supabase ni decodifica JSON.
+"""
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any, Dict
+
+from .ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_CACHE_KEY = "promo"
+ERROR_TTL = 5  # segundos: si Supabase falla, reintentar pronto sin martillarlo
+
+promo_cache = TTLCache(ttl=60, maxsize=1)
+
+
+def _parse(promo: Dict[str, str]) -> Dict[str, Any]:
+    promo_msgs = None
+    if promo.get("promo_banner_active") == "true":
+        try:
+            promo_msgs = json.loads(promo.get("promo_banner_messages", "[]"))
+        except (json.JSONDecodeError, TypeError):
+            promo_msgs = None
+    return {"promo": promo, "promo_msgs": promo_msgs}
+
+
+def get_promo_context(sb) -> Dict[str, Any]:
+    """Devuelve {'promo': {...}, 'promo_msgs': [...] | None} listo para Jinja."""
+    ctx = promo_cache.get(_CACHE_KEY)
+    if ctx is not None:
+        return ctx
+    try:
+        resp = sb.table("site_settings").select("key, value").like("key", "promo_%").execute()
+        promo = {r["key"]: r["value"] for r in (resp.data or [])}
+        ctx = _parse(promo)
+        promo_cache.set(_CACHE_KEY, ctx)
+    except Exception as e:
+        logger.warning("No se pudieron cargar promo settings: %s", e)
+        ctx = _parse({})
+        promo_cache.set(_CACHE_KEY, ctx, ttl=ERROR_TTL)
+    return ctx
+
+
+def invalidate_promo_settings() -> None:
+    promo_cache.invalidate()
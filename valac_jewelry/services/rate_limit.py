@@ -0,0 +1,219 @@
+# valac_jewelry/services/rate_limit.py
+"""
+Límites de frecuencia por clave (normalmente la IP) sin consultar la DB.
+
+Dos algoritmos, ambos en memoria y thread-safe:
+
+  • TokenBucket: `rate` fichas por segundo hasta `burst`; para tráfico
+    continuo como los beacons de analytics
+  • SlidingWindow: a lo más `limit` eventos en los últimos `window`
+    segundos (log exacto, guarda ≤ limit timestamps por clave); para
+    límites bajos como 3 reseñas por día
+
+Las claves viven en un OrderedDict acotado (maxkeys); al llenarse se
+olvida la menos usada, que es la que más probablemente ya estaba libre.
+
+Con RATE_LIMIT_BACKEND = 'supabase' las ventanas marcadas `shared` se
+consultan con la RPC rate_limit_hit (migración 014), así el límite vale
+para todos los workers y sobrevive a un reinicio. Si la RPC falla se
+decide con el estado local. Los TokenBucket siempre son locales: van en
+el camino de cada beacon.
+
+hit() cuenta el evento; check() sólo consulta, para las rutas que deben
+cobrar el cupo únicamente si la acción se concretó (una reseña que sí se
+insertó, no un formulario con errores).
+
+La clave es client_ip(): la IP que agregó nuestro proxy al final de
+X-Forwarded-For (RATE_LIMIT_TRUSTED_PROXIES saltos desde la derecha), no
+la primera, que la manda el cliente.
+
+Cada rechazo suma "ratelimit.<nombre>.rejected" en metrics
+(/admin/metrics).
+"""
+from __future__ import annotations
+
+import logging
+import math
+from abc import ABC, abstractmethod
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional
+
+from .metrics import metrics
+from .schema_errors import is_missing_function
+from .supabase_clients import clients
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Decision:
+    allowed: bool
+    retry_after: int = 0  # segundos hasta que vuelva a permitirse
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Retry-After": str(self.retry_after)} if not self.allowed else {}
+
+
+class _Limiter(ABC):
+    def __init__(self, name: str, maxkeys: int = 10_000):
+        self.name = name
+        self.maxkeys = maxkeys
+        self._lock = threading.Lock()
+        self._state: "OrderedDict[str, object]" = OrderedDict()
+
+    def hit(self, key: str) -> Decision:
+        """Cuenta un evento de `key` si cabe en el límite."""
+        return self._count(self._hit(key, consume=True))
+
+    def check(self, key: str) -> Decision:
+        """¿Cabría un evento más? No cuenta nada."""
+        return self._count(self._hit(key, consume=False))
+
+    def _count(self, decision: Decision) -> Decision:
+        if not decision.allowed:
+            metrics.incr(f"ratelimit.{self.name}.rejected")
+        return decision
+
+    @abstractmethod
+    def _hit(self, key: str, consume: bool) -> Decision:
+        ...
+
+    def _touch(self, key: str, default):
+        # Llamar con self._lock tomado
+        state = self._state.get(key)
+        if state is None:
+            if len(self._state) >= self.maxkeys:
+                self._state.popitem(last=False)
+            state = self._state[key] = default()
+        else:
+            self._state.move_to_end(key)
+        return state
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state.clear()
+
+
+class TokenBucket(_Limiter):
+    def __init__(self, name: str, rate: float, burst: int, maxkeys: int = 10_000):
+        super().__init__(name, maxkeys)
+        self.rate = rate
+        self.burst = burst
+
+    def _hit(self, key: str, consume: bool) -> Decision:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._touch(key, lambda: [float(self.burst), now])
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[0], bucket[1] = tokens, now
+            if tokens < 1:
+                return Decision(False, max(1, math.ceil((1 - tokens) / self.rate)))
+            if consume:
+                bucket[0] = tokens - 1
+        return Decision(True)
+
+
+class SlidingWindow(_Limiter):
+    def __init__(self, name: str, limit: int, window: int, shared: bool = False,
+                 maxkeys: int = 10_000):
+        super().__init__(name, maxkeys)
+        self.limit = limit
+        self.window = window
+        self.shared = shared
+
+    def _hit(self, key: str, consume: bool) -> Decision:
+        if self.shared and _backend is not None:
+            decision = _backend.hit(f"{self.name}:{key}", self.limit, self.window, consume)
+            if decision is not None:
+                return decision
+        return self._local_hit(key, consume)
+
+    def _local_hit(self, key: str, consume: bool) -> Decision:
+        now = time.monotonic()
+        with self._lock:
+            log: Deque[float] = self._touch(key, deque)
+            while log and log[0] <= now - self.window:
+                log.popleft()
+            if len(log) >= self.limit:
+                return Decision(False, max(1, math.ceil(log[0] + self.window - now)))
+            if consume:
+                log.append(now)
+        return Decision(True)
+
+
+# ── Backend compartido (Supabase) ───────────────────
+
+class SupabaseBackend:
+    """Ventana deslizante aproximada (contador de la ventana actual más el
+    de la anterior ponderado) en la tabla rate_limit_counters. La RPC sólo
+    la ejecuta service_role: con la anon key cualquiera podría llenar el
+    cupo de otra IP."""
+
+    def __init__(self, sb):
+        self._sb = sb
+        self._disabled = False
+
+    def hit(self, key: str, limit: int, window: int, consume: bool = True) -> Optional[Decision]:
+        """Decision, o None si hay que decidir localmente."""
+        if self._disabled:
+            return None
+        try:
+            resp = self._sb.rpc("rate_limit_hit", {
+                "p_key": key, "p_limit": limit, "p_window": window, "p_consume": consume,
+            }).execute()
+        except Exception as e:
+            metrics.incr("ratelimit.backend_error")
+            if is_missing_function(e):
+                logger.warning("rate_limit_hit no existe (¿falta migración 014?); límites locales")
+                self._disabled = True
+            elif "42501" in str(e):
+                # permission denied: el cliente no es service role
+                logger.warning("Sin permiso para rate_limit_hit (¿falta SUPABASE_SERVICE_KEY?); límites locales")
+                self._disabled = True
+            else:
+                logger.error("Rate limit compartido no disponible: %s", e)
+            return None
+        data = resp.data or {}
+        return Decision(bool(data.get("allowed", True)), int(data.get("retry_after") or 0))
+
+
+_backend: Optional[SupabaseBackend] = None
+_trusted_proxies = 1
+
+
+def client_ip(req) -> str:
+    """IP del cliente según el último proxy de confianza: de
+    X-Forwarded-For sólo valen los saltos que agregaron nuestros proxies
+    (los de la derecha); lo de la izquierda lo puede inventar el cliente."""
+    hops = [h.strip() for h in req.headers.get("X-Forwarded-For", "").split(",") if h.strip()]
+    if _trusted_proxies and len(hops) >= _trusted_proxies:
+        return hops[-_trusted_proxies]
+    return req.remote_addr or ""
+
+
+# ── Límites de la app ───────────────────────────────
+
+review_posts = SlidingWindow("reviews.post", limit=3, window=86400, shared=True)
+coupon_checks = SlidingWindow("coupons.validate", limit=20, window=600, shared=True)
+beacons = TokenBucket("analytics.beacon", rate=5.0, burst=100)
+
+
+def init_app(app) -> None:
+    global _backend, _trusted_proxies
+    cfg = app.config
+    _trusted_proxies = int(cfg.get("RATE_LIMIT_TRUSTED_PROXIES", 1))
+    review_posts.limit = int(cfg.get("RATE_LIMIT_REVIEWS_PER_DAY", 3))
+    coupon_checks.limit = int(cfg.get("RATE_LIMIT_COUPON_CHECKS", 20))
+    coupon_checks.window = int(cfg.get("RATE_LIMIT_COUPON_WINDOW", 600))
+    beacons.rate = float(cfg.get("RATE_LIMIT_BEACONS_PER_SEC", 5))
+    beacons.burst = int(cfg.get("RATE_LIMIT_BEACONS_BURST", 100))
+
+    backend = (cfg.get("RATE_LIMIT_BACKEND") or "memory").lower()
+    if backend not in ("memory", "supabase"):
+        logger.warning("RATE_LIMIT_BACKEND=%s desconocido; usando 'memory'", backend)
+    _backend = SupabaseBackend(clients.service) if backend == "supabase" else None
+
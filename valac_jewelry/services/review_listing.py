@@ -0,0 +1,139 @@
+# valac_jewelry/services/review_listing.py
+"""
+Listado público de reseñas verificadas (/api/reviews/).
+
+Cada página es una sola consulta:
+
+  • por número de página: select(..., count="exact") + range; PostgREST
+    devuelve filas y total en la misma respuesta (Content-Range), con los
+    mismos filtros en ambos
+  • por cursor (created_at, id): "cargar más" pide las reseñas anteriores
+    a la última mostrada, sin count; se trae una fila extra para saber si
+    hay más
+
+Las filas crudas se guardan en un TTLCache por (modo, filtros, página);
+ReviewsAdminView lo invalida al moderar. La serialización (fecha relativa)
+se hace en cada request.
+"""
+from __future__ import annotations
+
+import base64
+import binascii
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from .schema_errors import is_missing_column
+from .ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Sólo lo que expone _serialize_review (sin email, IP ni notas del admin)
+LIST_FIELDS = "id, created_at, nombre, producto, product_id, estrellas, texto, media_urls, media_thumbs, util_count, verificado"
+# Sin la migración 013 (media_thumbs) se listan sin miniaturas
+LEGACY_FIELDS = LIST_FIELDS.replace(" media_thumbs,", "")
+FEATURED_LIMIT = 6
+
+list_cache = TTLCache(ttl=60, maxsize=512)
+
+Row = Dict[str, Any]
+Cursor = Tuple[str, int]  # (created_at, id) de la última reseña mostrada
+
+
+@dataclass(frozen=True)
+class ReviewFilters:
+    product_id: Optional[int] = None
+    estrellas: Optional[int] = None
+    con_media: bool = False
+
+
+def encode_cursor(row: Row) -> str:
+    raw = f"{row['created_at']}|{row['id']}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(value: str) -> Cursor:
+    """ValueError si el cursor no es válido. created_at se vuelve a
+    serializar: va dentro del filtro or_ de PostgREST y no puede llevar
+    comas, comillas ni paréntesis del cliente."""
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)).decode()
+        created_at, review_id = raw.rsplit("|", 1)
+        created = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+        return created.isoformat(), int(review_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"cursor inválido: {value!r}") from e
+
+
+_fields = LIST_FIELDS
+
+
+def _execute(build):
+    """Ejecuta build(fields); si falta media_thumbs cae a LEGACY_FIELDS."""
+    global _fields
+    try:
+        return build(_fields).execute()
+    except Exception as e:
+        if _fields == LEGACY_FIELDS or not is_missing_column(e):
+            raise
+        logger.warning("reviews.media_thumbs no existe (¿falta migración 013?)")
+        _fields = LEGACY_FIELDS
+        return build(_fields).execute()
+
+
+def _query(sb, f: ReviewFilters, fields: str, count: Optional[str] = None):
+    q = sb.table("reviews").select(fields, count=count).eq("verificado", "true")
+    if f.product_id:
+        q = q.eq("product_id", f.product_id)
+    if f.estrellas and 1 <= f.estrellas <= 5:
+        q = q.eq("estrellas", f.estrellas)
+    if f.con_media:
+        q = q.neq("media_urls", "{}")
+    return q
+
+
+def fetch_featured(sb, f: ReviewFilters) -> List[Row]:
+    """Home: las mejor calificadas y más recientes, sin paginación."""
+    def load():
+        resp = _execute(lambda fields: (
+            _query(sb, f, fields).order("estrellas", desc=True).order("created_at", desc=True).limit(FEATURED_LIMIT)
+        ))
+        return resp.data or []
+    return list_cache.get_or_load(("featured", f), load)
+
+
+def fetch_page(sb, f: ReviewFilters, page: int, per_page: int) -> Tuple[List[Row], int]:
+    """(filas, total) de la página `page` en una sola consulta."""
+    offset = (page - 1) * per_page
+
+    def load():
+        resp = _execute(lambda fields: (
+            _query(sb, f, fields, count="exact")
+            .order("created_at", desc=True)
+            .order("id", desc=True)
+            .range(offset, offset + per_page - 1)
+        ))
+        return resp.data or [], resp.count or 0
+    return list_cache.get_or_load(("page", f, page, per_page), load)
+
+
+def fetch_after(sb, f: ReviewFilters, cursor: Cursor, per_page: int) -> Tuple[List[Row], bool]:
+    """(filas, hay_más) siguientes al cursor, sin contar."""
+    created_at, review_id = cursor
+
+    def load():
+        resp = _execute(lambda fields: (
+            _query(sb, f, fields)
+            .or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{review_id})')
+            .order("created_at", desc=True)
+            .order("id", desc=True)
+            .limit(per_page + 1)
+        ))
+        rows = resp.data or []
+        return rows[:per_page], len(rows) > per_page
+    return list_cache.get_or_load(("after", f, cursor, per_page), load)
+
+
+def invalidate_review_listing() -> None:
+    list_cache.invalidate()
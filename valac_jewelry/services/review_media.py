@@ -0,0 +1,328 @@
+# valac_jewelry/services/review_media.py
+"""
+Procesamiento en segundo plano de las fotos y videos de reseñas.
+
+POST /api/reviews/ ya no sube nada a Storage: valida, escribe los archivos
+tal cual a un directorio local (REVIEW_MEDIA_SPOOL), inserta la reseña con
+media_status = 'pending' y responde. Un thread de fondo toma cada reseña y:
+
+  • fotos: aplica la orientación EXIF, descarta EXIF/XMP (GPS, modelo del
+    teléfono) y genera dos WebP, display (≤1200 px) y miniatura (≤400 px)
+  • videos: con ffmpeg, transcodifica a MP4 H.264 ≤720p sin metadatos y
+    saca un póster WebP del primer segundo; sin ffmpeg sube el original y
+    la galería muestra el ícono de play como antes
+
+Sube las variantes con nombres deterministas (review_<id>_<n>_...) y
+actualiza media_urls (display / video) y media_thumbs (miniatura / póster)
+en un solo UPDATE (migración 013). Si algo falla se reintenta; los archivos
+siguen en el spool, y al arrancar el worker se retoman los que hayan
+quedado de un proceso anterior.
+"""
+from __future__ import annotations
+
+import atexit
+import io
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+from .metrics import metrics
+from .review_listing import invalidate_review_listing
+from .schema_errors import is_missing_column
+from .supabase_clients import clients
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - Pillow está en requirements.txt
+    Image = ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BUCKET = "CatalogoJoyasValacJoyas"
+STORAGE_PREFIX = "products/reviews"  # en el bucket; media_urls guarda "reviews/..."
+DISPLAY_MAX = 1200
+THUMB_MAX = 400
+WEBP_QUALITY = 80
+THUMB_QUALITY = 70
+VIDEO_MAX_HEIGHT = 720
+FFMPEG_TIMEOUT = 300
+MAX_ATTEMPTS = 3
+
+IMAGE_EXTENSIONS = {"jpg", "jpeg", "png", "webp"}
+MIME_MAP = {
+    "jpg": "image/jpeg", "jpeg": "image/jpeg",
+    "png": "image/png", "webp": "image/webp",
+    "mp4": "video/mp4", "mov": "video/quicktime",
+}
+
+_STOP = object()
+
+Variant = Tuple[str, bytes, str]  # (nombre, contenido, content-type)
+
+
+class MediaError(Exception):
+    """Un archivo que no se pudo decodificar; se omite de la reseña."""
+
+
+# ── Variantes ───────────────────────────────────────
+
+def _webp(img, max_side: int, quality: int) -> bytes:
+    out = img.copy()
+    if max(out.size) > max_side:
+        out.thumbnail((max_side, max_side), Image.LANCZOS)
+    buf = io.BytesIO()
+    out.save(buf, format="WEBP", quality=quality, method=6)
+    return buf.getvalue()
+
+
+def image_variants(data: bytes) -> Tuple[bytes, bytes]:
+    """(display, miniatura) en WebP, orientados y sin metadatos."""
+    try:
+        img = Image.open(io.BytesIO(data))
+        img = ImageOps.exif_transpose(img)
+    except Exception as e:
+        raise MediaError(f"imagen inválida: {e}") from e
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "PA") else "RGB")
+    # Sólo se conserva el perfil de color; EXIF y XMP no se copian
+    icc = img.info.get("icc_profile")
+    img.info = {"icc_profile": icc} if icc else {}
+    return _webp(img, DISPLAY_MAX, WEBP_QUALITY), _webp(img, THUMB_MAX, THUMB_QUALITY)
+
+
+def video_variants(ffmpeg: str, src: str) -> Tuple[bytes, Optional[bytes]]:
+    """(mp4, póster WebP o None) con ffmpeg."""
+    with tempfile.TemporaryDirectory(prefix="review-video-") as tmp:
+        out = os.path.join(tmp, "out.mp4")
+        cmd = [
+            ffmpeg, "-nostdin", "-loglevel", "error", "-y", "-i", src,
+            "-map_metadata", "-1", "-map", "0:v:0", "-map", "0:a:0?",
+            "-vf", f"scale=-2:'min({VIDEO_MAX_HEIGHT},ih)'",
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", "26", "-pix_fmt", "yuv420p",
+            "-c:a", "aac", "-b:a", "96k", "-movflags", "+faststart", out,
+        ]
+        proc = subprocess.run(cmd, capture_output=True, timeout=FFMPEG_TIMEOUT)
+        if proc.returncode != 0:
+            raise MediaError(f"ffmpeg: {proc.stderr.decode(errors='replace')[-300:]}")
+        with open(out, "rb") as fh:
+            video = fh.read()
+
+        frame = os.path.join(tmp, "poster.png")
+        cmd = [ffmpeg, "-nostdin", "-loglevel", "error", "-y", "-ss", "1", "-i", out,
+               "-frames:v", "1", frame]
+        poster = None
+        if subprocess.run(cmd, capture_output=True, timeout=60).returncode == 0 and os.path.exists(frame):
+            with open(frame, "rb") as fh:
+                png = fh.read()
+            poster = image_variants(png)[1] if Image is not None else None
+    return video, poster
+
+
+# ── Procesador ──────────────────────────────────────
+
+class ReviewMediaProcessor:
+    def __init__(self, maxsize: int = 200):
+        self.spool_dir: Optional[str] = None
+        self.ffmpeg: Optional[str] = None
+        self._queue: "queue.Queue" = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def init_app(self, app) -> None:
+        path = app.config.get("REVIEW_MEDIA_SPOOL") or "instance/review_media"
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(app.root_path), path)
+        self.spool_dir = path
+        self.ffmpeg = app.config.get("REVIEW_MEDIA_FFMPEG") or shutil.which("ffmpeg")
+        self._queue = queue.Queue(maxsize=int(app.config.get("REVIEW_MEDIA_QUEUE_SIZE", 200)))
+        if Image is None:
+            logger.warning("Pillow no disponible; las fotos de reseñas se subirán sin optimizar")
+        if not self.ffmpeg:
+            logger.info("ffmpeg no encontrado; los videos de reseñas se suben sin transcodificar")
+        atexit.register(self.shutdown)
+
+    # ── Request ──────────────────────────────────────
+
+    def spool(self, files: List[Tuple[str, bytes]]) -> str:
+        """Escribe [(ext, contenido)] a un directorio temporal del spool y
+        devuelve su token para submit()/discard()."""
+        token = f"incoming-{uuid.uuid4().hex}"
+        folder = os.path.join(self.spool_dir, token)
+        os.makedirs(folder)
+        for idx, (ext, content) in enumerate(files):
+            with open(os.path.join(folder, f"{idx:02d}.{ext}"), "wb") as fh:
+                fh.write(content)
+        return token
+
+    def submit(self, token: str, review_id: int) -> None:
+        """Asocia el spool a la reseña ya insertada y la encola."""
+        os.rename(os.path.join(self.spool_dir, token), os.path.join(self.spool_dir, str(review_id)))
+        self._ensure_worker()
+        # Si la cola está llena queda en disco y la retoma el siguiente arranque
+        self._requeue(review_id, 1)
+        metrics.incr("reviews.media.queued")
+
+    def discard(self, token: str) -> None:
+        shutil.rmtree(os.path.join(self.spool_dir, token), ignore_errors=True)
+
+    def mark_failed(self, review_id: int) -> None:
+        """La reseña ya existe pero su media no se pudo encolar."""
+        self._set_status(review_id, "failed")
+
+    # ── Worker ───────────────────────────────────────
+
+    def _ensure_worker(self) -> None:
+        # El pid cubre el caso de un fork después de arrancar el thread
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="review-media", daemon=True)
+            self._thread.start()
+
+    def _leftovers(self) -> List[int]:
+        """Reseñas con archivos en el spool; borra los `incoming-` de
+        requests que murieron antes de insertar la reseña."""
+        try:
+            names = os.listdir(self.spool_dir)
+        except FileNotFoundError:
+            return []
+        stale = time.time() - 3600
+        for name in names:
+            path = os.path.join(self.spool_dir, name)
+            if name.startswith("incoming-") and os.path.getmtime(path) < stale:
+                shutil.rmtree(path, ignore_errors=True)
+        return sorted(int(n) for n in names if n.isdigit())
+
+    def _run(self) -> None:
+        for review_id in self._leftovers():
+            logger.info("Retomando media pendiente de la reseña %s", review_id)
+            if not self._requeue(review_id, 1):
+                break
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            review_id, attempt = item
+            try:
+                self.process(review_id)
+            except Exception as e:
+                metrics.incr("reviews.media.failed")
+                if attempt < MAX_ATTEMPTS:
+                    logger.warning("Media de reseña %s falló (intento %d): %s", review_id, attempt, e)
+                    time.sleep(2 ** attempt)
+                    self._requeue(review_id, attempt + 1)
+                else:
+                    logger.error("Media de reseña %s sin procesar tras %d intentos: %s",
+                                 review_id, attempt, e)
+                    self._set_status(review_id, "failed")
+
+    def _requeue(self, review_id: int, attempt: int) -> bool:
+        # Nunca bloquear: el worker es el único que consume la cola
+        try:
+            self._queue.put_nowait((review_id, attempt))
+            return True
+        except queue.Full:
+            logger.warning("Cola de media llena; reseña %s queda en el spool", review_id)
+            return False
+
+    def process(self, review_id: int) -> None:
+        folder = os.path.join(self.spool_dir, str(review_id))
+        if not os.path.isdir(folder):
+            return
+        with metrics.timer("reviews.media.process"):
+            uploads: List[Variant] = []
+            urls: List[str] = []
+            thumbs: List[str] = []
+            for idx, name in enumerate(sorted(os.listdir(folder))):
+                ext = name.rsplit(".", 1)[-1].lower()
+                try:
+                    variants = self._variants(os.path.join(folder, name), ext)
+                except MediaError as e:
+                    logger.warning("Reseña %s: se omite %s (%s)", review_id, name, e)
+                    continue
+                base = f"review_{review_id}_{idx}"
+                (main_ext, main, main_mime), thumb = variants
+                urls.append(f"reviews/{base}.{main_ext}")
+                uploads.append((f"{base}.{main_ext}", main, main_mime))
+                if thumb is None:
+                    thumbs.append("")
+                else:
+                    thumbs.append(f"reviews/{base}_thumb.webp")
+                    uploads.append((f"{base}_thumb.webp", thumb, "image/webp"))
+
+            # Service role para Storage (x-upsert en reintentos necesita
+            # permiso de update) y para el UPDATE de reviews
+            sb = clients.service
+            bucket = sb.storage.from_(STORAGE_BUCKET)
+            for name, content, mime in uploads:
+                bucket.upload(f"{STORAGE_PREFIX}/{name}", content,
+                              {"content-type": mime, "x-upsert": "true"})
+
+            fields = {"media_urls": urls, "media_thumbs": thumbs, "media_status": "ready"}
+            try:
+                resp = sb.table("reviews").update(fields).eq("id", review_id).execute()
+            except Exception as e:
+                if not is_missing_column(e):
+                    raise
+                logger.warning("reviews sin media_thumbs/media_status (¿falta migración 013?)")
+                resp = sb.table("reviews").update({"media_urls": urls}).eq("id", review_id).execute()
+            if not resp.data:
+                # La reseña se eliminó mientras se procesaba
+                bucket.remove([f"{STORAGE_PREFIX}/{name}" for name, _, _ in uploads])
+
+        shutil.rmtree(folder, ignore_errors=True)
+        invalidate_review_listing()
+        metrics.incr("reviews.media.processed", len(urls))
+
+    def _variants(self, path: str, ext: str) -> Tuple[Variant, Optional[bytes]]:
+        """((ext, contenido, mime) principal, miniatura o None)."""
+        if ext in IMAGE_EXTENSIONS:
+            with open(path, "rb") as fh:
+                data = fh.read()
+            if Image is None:
+                return (ext, data, MIME_MAP[ext]), None
+            display, thumb = image_variants(data)
+            return ("webp", display, "image/webp"), thumb
+        if self.ffmpeg:
+            try:
+                video, poster = video_variants(self.ffmpeg, path)
+                return ("mp4", video, "video/mp4"), poster
+            except (MediaError, subprocess.TimeoutExpired) as e:
+                # El navegador quizá sí lo reproduzca: se sube el original
+                logger.warning("No se pudo transcodificar %s: %s", path, e)
+        with open(path, "rb") as fh:
+            return (ext, fh.read(), MIME_MAP.get(ext, "application/octet-stream")), None
+
+    def _set_status(self, review_id: int, status: str) -> None:
+        try:
+            clients.service.table("reviews").update({"media_status": status}).eq("id", review_id).execute()
+        except Exception as e:
+            logger.error("No se pudo marcar media_status=%s en reseña %s: %s", status, review_id, e)
+
+    # ── Apagado ──────────────────────────────────────
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """Detiene el worker (atexit). Lo que no alcance a procesarse sigue
+        en el spool para el próximo arranque."""
+        thread = self._thread
+        if thread is None or not thread.is_alive() or self._pid != os.getpid():
+            return
+        try:
+            self._queue.put_nowait(_STOP)
+        except queue.Full:
+            return
+        thread.join(timeout)
+
+
+media = ReviewMediaProcessor()
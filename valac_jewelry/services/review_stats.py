@@ -0,0 +1,85 @@
+# valac_jewelry/services/review_stats.py
+"""
+Estadísticas públicas de reseñas (/api/reviews/stats).
+
+La tabla review_stats (migración 011) guarda por producto, y en la fila
+product_id = 0 para todo el sitio, el total de reseñas verificadas, la
+suma de estrellas y el histograma 1–5. Un trigger sobre reviews la ajusta
+con deltas al aprobar, rechazar o eliminar, así que aquí basta leer una
+fila por llave primaria.
+
+El resultado se guarda en un TTLCache que ReviewsAdminView invalida al
+moderar. Sin la migración se calcula como antes, bajando las estrellas.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict, Optional
+
+from .schema_errors import is_missing_table
+from .ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_KEY = 0
+STATS_FIELDS = "total, suma, s1, s2, s3, s4, s5"
+
+stats_cache = TTLCache(ttl=300, maxsize=1024)
+
+
+def _empty() -> Dict[str, Any]:
+    return {"total": 0, "promedio": 0, "distribucion": {str(i): 0 for i in range(1, 6)}}
+
+
+def _from_row(row: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if not row or not row.get("total"):
+        return _empty()
+    total = int(row["total"])
+    return {
+        "total": total,
+        "promedio": round(int(row["suma"]) / total, 1),
+        "distribucion": {str(i): int(row.get(f"s{i}") or 0) for i in range(1, 6)},
+    }
+
+
+def _scan(sb, product_id: Optional[int]) -> Dict[str, Any]:
+    """Cálculo sin migración: baja las estrellas verificadas."""
+    q = sb.table("reviews").select("estrellas").eq("verificado", "true")
+    if product_id:
+        q = q.eq("product_id", product_id)
+    rows = q.execute().data or []
+    if not rows:
+        return _empty()
+    hist = {i: 0 for i in range(1, 6)}
+    for r in rows:
+        hist[r["estrellas"]] = hist.get(r["estrellas"], 0) + 1
+    row = {"total": len(rows), "suma": sum(r["estrellas"] for r in rows)}
+    row.update({f"s{i}": hist[i] for i in range(1, 6)})
+    return _from_row(row)
+
+
+def _load(sb, product_id: Optional[int]) -> Dict[str, Any]:
+    try:
+        resp = (
+            sb.table("review_stats")
+            .select(STATS_FIELDS)
+            .eq("product_id", product_id or GLOBAL_KEY)
+            .limit(1)
+            .execute()
+        )
+    except Exception as e:
+        if not is_missing_table(e):
+            raise
+        logger.warning("review_stats no existe (¿falta migración 011?); calculando desde reviews")
+        return _scan(sb, product_id)
+    return _from_row(resp.data[0] if resp.data else None)
+
+
+def get_review_stats(sb, product_id: Optional[int] = None) -> Dict[str, Any]:
+    """{'total', 'promedio', 'distribucion': {'1'..'5'}} del producto o global."""
+    key = product_id or GLOBAL_KEY
+    return stats_cache.get_or_load(key, lambda: _load(sb, product_id))
+
+
+def invalidate_review_stats() -> None:
+    stats_cache.invalidate()
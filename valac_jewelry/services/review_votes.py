@@ -0,0 +1,165 @@
+# valac_jewelry/services/review_votes.py
+"""
+Votos "útil" de reseñas (/api/reviews/<id>/util) sin leer-y-escribir por voto.
+
+Cada voto suma 1 a un contador en memoria por reseña; un thread de fondo
+manda los acumulados cada REVIEW_VOTES_FLUSH_MS con la RPC
+increment_review_util (migración 012), que hace
+`util_count = util_count + n` en un solo UPDATE. Así dos votos simultáneos
+no se pisan y un pico sobre una reseña popular es una escritura por flush.
+
+El util_count que ve el usuario es el último conocido de la DB más lo
+pendiente. La existencia de la reseña se consulta una vez y se recuerda un
+rato. El dedup por IP vive en un TTLSet acotado (además del de sesión de la
+ruta). Si un flush falla, los votos vuelven a la cola y se reintentan.
+La RPC sólo la ejecuta el service role y acepta hasta MAX_DELTA votos por
+reseña en cada llamada; lo que pase de ahí queda para el siguiente flush.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+from .metrics import metrics
+from .supabase_clients import clients
+from .ttl_cache import TTLCache, TTLSet
+
+logger = logging.getLogger(__name__)
+
+_NOT_FOUND = -1
+MAX_DELTA = 1000  # tope por reseña de increment_review_util (migración 012)
+
+
+class ReviewNotFound(LookupError):
+    pass
+
+
+class DuplicateVote(Exception):
+    pass
+
+
+class VoteBuffer:
+    def __init__(self, flush_ms: int = 2000, dedup_ttl: int = 86400, dedup_size: int = 100_000):
+        self.flush_interval = flush_ms / 1000
+        self._lock = threading.Lock()
+        self._pending: Dict[int, int] = {}
+        self._inflight: Dict[int, int] = {}
+        self._known = TTLCache(ttl=300, maxsize=4096)  # review_id → util_count en DB
+        self._voters = TTLSet(ttl=dedup_ttl, maxsize=dedup_size)
+        self._wake = threading.Event()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._sb = None
+
+    def init_app(self, app) -> None:
+        self.flush_interval = int(app.config.get("REVIEW_VOTES_FLUSH_MS", 2000)) / 1000
+        self._voters = TTLSet(
+            ttl=int(app.config.get("REVIEW_VOTES_DEDUP_TTL", 86400)),
+            maxsize=int(app.config.get("REVIEW_VOTES_DEDUP_SIZE", 100_000)),
+        )
+        self._sb = clients.service
+        atexit.register(self.shutdown)
+
+    # ── Votar (threads de request) ───────────────────
+
+    def vote(self, review_id: int, voter: str) -> int:
+        """Registra un voto y devuelve el util_count a mostrar.
+
+        ReviewNotFound si la reseña no existe o no está verificada;
+        DuplicateVote si `voter` ya votó esta reseña dentro del TTL."""
+        base = self._known.get_or_load(review_id, lambda: self._load_count(review_id))
+        if base == _NOT_FOUND:
+            raise ReviewNotFound(review_id)
+        if not self._voters.add((voter, review_id)):
+            metrics.incr("reviews.votes.duplicate")
+            raise DuplicateVote(review_id)
+
+        self._ensure_worker()
+        with self._lock:
+            self._pending[review_id] = self._pending.get(review_id, 0) + 1
+            shown = self._shown(review_id)
+        metrics.incr("reviews.votes")
+        return shown
+
+    def _load_count(self, review_id: int) -> int:
+        resp = (
+            self._sb.table("reviews")
+            .select("util_count")
+            .eq("id", review_id)
+            .eq("verificado", "true")
+            .execute()
+        )
+        if not resp.data:
+            return _NOT_FOUND
+        return resp.data[0].get("util_count") or 0
+
+    def _shown(self, review_id: int) -> int:
+        base = self._known.get(review_id)
+        if base is None or base == _NOT_FOUND:
+            base = 0
+        return base + self._inflight.get(review_id, 0) + self._pending.get(review_id, 0)
+
+    # ── Worker ───────────────────────────────────────
+
+    def _ensure_worker(self) -> None:
+        # El pid cubre el caso de un fork después de arrancar el thread
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="review-votes", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._pending or self._inflight or self._sb is None:
+                return
+            batch = {rid: min(n, MAX_DELTA) for rid, n in self._pending.items()}
+            self._pending = {rid: n - batch[rid] for rid, n in self._pending.items() if n > MAX_DELTA}
+            self._inflight = dict(batch)
+
+        try:
+            resp = self._sb.rpc("increment_review_util", {
+                "p_deltas": {str(rid): n for rid, n in batch.items()},
+            }).execute()
+        except Exception as e:
+            with self._lock:
+                for rid, n in batch.items():
+                    self._pending[rid] = self._pending.get(rid, 0) + n
+                self._inflight = {}
+            metrics.incr("reviews.votes.flush_failed")
+            logger.error("Votos útil: no se pudieron aplicar %d votos: %s", sum(batch.values()), e)
+            return
+
+        with self._lock:
+            for row in resp.data or []:
+                self._known.set(int(row["id"]), row.get("util_count") or 0)
+            self._inflight = {}
+        metrics.incr("reviews.votes.flushed", sum(batch.values()))
+
+    # ── Apagado ──────────────────────────────────────
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Aplica lo pendiente y detiene el worker (atexit)."""
+        thread = self._thread
+        if thread is None or not thread.is_alive() or self._pid != os.getpid():
+            return
+        self._stop = True
+        self._wake.set()
+        thread.join(timeout)
+        self.flush()
+
+
+votes = VoteBuffer()
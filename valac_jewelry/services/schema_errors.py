@@ -0,0 +1,27 @@
+# valac_jewelry/services/schema_errors.py
+"""
+Errores de PostgREST que indican que falta una migración (migrations/).
+
+Los servicios que dependen de una tabla, columna o función nueva la usan
+si existe y, si no, caen al camino anterior con un warning. PostgREST
+reenvía el código de Postgres o el suyo propio en el texto del error.
+"""
+from __future__ import annotations
+
+
+def is_missing_function(err: Exception) -> bool:
+    # PGRST202: la RPC no existe en el schema cache; 42883: función indefinida
+    text = str(err)
+    return "PGRST202" in text or "42883" in text
+
+
+def is_missing_table(err: Exception) -> bool:
+    # 42P01: relación inexistente; PGRST205: tabla fuera del schema cache
+    text = str(err)
+    return "42P01" in text or "PGRST205" in text
+
+
+def is_missing_column(err: Exception) -> bool:
+    # 42703: columna inexistente (PGRST204 si PostgREST no la tiene en cache)
+    text = str(err)
+    return "42703" in text or "PGRST204" in text
@@ -0,0 +1,187 @@
+# valac_jewelry/services/sessionizer.py
+"""
+Sesionización de user_navigation para el funnel por visitante.
+
+Los eventos llegan en orden de timestamp (iter_rows de analytics_rollups).
+Cada session_id abre una sesión que se cierra tras SESSION_GAP sin
+actividad o al pasar MAX_SESSION de duración. Sólo las sesiones abiertas
+viven en memoria: un OrderedDict por última actividad, que se vacía por
+el frente a medida que avanza el tiempo. Si hay más de `max_active`
+abiertas a la vez se cierran las más viejas (se cuentan en `evicted`).
+
+Por sesión se guarda la primera vez que alcanzó cada etapa del funnel
+(FUNNEL_STAGES) y si pasó de la etapa i-1 a la i en ese orden, el momento
+de la primera compra (click en comprar o WhatsApp), qué productos vio y
+en cuáles de esos hizo click de compra. Al cerrarse, la sesión se suma a
+DayStats del día (UTC) en que empezó.
+"""
+from __future__ import annotations
+
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set
+
+from .path_classifier import FUNNEL_STAGES, PathClassifier, analytics_classifier
+
+SESSION_GAP = timedelta(minutes=30)
+MAX_SESSION = timedelta(hours=4)
+
+# Límites superiores (segundos) del histograma de tiempo a compra; el
+# último bucket recoge lo que pase del último límite
+TTP_BUCKETS = (60, 300, 900, 1800, 3600, 4 * 3600)
+TTP_LABELS = ("< 1 min", "1–5 min", "5–15 min", "15–30 min", "30–60 min", "1–4 h", "4 h+")
+
+CONVERSION_TAGS = frozenset({"buy_click", "wa_click"})
+_MAX_PRODUCTS_PER_SESSION = 50
+
+
+@dataclass
+class _Session:
+    start: datetime
+    last: datetime
+    reached: List[Optional[datetime]]   # primera vez en cada etapa
+    stepped: List[bool]                 # llegó a la etapa i después de la i-1
+    purchase_at: Optional[datetime] = None
+    viewed: Set[int] = field(default_factory=set)
+    converted: Set[int] = field(default_factory=set)
+
+
+@dataclass
+class DayStats:
+    sessions: int = 0
+    converted: int = 0
+    ttp_sum: float = 0.0
+    ttp_hist: List[int] = field(default_factory=lambda: [0] * (len(TTP_BUCKETS) + 1))
+    stage_sessions: List[int] = field(default_factory=lambda: [0] * len(FUNNEL_STAGES))
+    step_sessions: List[int] = field(default_factory=lambda: [0] * len(FUNNEL_STAGES))
+    product_viewed: Counter = field(default_factory=Counter)
+    product_converted: Counter = field(default_factory=Counter)
+
+    def add(self, s: _Session) -> None:
+        self.sessions += 1
+        for i, t in enumerate(s.reached):
+            if t is not None:
+                self.stage_sessions[i] += 1
+            if s.stepped[i]:
+                self.step_sessions[i] += 1
+        if s.purchase_at is not None:
+            self.converted += 1
+            seconds = (s.purchase_at - s.start).total_seconds()
+            self.ttp_sum += seconds
+            self.ttp_hist[_bucket(seconds)] += 1
+        for pid in s.viewed:
+            self.product_viewed[pid] += 1
+        for pid in s.converted:
+            self.product_converted[pid] += 1
+
+
+def _bucket(seconds: float) -> int:
+    for i, limit in enumerate(TTP_BUCKETS):
+        if seconds < limit:
+            return i
+    return len(TTP_BUCKETS)
+
+
+class Sessionizer:
+    def __init__(
+        self,
+        on_close: Callable[[_Session], None],
+        classifier: PathClassifier = analytics_classifier,
+        gap: timedelta = SESSION_GAP,
+        max_session: timedelta = MAX_SESSION,
+        max_active: int = 50000,
+    ):
+        self.on_close = on_close
+        self.classify = classifier.classify
+        self.gap = gap
+        self.max_session = max_session
+        self.max_active = max_active
+        self._stage_index = {stage["name"]: i for i, stage in enumerate(FUNNEL_STAGES)}
+        self._active: "OrderedDict[str, _Session]" = OrderedDict()
+        self.events = 0
+        self.skipped = 0
+        self.evicted = 0
+
+    def feed(self, session_id: Optional[str], ts: datetime, path: str) -> None:
+        """Un evento; `ts` no debe retroceder respecto al anterior."""
+        if not session_id or not path:
+            self.skipped += 1
+            return
+        self.events += 1
+        self._expire(ts)
+
+        s = self._active.get(session_id)
+        if s is not None and ts - s.start > self.max_session:
+            self._close(session_id)
+            s = None
+        if s is None:
+            n = len(FUNNEL_STAGES)
+            s = _Session(start=ts, last=ts, reached=[None] * n, stepped=[False] * n)
+            self._active[session_id] = s
+            if len(self._active) > self.max_active:
+                self.evicted += 1
+                self._close(next(iter(self._active)))
+        else:
+            s.last = ts
+            self._active.move_to_end(session_id)
+
+        for tag, value in self.classify(path):
+            i = self._stage_index.get(tag)
+            if i is not None:
+                if s.reached[i] is None:
+                    s.reached[i] = ts
+                if i == 0 or s.reached[i - 1] is not None:
+                    s.stepped[i] = True
+            if tag in CONVERSION_TAGS and s.purchase_at is None:
+                s.purchase_at = ts
+            if value is not None:
+                if tag == "product_view" and len(s.viewed) < _MAX_PRODUCTS_PER_SESSION:
+                    s.viewed.add(value)
+                elif tag in ("buy_click", "wa_product") and value in s.viewed:
+                    s.converted.add(value)
+
+    def flush(self) -> None:
+        """Cierra todas las sesiones abiertas (fin del stream)."""
+        while self._active:
+            self._close(next(iter(self._active)))
+
+    @property
+    def active(self) -> int:
+        return len(self._active)
+
+    def _expire(self, now: datetime) -> None:
+        cutoff = now - self.gap
+        active = self._active
+        while active:
+            sid, s = next(iter(active.items()))
+            if s.last >= cutoff:
+                return
+            self._close(sid)
+
+    def _close(self, session_id: str) -> None:
+        self.on_close(self._active.pop(session_id))
+
+
+def sessionize_days(events, day_from: date, day_to: date, **kwargs) -> Dict[date, DayStats]:
+    """Agrega por día de inicio las sesiones que empiezan en [day_from, day_to].
+
+    `events` da (session_id, datetime, path) en orden de tiempo y debe
+    empezar al menos SESSION_GAP antes de day_from (para reconocer las
+    sesiones que vienen del día anterior) y seguir hasta MAX_SESSION
+    después de day_to."""
+    days: Dict[date, DayStats] = {}
+
+    def on_close(s: _Session) -> None:
+        day = s.start.date()
+        if day_from <= day <= day_to:
+            stats = days.get(day)
+            if stats is None:
+                stats = days[day] = DayStats()
+            stats.add(s)
+
+    engine = Sessionizer(on_close, **kwargs)
+    for session_id, ts, path in events:
+        engine.feed(session_id, ts, path)
+    engine.flush()
+    return days
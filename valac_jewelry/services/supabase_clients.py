@@ -0,0 +1,107 @@
+# valac_jewelry/services/supabase_clients.py
+"""
+Registro único de clientes Supabase del proceso.
+
+Cada cliente de supabase-py abre su propio pool HTTP (httpx, keep-alive).
+Antes checkout, mercadopago_checkout y el admin creaban el suyo además de
+`app.supabase`; ahora todos piden el cliente aquí:
+
+    clients.anon     → SUPABASE_KEY (el mismo objeto que app.supabase)
+    clients.service  → SUPABASE_SERVICE_KEY (cae en anon con warning)
+
+Los clientes se crean una vez en create_app() y se comparten entre los
+threads de gunicorn; httpx.Client es thread-safe. Sus pools HTTP usan el
+transporte acotado e instrumentado de services/supabase_transport.py.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from typing import Dict, Optional
+
+from supabase import Client, create_client
+from supabase.lib.client_options import ClientOptions
+
+from .supabase_transport import TransportSettings, install
+
+logger = logging.getLogger(__name__)
+
+
+class SupabaseClients:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: Dict[str, Client] = {}
+        self._url: Optional[str] = None
+        self._keys: Dict[str, Optional[str]] = {}
+        self._settings = TransportSettings()
+
+    def init_app(self, app) -> None:
+        self.configure(
+            app.config.get("SUPABASE_URL"),
+            app.config.get("SUPABASE_KEY"),
+            app.config.get("SUPABASE_SERVICE_KEY"),
+            TransportSettings.from_config(app.config),
+        )
+        app.extensions["supabase_clients"] = self
+        app.supabase = self.anon
+
+    def configure(self, url: Optional[str], anon_key: Optional[str], service_key: Optional[str] = None,
+                  settings: Optional[TransportSettings] = None) -> None:
+        """Lo que hace init_app sin una app de Flask (scripts/)."""
+        self._url = url
+        self._keys = {"anon": anon_key, "service": service_key}
+        self._settings = settings or TransportSettings()
+        self._clients = {}
+
+    # ── Acceso ───────────────────────────────────────
+
+    @property
+    def anon(self) -> Client:
+        return self._get("anon")
+
+    @property
+    def service(self) -> Client:
+        """Cliente con service role (Storage admin). Sin SUPABASE_SERVICE_KEY
+        devuelve el anon, igual que hacía SupabaseProductAdmin."""
+        if not self._keys.get("service"):
+            logger.warning("SUPABASE_SERVICE_KEY no configurado; usando anon key (no recomendado).")
+            return self.anon
+        return self._get("service")
+
+    # ── Internos ─────────────────────────────────────
+
+    def _get(self, role: str) -> Client:
+        client = self._clients.get(role)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(role)
+            if client is None:
+                client = self._create(self._keys.get(role))
+                self._clients[role] = client
+            return client
+
+    def _create(self, key: Optional[str]) -> Client:
+        if not self._url or not key:
+            raise RuntimeError("Config de Supabase incompleta (SUPABASE_URL / SUPABASE_KEY).")
+        client = create_client(self._url, key, options=ClientOptions(
+            postgrest_client_timeout=self._settings.read_timeout,
+            storage_client_timeout=int(self._settings.read_timeout),
+        ))
+        # supabase-py crea los sub-clientes de forma perezosa; se fuerzan
+        # aquí para que dos threads no armen cada uno su propio pool.
+        install(client.postgrest.session, "rest", self._settings)
+        storage = client.storage
+        install(getattr(storage, "session", None) or getattr(storage, "_client", None), "storage", self._settings)
+        return client
+
+
+clients = SupabaseClients()
+
+
+def get_anon_client() -> Client:
+    return clients.anon
+
+
+def get_service_client() -> Client:
+    return clients.service
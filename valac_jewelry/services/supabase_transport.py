@@ -0,0 +1,163 @@
+# valac_jewelry/services/supabase_transport.py
+"""
+Transporte HTTP de los clientes Supabase (PostgREST y Storage).
+
+supabase-py arma sus httpx.Client con los defaults de httpx. Aquí se les
+instala un transporte propio con:
+
+  • pool acotado (SUPABASE_POOL_SIZE conexiones, keep-alive configurable)
+  • timeouts explícitos de connect / read / write / espera de pool
+  • reintento con backoff exponencial + jitter sólo en lecturas (GET/HEAD)
+    ante errores de conexión o 429/502/503/504
+  • métricas en services.metrics: latencia por servicio, espera de pool,
+    reintentos y errores
+
+La espera de pool se mide con los eventos de trace de httpcore: el tiempo
+entre que el request entra al pool y el primer evento de conexión/envío.
+"""
+from __future__ import annotations
+
+import importlib.util
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+RETRY_STATUS = frozenset({429, 502, 503, 504})
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.RemoteProtocolError)
+
+# Primer evento de trace de httpcore una vez que el request ya tiene conexión
+_ACQUIRED_EVENTS = (
+    "connection.connect_tcp.started",
+    "http11.send_request_headers.started",
+    "http2.send_request_headers.started",
+)
+
+
+@dataclass
+class TransportSettings:
+    pool_size: int = 10
+    keepalive: int = 10
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+    write_timeout: float = 30.0
+    pool_timeout: float = 5.0
+    read_retries: int = 2
+    backoff: float = 0.1  # segundos; se duplica por intento (con jitter)
+    http2: bool = True
+
+    @classmethod
+    def from_config(cls, config) -> "TransportSettings":
+        pool = int(config.get("SUPABASE_POOL_SIZE") or cls.pool_size)
+        return cls(
+            pool_size=pool,
+            keepalive=int(config.get("SUPABASE_POOL_KEEPALIVE") or pool),
+            connect_timeout=float(config.get("SUPABASE_CONNECT_TIMEOUT") or cls.connect_timeout),
+            read_timeout=float(config.get("SUPABASE_TIMEOUT") or cls.read_timeout),
+            write_timeout=float(config.get("SUPABASE_TIMEOUT") or cls.write_timeout),
+            pool_timeout=float(config.get("SUPABASE_POOL_TIMEOUT") or cls.pool_timeout),
+            read_retries=int(config.get("SUPABASE_READ_RETRIES", cls.read_retries)),
+            http2=bool(config.get("SUPABASE_HTTP2", cls.http2)),
+        )
+
+    @property
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout,
+        )
+
+
+class InstrumentedTransport(httpx.BaseTransport):
+    def __init__(self, name: str, settings: TransportSettings):
+        self.name = name
+        self.settings = settings
+        self._inner = httpx.HTTPTransport(
+            # HTTP/2 necesita el paquete h2 (supabase-py lo usa si está)
+            http2=settings.http2 and importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(
+                max_connections=settings.pool_size,
+                max_keepalive_connections=settings.keepalive,
+                keepalive_expiry=settings.keepalive_expiry,
+            ),
+        )
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        retries = self.settings.read_retries if request.method in IDEMPOTENT_METHODS else 0
+        user_trace = request.extensions.get("trace")
+        attempt = 0
+        while True:
+            try:
+                response = self._send(request, user_trace)
+            except RETRY_ERRORS as e:
+                if attempt >= retries:
+                    metrics.incr(f"supabase.{self.name}.errors")
+                    raise
+                logger.warning("Supabase %s %s falló (%s); reintento %d", request.method, request.url.path, e, attempt + 1)
+            else:
+                if response.status_code not in RETRY_STATUS or attempt >= retries:
+                    if response.status_code >= 500:
+                        metrics.incr(f"supabase.{self.name}.errors")
+                    return response
+                response.close()
+                logger.warning("Supabase %s %s → %s; reintento %d",
+                               request.method, request.url.path, response.status_code, attempt + 1)
+            attempt += 1
+            metrics.incr(f"supabase.{self.name}.retries")
+            # Full jitter: espera aleatoria entre 0 y backoff·2^intento
+            time.sleep(random.uniform(0, self.settings.backoff * (2 ** attempt)))
+
+    def _send(self, request: httpx.Request, user_trace) -> httpx.Response:
+        """Un intento. La latencia es hasta recibir headers (el body se lee después)."""
+        start = time.perf_counter()
+        acquired: Optional[float] = None
+
+        def trace(event_name, info):
+            nonlocal acquired
+            if acquired is None and event_name in _ACQUIRED_EVENTS:
+                acquired = time.perf_counter()
+            if user_trace is not None:
+                user_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        try:
+            response = self._inner.handle_request(request)
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            metrics.observe(f"supabase.{self.name}", elapsed)
+            if acquired is not None:
+                metrics.observe(f"supabase.{self.name}.pool_wait", (acquired - start) * 1000)
+        return response
+
+    def close(self) -> None:
+        self._inner.close()
+
+
+def install(session: httpx.Client, name: str, settings: TransportSettings) -> bool:
+    """Reemplaza el transporte de un httpx.Client creado por supabase-py.
+
+    supabase-py (2.12) no acepta un transporte propio, así que se cambia el
+    atributo `_transport` del cliente ya construido. Si la versión instalada
+    no lo tiene, se deja el cliente como está y se loguea un warning."""
+    if not isinstance(session, httpx.Client) or not hasattr(session, "_transport"):
+        logger.warning("No se pudo instalar el transporte Supabase en %s (%r)", name, type(session))
+        return False
+    old = session._transport
+    session._transport = InstrumentedTransport(name, settings)
+    session.timeout = settings.timeout
+    try:
+        old.close()
+    except Exception:
+        pass
+    return True
@@ -0,0 +1,105 @@
+# valac_jewelry/services/ttl_cache.py
+"""
+Caché clave→valor con expiración, compartido entre los threads de gunicorn.
+
+Pensado para lecturas pequeñas y frecuentes de Supabase (settings, stats)
+que las vistas admin invalidan explícitamente al escribir.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, ttl: float = 60.0, maxsize: int = 256):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: Dict[Hashable, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key not in self._data and len(self._data) >= self.maxsize:
+                self._evict()
+            self._data[key] = (expires, value)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Devuelve el valor cacheado o lo calcula con `loader()` y lo guarda.
+        Si `loader` lanza excepción no se cachea nada."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key: Hashable = _MISSING) -> None:
+        """Borra una clave, o todo el caché si no se indica ninguna."""
+        with self._lock:
+            if key is _MISSING:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def _evict(self) -> None:
+        # Primero las expiradas; si no hay, la que vence antes
+        now = time.monotonic()
+        expired = [k for k, (exp, _) in self._data.items() if exp <= now]
+        for k in expired:
+            del self._data[k]
+        if not expired and self._data:
+            oldest = min(self._data, key=lambda k: self._data[k][0])
+            del self._data[oldest]
+
+
+class TTLSet:
+    """Conjunto acotado de claves que caducan tras `ttl` segundos.
+
+    Como el TTL es fijo, el orden de inserción es el orden de vencimiento:
+    las vencidas (o las más viejas, si se llena) salen por el frente en
+    O(1), sin recorrer el conjunto como TTLCache._evict."""
+
+    def __init__(self, ttl: float, maxsize: int = 100_000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, key: Hashable) -> bool:
+        """Agrega `key`; False si ya estaba (y no había vencido)."""
+        now = time.monotonic()
+        with self._lock:
+            data = self._data
+            expires = data.get(key)
+            if expires is not None and expires > now:
+                return False
+            data.pop(key, None)
+            while data:
+                oldest_key, oldest_expires = next(iter(data.items()))
+                if oldest_expires > now and len(data) < self.maxsize:
+                    break
+                del data[oldest_key]
+            data[key] = now + self.ttl
+            return True
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __contains__(self, key: Hashable) -> bool:
+        expires = self._data.get(key)
+        return expires is not None and expires > time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._data)